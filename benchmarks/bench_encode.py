@@ -0,0 +1,87 @@
+"""帧编码基准测试 / Frame encode profile benchmark
+
+用 ffmpeg 的 testsrc2 生成一段合成视频，按每种编码方式（ENCODE_PROFILES）分别用 Pillow 和 ffmpeg 写出全部帧，
+再用 Pillow 读回，输出写入/读取的 frames/sec 和占用空间，便于选择中间帧与最终帧的编码方式。
+Generates a synthetic clip with ffmpeg's testsrc2, writes every frame once per encode profile with Pillow and with
+ffmpeg, reads the frames back with Pillow, and reports write/read frames/sec and size on disk for each profile.
+
+用法 / Usage:
+    python benchmarks/bench_encode.py --frames 120 --size 640x360
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from pipeline import ENCODE_PROFILES, dir_size, iter_video_frames, list_frames, save_frame
+
+
+def make_clip(path, w, h, frames):
+    """用 testsrc2 生成一段 frames 帧的合成视频"""
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', f'testsrc2=size={w}x{h}:rate=30',
+                    '-frames:v', str(frames), '-pix_fmt', 'yuv420p', path], check=True)
+
+
+def pillow_write(frames, out_dir, profile):
+    start = time.perf_counter()
+    for i, img in enumerate(frames, 1):
+        save_frame(img, os.path.join(out_dir, f"frame_{i:04d}{ENCODE_PROFILES[profile]['ext']}"), profile)
+    return time.perf_counter() - start
+
+
+def ffmpeg_write(clip, out_dir, profile):
+    start = time.perf_counter()
+    subprocess.run(['ffmpeg', '-v', 'error', '-i', clip, '-vf', 'format=rgba'] + ENCODE_PROFILES[profile]["ffmpeg"] +
+                   [os.path.join(out_dir, f"frame_%04d{ENCODE_PROFILES[profile]['ext']}")], check=True)
+    return time.perf_counter() - start
+
+
+def pillow_read(out_dir):
+    start = time.perf_counter()
+    for filename in list_frames(out_dir):
+        with Image.open(os.path.join(out_dir, filename)) as img: img.load()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--size", default="640x360")
+    parser.add_argument("--profiles", default=",".join(ENCODE_PROFILES))
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.size.split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="bench_encode_")
+    try:
+        clip = os.path.join(work_dir, "clip.mp4")
+        make_clip(clip, w, h, args.frames)
+        frames = [img.convert("RGBA") for img in iter_video_frames(clip)]
+        print(f"{len(frames)} frames, {w}x{h} RGBA")
+        rows = []
+        for profile in args.profiles.split(","):
+            pil_dir = os.path.join(work_dir, profile + "_pil"); ffmpeg_dir = os.path.join(work_dir, profile + "_ffmpeg")
+            os.makedirs(pil_dir); os.makedirs(ffmpeg_dir)
+            pil_seconds = pillow_write(frames, pil_dir, profile)
+            ffmpeg_seconds = ffmpeg_write(clip, ffmpeg_dir, profile)
+            read_seconds = pillow_read(pil_dir)
+            rows.append((profile, pil_seconds, ffmpeg_seconds, read_seconds, dir_size(pil_dir)))
+            shutil.rmtree(pil_dir); shutil.rmtree(ffmpeg_dir)
+        # 占用空间与默认的 png 编码方式相比
+        baseline = next((row[4] for row in rows if row[0] == "png"), rows[0][4])
+        print(f"{'profile':<18}{'pillow fps':>12}{'ffmpeg fps':>12}{'read fps':>10}{'MB':>9}{'vs png':>8}")
+        for profile, pil_seconds, ffmpeg_seconds, read_seconds, size in rows:
+            print(f"{profile:<18}{len(frames) / pil_seconds:>12.1f}{len(frames) / ffmpeg_seconds:>12.1f}{len(frames) / read_seconds:>10.1f}"
+                  f"{size / 1024 ** 2:>9.2f}{size / baseline:>8.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""流水线基准测试 / Frame pipeline benchmark
+
+用 ffmpeg 的 testsrc2 在本地生成不同分辨率和时长的合成视频，在每种提取模式和缩放引擎下运行完整流水线，
+记录每个步骤（提取、裁剪、去背景、缩放）和端到端的耗时，结果写入JSON文件，可与之前的结果对比以发现性能退化。
+第3步使用进程内的颜色键控（Photoshop 无法自动化计时）。
+
+Generates synthetic clips with ffmpeg's testsrc2 at several resolutions and lengths, runs the full pipeline
+under every extraction mode and resize engine, and records per-stage and end-to-end timings in a JSON file
+that can be compared against an earlier run to catch regressions. Step 3 uses the in-process chroma key.
+
+用法 / Usage:
+    python benchmarks/bench_pipeline.py --sizes 640x360,1280x720 --durations 2,5 --repeat 3
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/bench_20250101_120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import DEFAULT_SETTINGS, RESIZE_ENGINES, Pipeline, default_options, load_language, make_video_data
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# 提取模式：disk = 逐步写盘，streaming = rawvideo管道，overlap = 各阶段在线程中重叠执行的流式模式，filtergraph = 单条ffmpeg滤镜链，segments = 按关键帧分段并行提取的逐步写盘模式
+MODES = {"disk": {}, "streaming": {"streaming_mode": True}, "overlap": {"streaming_mode": True, "pipeline_overlap": True},
+         "filtergraph": {"ffmpeg_filtergraph": True}, "segments": {"segment_extraction": True}}
+
+
+def make_clip(path, w, h, seconds, fps):
+    """用 testsrc2 生成一段合成视频"""
+    subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', f'testsrc2=size={w}x{h}:rate={fps}:duration={seconds}',
+                    '-pix_fmt', 'yuv420p', path], check=True)
+
+
+def run_once(clip, mode, engine, work_dir, args):
+    """运行一次完整流水线，返回 (端到端秒数, {步骤: StageMetrics})"""
+    settings = dict(DEFAULT_SETTINGS, transparency_backend="chroma_key", stage_cache=False, run_report=False, **MODES[mode])
+    options = dict(default_options(settings), frame_step=args.frame_step, final_w=args.target[0], final_h=args.target[1], resize_engine=engine)
+    video = make_video_data(clip, settings, {"crop_w": args.crop[0], "crop_h": args.crop[1]})
+    output_root = os.path.join(work_dir, "out")
+    shutil.rmtree(output_root, ignore_errors=True)
+    pipeline = Pipeline(settings, options, load_language("en"), output_root=output_root)
+    start = time.perf_counter()
+    if not pipeline.run_queue([video]): raise RuntimeError("pipeline run was interrupted")
+    return time.perf_counter() - start, {m.stage: m for m in pipeline.metrics}
+
+
+def run_case(clip, mode, engine, work_dir, args):
+    """重复运行 args.repeat 次，取各步骤耗时的中位数"""
+    totals = []; stages = {}
+    for _ in range(args.repeat):
+        total, metrics = run_once(clip, mode, engine, work_dir, args)
+        totals.append(total)
+        for name, m in metrics.items(): stages.setdefault(name, []).append(m)
+    rows = []
+    for name, runs in stages.items():
+        wall = statistics.median(m.wall_seconds for m in runs)
+        rows.append({"stage": name, "wall_seconds": round(wall, 4), "frames": runs[0].frames,
+                     "fps": round(runs[0].frames / wall, 2) if wall > 0 else None})
+    total = statistics.median(totals)
+    rows.append({"stage": "total", "wall_seconds": round(total, 4), "frames": None, "fps": None})
+    return rows
+
+
+def environment():
+    ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "ffmpeg": ffmpeg_version, "date": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def result_key(row):
+    return (row["clip"], row["mode"], row["engine"], row["stage"])
+
+
+def compare(old_path, results, tolerance):
+    """打印与旧结果的耗时比值，返回变慢超过 tolerance 的项数"""
+    with open(old_path, 'r', encoding='utf-8') as f: old = {result_key(row): row for row in json.load(f)["results"]}
+    regressions = 0
+    print(f"\ncompared with {old_path}")
+    print(f"{'clip':<22}{'mode':<13}{'engine':<9}{'stage':<13}{'old s':>9}{'new s':>9}{'ratio':>8}")
+    for row in results:
+        before = old.get(result_key(row))
+        if before is None or not before["wall_seconds"]: continue
+        ratio = row["wall_seconds"] / before["wall_seconds"]
+        flag = ""
+        if ratio > 1 + tolerance: flag = "  slower"; regressions += 1
+        print(f"{row['clip']:<22}{row['mode']:<13}{row['engine']:<9}{row['stage']:<13}{before['wall_seconds']:>9.3f}{row['wall_seconds']:>9.3f}{ratio:>8.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="640x360,1280x720")
+    parser.add_argument("--durations", default="2", help="clip lengths in seconds, comma separated")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--engines", default=",".join(RESIZE_ENGINES))
+    parser.add_argument("--frame-step", type=int, default=2)
+    parser.add_argument("--crop", default="256x256")
+    parser.add_argument("--target", default="128x128")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/bench_<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown ratio reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+    args.crop = tuple(int(v) for v in args.crop.split("x")); args.target = tuple(int(v) for v in args.target.split("x"))
+
+    engines = []
+    for engine in args.engines.split(","):
+        if engine in ("magick", "mogrify") and shutil.which("magick") is None:
+            print(f"{engine}: skipped (magick not found)")
+            continue
+        engines.append(engine)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    results = []
+    try:
+        print(f"{'clip':<22}{'mode':<13}{'engine':<9}{'stage':<13}{'seconds':>9}{'frames/sec':>12}")
+        for size in args.sizes.split(","):
+            w, h = (int(v) for v in size.split("x"))
+            for seconds in (float(v) for v in args.durations.split(",")):
+                clip_name = f"{w}x{h}_{seconds:g}s"
+                clip = os.path.join(work_dir, clip_name + ".mp4")
+                make_clip(clip, w, h, seconds, args.fps)
+                for mode in args.modes.split(","):
+                    for engine in engines:
+                        for row in run_case(clip, mode, engine, work_dir, args):
+                            row.update(clip=clip_name, mode=mode, engine=engine); results.append(row)
+                            fps = f"{row['fps']:.1f}" if row["fps"] else ""
+                            print(f"{clip_name:<22}{mode:<13}{engine:<9}{row['stage']:<13}{row['wall_seconds']:>9.3f}{fps:>12}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("bench_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({"environment": environment(), "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}, "results": results}, f, indent=4)
+    print(f"\nresults written to {output}")
+    if args.compare and compare(args.compare, results, args.tolerance): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
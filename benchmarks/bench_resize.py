@@ -0,0 +1,70 @@
+"""缩放引擎基准测试 / Resize engine benchmark
+
+生成一批合成PNG帧，分别用每个可用的缩放引擎处理，输出 frames/sec。
+Generates synthetic PNG frames and reports frames/sec for each available resize engine.
+
+用法 / Usage:
+    python benchmarks/bench_resize.py --frames 300 --size 256x256 --target 128x128
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from pipeline import RESIZE_ENGINES, RESIZE_BATCH_SIZE, resize_batch
+
+
+def make_frames(frame_dir, count, w, h):
+    """写出 count 张带透明通道的合成帧"""
+    base = Image.merge("RGBA", (Image.linear_gradient("L").resize((w, h)), Image.effect_noise((w, h), 64),
+                                Image.radial_gradient("L").resize((w, h)), Image.linear_gradient("L").rotate(90).resize((w, h))))
+    files = []
+    for i in range(count):
+        path = os.path.join(frame_dir, f"frame_{i + 1:04d}.png")
+        base.rotate(i % 360).save(path, 'PNG')
+        files.append(path)
+    return files
+
+
+def run_engine(engine, files, out_dir, target_w, target_h):
+    start = time.perf_counter()
+    for i in range(0, len(files), RESIZE_BATCH_SIZE):
+        resize_batch(files[i:i + RESIZE_BATCH_SIZE], out_dir, target_w, target_h, engine)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", default="256x256")
+    parser.add_argument("--target", default="128x128")
+    parser.add_argument("--engines", default=",".join(RESIZE_ENGINES))
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.size.split("x"))
+    target_w, target_h = (int(v) for v in args.target.split("x"))
+
+    work_dir = tempfile.mkdtemp(prefix="bench_resize_")
+    try:
+        in_dir = os.path.join(work_dir, "in"); os.makedirs(in_dir)
+        files = make_frames(in_dir, args.frames, w, h)
+        print(f"{args.frames} frames, {w}x{h} -> {target_w}x{target_h}")
+        print(f"{'engine':<10}{'seconds':>10}{'frames/sec':>14}")
+        for engine in args.engines.split(","):
+            if engine in ("magick", "mogrify") and shutil.which("magick") is None:
+                print(f"{engine:<10}{'skipped (magick not found)':>24}")
+                continue
+            out_dir = os.path.join(work_dir, engine); os.makedirs(out_dir)
+            seconds = run_engine(engine, files, out_dir, target_w, target_h)
+            print(f"{engine:<10}{seconds:>10.2f}{len(files) / seconds:>14.1f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
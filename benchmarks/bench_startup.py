@@ -0,0 +1,83 @@
+"""启动时间基准测试 / Startup time benchmark
+
+在新进程中分别测量：Python 解释器本身、导入 pipeline、导入 main（图形界面模块），以及启动图形界面直到第一次空闲
+（main.py --startup-probe，需要显示器）；--exe 可同时测量 PyInstaller 打包的程序。每项运行 --runs 次，
+第一次接近冷启动（从网络共享启动时差别最明显），其余取中位数，图形界面与打包程序的冷启动时间与 --target 比较。
+Times fresh processes for the bare interpreter, `import pipeline`, `import main` and launching the GUI up to its
+first idle (`main.py --startup-probe`, needs a display), plus a PyInstaller build with --exe. The first run is the
+closest to a cold start; the rest are reported as a median. GUI and exe cold starts are checked against --target.
+
+用法 / Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --exe dist/main.exe --target 2.0
+    python benchmarks/bench_startup.py --importtime
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 图形界面（源码或打包程序）冷启动的目标时间（秒）
+STARTUP_TARGET_SECONDS = 1.5
+
+
+def time_process(cmd, cwd, env):
+    """运行一次 cmd，返回耗时（秒）；进程失败（例如没有显示器）时返回None"""
+    start = time.perf_counter()
+    result = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True)
+    if result.returncode != 0: return None
+    return time.perf_counter() - start
+
+
+def import_times(cwd, env, top=15):
+    """python -X importtime 中累计耗时最长的模块"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=cwd, env=env, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit(): continue
+        rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--exe", help="PyInstaller build to time (launched with --startup-probe)")
+    parser.add_argument("--target", type=float, default=STARTUP_TARGET_SECONDS, help="cold-start target in seconds for the GUI and the exe")
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports of main.py")
+    args = parser.parse_args()
+
+    # 在空的临时目录中运行，不读写开发目录中的 settings.json
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    cases = [("python", [sys.executable, "-c", "pass"]),
+             ("import pipeline", [sys.executable, "-c", "import pipeline"]),
+             ("import main", [sys.executable, "-c", "import main"]),
+             ("gui", [sys.executable, os.path.join(ROOT, "main.py"), "--startup-probe"])]
+    if args.exe: cases.append(("exe", [os.path.abspath(args.exe), "--startup-probe"]))
+    try:
+        print(f"{'case':<18}{'first s':>10}{'median s':>10}{'target':>10}")
+        for name, cmd in cases:
+            times = [time_process(cmd, work_dir, env) for _ in range(args.runs)]
+            if None in times:
+                print(f"{name:<18}{'failed (no display?)':>30}")
+                continue
+            median = statistics.median(times[1:] or times)
+            verdict = ("ok" if times[0] <= args.target else "SLOW") if name in ("gui", "exe") else ""
+            print(f"{name:<18}{times[0]:>10.3f}{median:>10.3f}{verdict:>10}")
+        if args.importtime:
+            print("\nslowest imports (cumulative ms):")
+            for micros, module in import_times(work_dir, env):
+                print(f"{micros / 1000:>10.1f}  {module}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,76 +2,43 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
 import sys
+import queue
 import subprocess
-import shutil
 import threading
-import time
-import json
-from PIL import Image, ImageTk, ImageDraw, ImageOps
-
-# 获取资源文件的正确路径（支持打包后的环境）
-def resource_path(relative_path):
-    """获取资源文件的绝对路径，兼容开发环境和PyInstaller打包后的环境"""
-    try:
-        # PyInstaller创建临时文件夹，将路径存储在_MEIPASS中
-        base_path = sys._MEIPASS
-    except Exception:
-        # 开发环境下使用当前文件所在目录
-        base_path = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(base_path, relative_path)
-
-# 获取exe所在目录（用于输出文件）
-def get_executable_dir():
-    """获取exe文件所在的目录，兼容开发环境和打包后的环境"""
-    if getattr(sys, 'frozen', False):
-        # 打包后的环境：返回exe所在目录
-        return os.path.dirname(sys.executable)
-    else:
-        # 开发环境：返回脚本所在目录
-        return os.path.dirname(os.path.abspath(__file__))
-
-# --- Global Settings and Defaults ---
-SETTINGS_FILE = "settings.json"
-DEFAULT_SETTINGS = {
-    "photoshop_exe": r"C:\Program Files\Adobe\Adobe Photoshop 2025\Photoshop.exe",
-    "language": "zh",
-    "frame_step": "3",
-    "crop_w": "256",
-    "crop_h": "256",
-    "final_w": "128",
-    "final_h": "128",
-    "geometry": "1000x750",
-    "clean_temp_files": False
-}
-
-# --- Language and Settings Loaders ---
-def load_settings():
-    """Loads settings, and if the file is missing or incomplete, complements it with default values."""
-    if not os.path.exists(SETTINGS_FILE):
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(DEFAULT_SETTINGS, f, indent=4)
-        return DEFAULT_SETTINGS
-    
-    try:
-        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-            loaded_settings = json.load(f)
-        
-        # Key Fix: Ensure all default keys exist, add them if missing.
-        for key, value in DEFAULT_SETTINGS.items():
-            if key not in loaded_settings:
-                loaded_settings[key] = value
-        
-        return loaded_settings
-    except (json.JSONDecodeError, FileNotFoundError):
-        return DEFAULT_SETTINGS
-
-def save_settings(settings):
-    with open(SETTINGS_FILE, 'w', encoding='utf-8') as f: json.dump(settings, f, indent=4)
-
-def load_language(lang_code):
-    lang_file = f"lang_{lang_code}.json"
-    if not os.path.exists(lang_file): lang_file = "lang_en.json" # Fallback to English
-    with open(lang_file, 'r', encoding='utf-8') as f: return json.load(f)
+import multiprocessing
+# 处理流水线与Tk无关，放在 pipeline.py 中，命令行也可以直接使用
+from pipeline import (load_settings, save_settings, load_language, make_video_data, Pipeline, FrameCache,
+                      propose_crop, decimated_frames, RESIZE_ENGINES, TRANSPARENCY_BACKENDS, DECIMATION_MODES, ENCODE_PROFILES, ATLAS_LAYOUTS)
+
+# --- UI Event Bus ---
+# 工作线程不直接调用Tk：日志、进度、状态和需要在主线程执行的函数先放入队列，由主循环按固定间隔取出并合并处理
+UI_DRAIN_MS = 50
+
+class UiEventBus:
+    """线程安全的界面事件队列，任意线程都可以 post，只由Tk主线程 drain"""
+    def __init__(self):
+        self.events = queue.SimpleQueue()
+
+    def post(self, kind, *args):
+        self.events.put((kind, args))
+
+    def drain(self):
+        """取出当前所有事件并合并，返回 (日志行, 最新进度, {视频: (video_data, 最新状态)}, 待执行的函数)
+
+        日志保持顺序；进度只保留最新的值和最新的非空文本；每个视频的状态只保留最后一条。
+        """
+        logs = []; progress = None; statuses = {}; calls = []
+        while True:
+            try: kind, args = self.events.get_nowait()
+            except queue.Empty: break
+            if kind == "log": logs.append(args[0])
+            elif kind == "progress":
+                current, total, message = args
+                if progress is not None and not message: message = progress[2]
+                progress = (current, total, message)
+            elif kind == "status": statuses[id(args[0])] = args
+            elif kind == "call": calls.append(args[0])
+        return logs, progress, statuses, calls
 
 # --- Main Application ---
 class App(tk.Tk):
@@ -84,13 +51,17 @@ class App(tk.Tk):
         self.geometry(self.settings.get("geometry", "1000x750"))
 
         self.video_queue = []
-        self.mask_image = None
+        self.mask_image = None; self.mask_path = None
         self.is_updating_dimensions = False
         self.debounce_job = None
+        self.preview_cache = FrameCache()
         self.stop_requested = threading.Event()
+        self.pipeline = None
+        self.ui_events = UiEventBus()
         
         self.build_ui()
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.after(UI_DRAIN_MS, self.drain_ui_events)
 
     def build_ui(self):
         # ... (Most of the UI code is identical to the previous version) ...
@@ -103,21 +74,22 @@ class App(tk.Tk):
         left_frame.rowconfigure(1, weight=1); left_frame.columnconfigure(0, weight=1)
         steps_frame = ttk.LabelFrame(left_frame, text=self.lang.get("process_steps_label")); steps_frame.grid(row=0, column=0, sticky="ew", pady=(0,10))
         self.do_reduce_var = tk.BooleanVar(value=True); self.do_crop_var = tk.BooleanVar(value=True)
-        self.do_photoshop_var = tk.BooleanVar(value=True); self.do_resize_var = tk.BooleanVar(value=True)
+        self.do_photoshop_var = tk.BooleanVar(value=True); self.do_resize_var = tk.BooleanVar(value=True); self.do_atlas_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(steps_frame, text=self.lang.get("step_reduce"), variable=self.do_reduce_var).pack(side="left", padx=5)
         ttk.Checkbutton(steps_frame, text=self.lang.get("step_crop"), variable=self.do_crop_var).pack(side="left", padx=5)
         ttk.Checkbutton(steps_frame, text=self.lang.get("step_photoshop"), variable=self.do_photoshop_var).pack(side="left", padx=5)
         ttk.Checkbutton(steps_frame, text=self.lang.get("step_resize"), variable=self.do_resize_var).pack(side="left", padx=5)
+        ttk.Checkbutton(steps_frame, text=self.lang.get("step_atlas"), variable=self.do_atlas_var).pack(side="left", padx=5)
         tree_frame = ttk.Frame(left_frame); tree_frame.grid(row=1, column=0, sticky="nsew")
         tree_frame.rowconfigure(0, weight=1); tree_frame.columnconfigure(0, weight=1)
-        columns = ("out_folder", "prefix", "path", "crop_w", "crop_h", "offset_x", "offset_y")
+        columns = ("out_folder", "prefix", "path", "crop_w", "crop_h", "offset_x", "offset_y", "status")
         self.tree = ttk.Treeview(tree_frame, columns=columns, show="headings")
         self.tree.heading("out_folder", text=self.lang.get("tree_col_out")); self.tree.heading("prefix", text=self.lang.get("tree_col_prefix")); self.tree.heading("path", text=self.lang.get("tree_col_video"))
         self.tree.heading("crop_w", text=self.lang.get("tree_col_w")); self.tree.heading("crop_h", text=self.lang.get("tree_col_h")); 
-        self.tree.heading("offset_x", text=self.lang.get("tree_col_x")); self.tree.heading("offset_y", text=self.lang.get("tree_col_y"))
+        self.tree.heading("offset_x", text=self.lang.get("tree_col_x")); self.tree.heading("offset_y", text=self.lang.get("tree_col_y")); self.tree.heading("status", text=self.lang.get("tree_col_status"))
         self.tree.column("out_folder", width=100); self.tree.column("prefix", width=100); self.tree.column("path", width=150)
         self.tree.column("crop_w", width=40, anchor="center"); self.tree.column("crop_h", width=40, anchor="center")
-        self.tree.column("offset_x", width=40, anchor="center"); self.tree.column("offset_y", width=40, anchor="center")
+        self.tree.column("offset_x", width=40, anchor="center"); self.tree.column("offset_y", width=40, anchor="center"); self.tree.column("status", width=120)
         self.tree.grid(row=0, column=0, sticky="nsew")
         scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview); scrollbar.grid(row=0, column=1, sticky="ns")
         self.tree.configure(yscrollcommand=scrollbar.set)
@@ -129,6 +101,10 @@ class App(tk.Tk):
         ff_frame = ttk.Frame(settings_frame); ff_frame.pack(fill="x", padx=5, pady=2)
         ttk.Label(ff_frame, text=self.lang.get("frame_step_label")).pack(side="left"); self.frame_step = tk.StringVar(value=self.settings.get("frame_step", "3"))
         ttk.Entry(ff_frame, textvariable=self.frame_step, width=5).pack(side="left", padx=5); ttk.Label(ff_frame, text=self.lang.get("frame_step_unit")).pack(side="left")
+        ttk.Label(ff_frame, text=self.lang.get("decimation_mode_label")).pack(side="left", padx=(10,0)); self.decimation_mode = tk.StringVar(value=self.settings.get("decimation_mode", "fixed"))
+        ttk.Combobox(ff_frame, textvariable=self.decimation_mode, values=list(DECIMATION_MODES), width=8, state="readonly").pack(side="left", padx=5)
+        ttk.Label(ff_frame, text=self.lang.get("scene_threshold_label")).pack(side="left"); self.scene_threshold = tk.StringVar(value=self.settings.get("scene_threshold", "2"))
+        ttk.Entry(ff_frame, textvariable=self.scene_threshold, width=5).pack(side="left", padx=5)
 
         out_frame = ttk.Frame(settings_frame); out_frame.pack(fill="x", padx=5, pady=2)
         ttk.Label(out_frame, text=self.lang.get("output_folder_label")).pack(side="left"); self.out_folder_var = tk.StringVar(value="")
@@ -154,14 +130,21 @@ class App(tk.Tk):
         ar_combo = ttk.Combobox(ar_frame, textvariable=self.aspect_ratio, values=[self.lang.get("aspect_ratio_free"), "1:1", "4:3", "16:9"], width=7)
         ar_combo.pack(side="left", padx=5); ar_combo.bind("<<ComboboxSelected>>", self.on_aspect_ratio_change)
         self.apply_button = ttk.Button(ar_frame, text=self.lang.get("apply_button"), command=self.apply_settings_to_selected); self.apply_button.pack(side="left", padx=10)
+        self.auto_crop_button = ttk.Button(ar_frame, text=self.lang.get("auto_crop_button"), command=self.auto_crop_selected); self.auto_crop_button.pack(side="left")
 
         resize_frame = ttk.Frame(settings_frame); resize_frame.pack(fill="x", padx=5, pady=5)
         ttk.Label(resize_frame, text=self.lang.get("output_res_label")).pack(side="left"); self.final_w = tk.StringVar(value=self.settings.get("final_w", "128")); self.final_h = tk.StringVar(value=self.settings.get("final_h", "128"))
         ttk.Label(resize_frame, text="W:").pack(side="left", padx=(10,0)); ttk.Entry(resize_frame, textvariable=self.final_w, width=5).pack(side="left")
         ttk.Label(resize_frame, text="H:").pack(side="left", padx=(10,0)); ttk.Entry(resize_frame, textvariable=self.final_h, width=5).pack(side="left")
+        ttk.Label(resize_frame, text=self.lang.get("resize_engine_label")).pack(side="left", padx=(10,0)); self.resize_engine = tk.StringVar(value=self.settings.get("resize_engine", "mogrify"))
+        ttk.Combobox(resize_frame, textvariable=self.resize_engine, values=list(RESIZE_ENGINES), width=8, state="readonly").pack(side="left", padx=5)
 
         preview_controls_frame = ttk.Frame(settings_frame); preview_controls_frame.pack(fill="x", padx=5, pady=2)
         self.load_mask_button = ttk.Button(preview_controls_frame, text=self.lang.get("load_mask_button"), command=self.load_mask); self.load_mask_button.pack(side="left")
+        self.apply_mask_var = tk.BooleanVar(value=False)
+        self.apply_mask_check = ttk.Checkbutton(preview_controls_frame, text=self.lang.get("apply_mask_label"), variable=self.apply_mask_var); self.apply_mask_check.pack(side="left", padx=(5, 0))
+        ttk.Label(preview_controls_frame, text=self.lang.get("preview_time_label")).pack(side="left", padx=(10,0)); self.preview_time = tk.StringVar(value="0")
+        ttk.Entry(preview_controls_frame, textvariable=self.preview_time, width=7).pack(side="left", padx=5)
         self.preview_button = ttk.Button(preview_controls_frame, text=self.lang.get("preview_button"), command=self.generate_preview); self.preview_button.pack(side="right")
 
         self.preview_label = ttk.Label(right_frame, text=self.lang.get("preview_area_text"), anchor="center", background="gray"); self.preview_label.grid(row=1, column=0, sticky="nsew")
@@ -199,8 +182,9 @@ class App(tk.Tk):
         log_scrollbar.grid(row=0, column=1, sticky="ns")
         self.log_text.configure(yscrollcommand=log_scrollbar.set)
         
-        self.crop_w.trace_add("write", self.schedule_preview); self.crop_h.trace_add("write", self.schedule_preview)
-        self.offset_x.trace_add("write", self.schedule_preview); self.offset_y.trace_add("write", self.schedule_preview)
+        self.crop_w.trace_add("write", self.schedule_overlay_preview); self.crop_h.trace_add("write", self.schedule_overlay_preview)
+        self.offset_x.trace_add("write", self.schedule_overlay_preview); self.offset_y.trace_add("write", self.schedule_overlay_preview)
+        self.preview_time.trace_add("write", self.schedule_preview); self.tree.bind("<<TreeviewSelect>>", self.schedule_preview)
         self.crop_w.trace_add("write", self.on_width_change); self.crop_h.trace_add("write", self.on_height_change)
         
         self.toggle_prefix_entry(); self.toggle_out_folder_entry()
@@ -208,21 +192,41 @@ class App(tk.Tk):
     # --- METHOD DEFINITIONS ---
     
     def log(self, message):
-        """在日志区域添加消息"""
-        self.log_text.config(state="normal")
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.log_text.config(state="disabled")
-        self.update_idletasks()
+        """在日志区域添加消息（可在任意线程中调用）"""
+        self.ui_events.post("log", message)
     
     def update_progress(self, current, total, message=""):
-        """更新进度条和进度文本"""
-        if total > 0:
-            progress = (current / total) * 100
-            self.progress_var.set(progress)
-        if message:
-            self.progress_label.config(text=message)
-        self.update_idletasks()
+        """更新进度条和进度文本（可在任意线程中调用）"""
+        self.ui_events.post("progress", current, total, message)
+
+    def set_video_status(self, video_data, text):
+        """更新队列表格中某个视频的状态列（可在任意线程中调用）"""
+        self.ui_events.post("status", video_data, text)
+
+    def call_in_ui(self, func):
+        """在Tk主线程中执行 func（例如从工作线程弹出对话框）"""
+        self.ui_events.post("call", func)
+
+    def drain_ui_events(self):
+        """主循环中每 UI_DRAIN_MS 毫秒执行一次：合并处理这段时间内工作线程发来的事件"""
+        try:
+            logs, progress, statuses, calls = self.ui_events.drain()
+            if logs:
+                self.log_text.config(state="normal")
+                self.log_text.insert(tk.END, "\n".join(logs) + "\n")
+                self.log_text.see(tk.END)
+                self.log_text.config(state="disabled")
+            if progress is not None:
+                current, total, message = progress
+                if total > 0: self.progress_var.set((current / total) * 100)
+                if message: self.progress_label.config(text=message)
+            if statuses:
+                items = dict(zip(map(id, self.video_queue), self.tree.get_children()))
+                for video_data, text in statuses.values():
+                    if id(video_data) in items: self.tree.set(items[id(video_data)], "status", text)
+            for func in calls: func()
+        finally:
+            self.after(UI_DRAIN_MS, self.drain_ui_events)
 
     def create_menu(self):
         menubar = tk.Menu(self); self.config(menu=menubar)
@@ -232,7 +236,7 @@ class App(tk.Tk):
         menubar.add_cascade(label=self.lang.get("menu_file"), menu=file_menu)
 
     def open_settings_window(self):
-        settings_window = tk.Toplevel(self); settings_window.title(self.lang.get("settings_title")); settings_window.geometry("600x340")
+        settings_window = tk.Toplevel(self); settings_window.title(self.lang.get("settings_title")); settings_window.geometry("600x900")
         
         lang_frame = ttk.Frame(settings_window); lang_frame.pack(fill="x", padx=10, pady=5)
         ttk.Label(lang_frame, text=self.lang.get("lang_label")).pack(side="left")
@@ -259,6 +263,15 @@ class App(tk.Tk):
         ttk.Label(crop_frame, text="W:").pack(side="left", padx=(10, 0)); ttk.Entry(crop_frame, textvariable=crop_w_var, width=5).pack(side="left")
         ttk.Label(crop_frame, text="H:").pack(side="left", padx=(10, 0)); ttk.Entry(crop_frame, textvariable=crop_h_var, width=5).pack(side="left")
         
+        auto_crop_frame = ttk.Frame(defaults_frame); auto_crop_frame.pack(fill="x", padx=5, pady=2)
+        auto_crop_threshold_var = tk.StringVar(value=self.settings.get("auto_crop_threshold", "25")); auto_crop_margin_var = tk.StringVar(value=self.settings.get("auto_crop_margin", "10"))
+        ttk.Label(auto_crop_frame, text=self.lang.get("auto_crop_threshold_label")).pack(side="left"); ttk.Entry(auto_crop_frame, textvariable=auto_crop_threshold_var, width=5).pack(side="left", padx=5)
+        ttk.Label(auto_crop_frame, text=self.lang.get("auto_crop_margin_label")).pack(side="left", padx=(10, 0)); ttk.Entry(auto_crop_frame, textvariable=auto_crop_margin_var, width=5).pack(side="left", padx=5)
+        tracking_frame = ttk.Frame(defaults_frame); tracking_frame.pack(fill="x", padx=5, pady=2)
+        crop_tracking_var = tk.BooleanVar(value=self.settings.get("crop_tracking", False)); crop_smoothing_var = tk.StringVar(value=self.settings.get("crop_smoothing", "15"))
+        ttk.Checkbutton(tracking_frame, text=self.lang.get("crop_tracking_label"), variable=crop_tracking_var).pack(side="left")
+        ttk.Label(tracking_frame, text=self.lang.get("crop_smoothing_label")).pack(side="left", padx=(10, 0)); ttk.Entry(tracking_frame, textvariable=crop_smoothing_var, width=5).pack(side="left", padx=5)
+        
         res_frame = ttk.Frame(defaults_frame); res_frame.pack(fill="x", padx=5, pady=2)
         ttk.Label(res_frame, text=self.lang.get("default_res_label")).pack(side="left", anchor="w")
         final_w_var = tk.StringVar(value=self.settings.get("final_w", "128")); final_h_var = tk.StringVar(value=self.settings.get("final_h", "128"))
@@ -269,6 +282,68 @@ class App(tk.Tk):
         clean_frame = ttk.Frame(settings_window); clean_frame.pack(fill="x", padx=10, pady=5)
         clean_temp_var = tk.BooleanVar(value=self.settings.get("clean_temp_files", False))
         ttk.Checkbutton(clean_frame, text=self.lang.get("clean_temp_files_label"), variable=clean_temp_var).pack(side="left")
+        disk_frame = ttk.Frame(settings_window); disk_frame.pack(fill="x", padx=10)
+        eager_cleanup_var = tk.BooleanVar(value=self.settings.get("eager_cleanup", False)); disk_space_check_var = tk.BooleanVar(value=self.settings.get("disk_space_check", False))
+        ttk.Checkbutton(disk_frame, text=self.lang.get("eager_cleanup_label"), variable=eager_cleanup_var).pack(anchor="w")
+        ttk.Checkbutton(disk_frame, text=self.lang.get("disk_space_check_label"), variable=disk_space_check_var).pack(anchor="w")
+
+        # 去背景（步骤3）选项
+        bg_frame = ttk.LabelFrame(settings_window, text=self.lang.get("transparency_frame_title")); bg_frame.pack(fill="x", padx=10, pady=5)
+        backend_frame = ttk.Frame(bg_frame); backend_frame.pack(fill="x", padx=5, pady=2)
+        backend_var = tk.StringVar(value=self.settings.get("transparency_backend", "photoshop"))
+        ttk.Label(backend_frame, text=self.lang.get("transparency_backend_label")).pack(side="left")
+        ttk.Combobox(backend_frame, textvariable=backend_var, values=list(TRANSPARENCY_BACKENDS), width=12, state="readonly").pack(side="left", padx=5)
+        key_frame = ttk.Frame(bg_frame); key_frame.pack(fill="x", padx=5, pady=2)
+        key_color_var = tk.StringVar(value=self.settings.get("key_color", "#00ff00")); key_threshold_var = tk.StringVar(value=self.settings.get("key_threshold", "60")); key_feather_var = tk.StringVar(value=self.settings.get("key_feather", "30"))
+        ttk.Label(key_frame, text=self.lang.get("key_color_label")).pack(side="left"); ttk.Entry(key_frame, textvariable=key_color_var, width=8).pack(side="left", padx=5)
+        ttk.Label(key_frame, text=self.lang.get("key_threshold_label")).pack(side="left", padx=(10, 0)); ttk.Entry(key_frame, textvariable=key_threshold_var, width=5).pack(side="left", padx=5)
+        ttk.Label(key_frame, text=self.lang.get("key_feather_label")).pack(side="left", padx=(10, 0)); ttk.Entry(key_frame, textvariable=key_feather_var, width=5).pack(side="left", padx=5)
+
+        # 图集选项
+        atlas_frame = ttk.LabelFrame(settings_window, text=self.lang.get("atlas_frame_title")); atlas_frame.pack(fill="x", padx=10, pady=5)
+        atlas_row = ttk.Frame(atlas_frame); atlas_row.pack(fill="x", padx=5, pady=2)
+        atlas_layout_var = tk.StringVar(value=self.settings.get("atlas_layout", "grid")); atlas_trim_var = tk.BooleanVar(value=self.settings.get("atlas_trim", False))
+        atlas_max_size_var = tk.StringVar(value=self.settings.get("atlas_max_size", "4096")); atlas_padding_var = tk.StringVar(value=self.settings.get("atlas_padding", "1"))
+        ttk.Label(atlas_row, text=self.lang.get("atlas_layout_label")).pack(side="left"); ttk.Combobox(atlas_row, textvariable=atlas_layout_var, values=list(ATLAS_LAYOUTS), width=8, state="readonly").pack(side="left", padx=5)
+        ttk.Label(atlas_row, text=self.lang.get("atlas_max_size_label")).pack(side="left", padx=(10, 0)); ttk.Entry(atlas_row, textvariable=atlas_max_size_var, width=6).pack(side="left", padx=5)
+        ttk.Label(atlas_row, text=self.lang.get("atlas_padding_label")).pack(side="left", padx=(10, 0)); ttk.Entry(atlas_row, textvariable=atlas_padding_var, width=4).pack(side="left", padx=5)
+        ttk.Checkbutton(atlas_row, text=self.lang.get("atlas_trim_label"), variable=atlas_trim_var).pack(side="left", padx=(10, 0))
+
+        # 性能选项
+        perf_frame = ttk.LabelFrame(settings_window, text=self.lang.get("performance_frame_title")); perf_frame.pack(fill="x", padx=10, pady=5)
+        streaming_frame = ttk.Frame(perf_frame); streaming_frame.pack(fill="x", padx=5, pady=2)
+        streaming_var = tk.BooleanVar(value=self.settings.get("streaming_mode", False))
+        ttk.Checkbutton(streaming_frame, text=self.lang.get("streaming_mode_label"), variable=streaming_var).pack(side="left")
+        overlap_frame = ttk.Frame(perf_frame); overlap_frame.pack(fill="x", padx=5, pady=2)
+        overlap_var = tk.BooleanVar(value=self.settings.get("pipeline_overlap", False)); queue_frames_var = tk.StringVar(value=self.settings.get("pipeline_queue_frames", "8"))
+        ttk.Checkbutton(overlap_frame, text=self.lang.get("pipeline_overlap_label"), variable=overlap_var).pack(side="left", padx=(20, 0))
+        ttk.Label(overlap_frame, text=self.lang.get("pipeline_queue_label")).pack(side="left", padx=(10, 0)); ttk.Entry(overlap_frame, textvariable=queue_frames_var, width=5).pack(side="left", padx=5)
+        filtergraph_frame = ttk.Frame(perf_frame); filtergraph_frame.pack(fill="x", padx=5, pady=2)
+        filtergraph_var = tk.BooleanVar(value=self.settings.get("ffmpeg_filtergraph", False))
+        ttk.Checkbutton(filtergraph_frame, text=self.lang.get("ffmpeg_filtergraph_label"), variable=filtergraph_var).pack(side="left")
+        ps_batch_frame = ttk.Frame(perf_frame); ps_batch_frame.pack(fill="x", padx=5, pady=2)
+        ps_batch_var = tk.BooleanVar(value=self.settings.get("photoshop_batch_mode", False))
+        ttk.Checkbutton(ps_batch_frame, text=self.lang.get("photoshop_batch_label"), variable=ps_batch_var).pack(side="left")
+        parallel_frame = ttk.Frame(perf_frame); parallel_frame.pack(fill="x", padx=5, pady=2)
+        parallel_videos_var = tk.StringVar(value=self.settings.get("parallel_videos", "1")); parallel_ffmpeg_var = tk.StringVar(value=self.settings.get("parallel_ffmpeg", "2"))
+        ttk.Label(parallel_frame, text=self.lang.get("parallel_videos_label")).pack(side="left"); ttk.Entry(parallel_frame, textvariable=parallel_videos_var, width=5).pack(side="left", padx=5)
+        ttk.Label(parallel_frame, text=self.lang.get("parallel_ffmpeg_label")).pack(side="left", padx=(10, 0)); ttk.Entry(parallel_frame, textvariable=parallel_ffmpeg_var, width=5).pack(side="left", padx=5)
+        report_frame = ttk.Frame(perf_frame); report_frame.pack(fill="x", padx=5, pady=2)
+        run_report_var = tk.BooleanVar(value=self.settings.get("run_report", True)); show_fps_var = tk.BooleanVar(value=self.settings.get("show_fps", False))
+        ttk.Checkbutton(report_frame, text=self.lang.get("run_report_label"), variable=run_report_var).pack(side="left")
+        ttk.Checkbutton(report_frame, text=self.lang.get("show_fps_label"), variable=show_fps_var).pack(side="left", padx=(10, 0))
+        cache_frame = ttk.Frame(perf_frame); cache_frame.pack(fill="x", padx=5, pady=2)
+        stage_cache_var = tk.BooleanVar(value=self.settings.get("stage_cache", True)); stage_cache_limit_var = tk.StringVar(value=self.settings.get("stage_cache_limit_mb", "0"))
+        ttk.Checkbutton(cache_frame, text=self.lang.get("stage_cache_label"), variable=stage_cache_var).pack(side="left")
+        ttk.Label(cache_frame, text=self.lang.get("stage_cache_limit_label")).pack(side="left", padx=(10, 0)); ttk.Entry(cache_frame, textvariable=stage_cache_limit_var, width=7).pack(side="left", padx=5)
+        encode_frame = ttk.Frame(perf_frame); encode_frame.pack(fill="x", padx=5, pady=2)
+        intermediate_profile_var = tk.StringVar(value=self.settings.get("intermediate_profile", "png_fast")); final_profile_var = tk.StringVar(value=self.settings.get("final_profile", "png"))
+        ttk.Label(encode_frame, text=self.lang.get("intermediate_profile_label")).pack(side="left"); ttk.Combobox(encode_frame, textvariable=intermediate_profile_var, values=list(ENCODE_PROFILES), width=16, state="readonly").pack(side="left", padx=5)
+        ttk.Label(encode_frame, text=self.lang.get("final_profile_label")).pack(side="left", padx=(10, 0)); ttk.Combobox(encode_frame, textvariable=final_profile_var, values=list(ENCODE_PROFILES), width=16, state="readonly").pack(side="left", padx=5)
+        frame_store_var = tk.BooleanVar(value=self.settings.get("frame_store", False))
+        ttk.Checkbutton(perf_frame, text=self.lang.get("frame_store_label"), variable=frame_store_var).pack(anchor="w", padx=5, pady=2)
+        segment_extraction_var = tk.BooleanVar(value=self.settings.get("segment_extraction", False))
+        ttk.Checkbutton(perf_frame, text=self.lang.get("segment_extraction_label"), variable=segment_extraction_var).pack(anchor="w", padx=5, pady=2)
 
         def save_and_close():
             current_lang = self.settings.get("language", "zh"); new_lang = lang_var.get()
@@ -276,9 +351,37 @@ class App(tk.Tk):
             self.settings["frame_step"] = frame_step_var.get()
             self.settings["crop_w"] = crop_w_var.get()
             self.settings["crop_h"] = crop_h_var.get()
+            self.settings["auto_crop_threshold"] = auto_crop_threshold_var.get()
+            self.settings["auto_crop_margin"] = auto_crop_margin_var.get()
+            self.settings["crop_tracking"] = crop_tracking_var.get()
+            self.settings["crop_smoothing"] = crop_smoothing_var.get()
             self.settings["final_w"] = final_w_var.get()
             self.settings["final_h"] = final_h_var.get()
             self.settings["clean_temp_files"] = clean_temp_var.get()
+            self.settings["eager_cleanup"] = eager_cleanup_var.get(); self.settings["disk_space_check"] = disk_space_check_var.get()
+            self.settings["streaming_mode"] = streaming_var.get()
+            self.settings["pipeline_overlap"] = overlap_var.get()
+            self.settings["pipeline_queue_frames"] = queue_frames_var.get()
+            self.settings["ffmpeg_filtergraph"] = filtergraph_var.get()
+            self.settings["photoshop_batch_mode"] = ps_batch_var.get()
+            self.settings["transparency_backend"] = backend_var.get()
+            self.settings["key_color"] = key_color_var.get()
+            self.settings["key_threshold"] = key_threshold_var.get()
+            self.settings["key_feather"] = key_feather_var.get()
+            self.settings["parallel_videos"] = parallel_videos_var.get()
+            self.settings["parallel_ffmpeg"] = parallel_ffmpeg_var.get()
+            self.settings["run_report"] = run_report_var.get()
+            self.settings["show_fps"] = show_fps_var.get()
+            self.settings["stage_cache"] = stage_cache_var.get()
+            self.settings["stage_cache_limit_mb"] = stage_cache_limit_var.get()
+            self.settings["atlas_layout"] = atlas_layout_var.get()
+            self.settings["atlas_trim"] = atlas_trim_var.get()
+            self.settings["atlas_max_size"] = atlas_max_size_var.get()
+            self.settings["atlas_padding"] = atlas_padding_var.get()
+            self.settings["intermediate_profile"] = intermediate_profile_var.get()
+            self.settings["final_profile"] = final_profile_var.get()
+            self.settings["frame_store"] = frame_store_var.get()
+            self.settings["segment_extraction"] = segment_extraction_var.get()
             
             if current_lang != new_lang:
                 self.settings["language"] = new_lang
@@ -293,6 +396,8 @@ class App(tk.Tk):
 
     def on_closing(self):
         self.settings["geometry"] = self.geometry()
+        self.settings["resize_engine"] = self.resize_engine.get()
+        self.settings["decimation_mode"] = self.decimation_mode.get(); self.settings["scene_threshold"] = self.scene_threshold.get()
         save_settings(self.settings)
         self.destroy()
 
@@ -311,21 +416,22 @@ class App(tk.Tk):
         else:
             self.prefix_entry.config(state="normal")
     
-    def schedule_preview(self, *args):
+    def schedule_preview(self, *args, delay=500):
         if self.debounce_job:
             self.after_cancel(self.debounce_job)
-        self.debounce_job = self.after(500, self.generate_preview)
+        self.debounce_job = self.after(delay, self.generate_preview)
+
+    def schedule_overlay_preview(self, *args):
+        # 裁剪框/偏移量的变化只需重绘缓存底图上的叠加层，可以使用更短的防抖时间
+        self.schedule_preview(delay=50)
 
     def add_videos(self):
         video_paths = filedialog.askopenfilenames(title=self.lang.get("add_video_button"), filetypes=[(self.lang.get("file_type_video"), "*.mp4 *.mov *.avi"), (self.lang.get("file_type_all"), "*.*")])
-        # 从设置中获取默认裁剪大小
-        default_crop_w = int(self.settings.get("crop_w", "256"))
-        default_crop_h = int(self.settings.get("crop_h", "256"))
         for path in video_paths:
-            base_name = os.path.splitext(os.path.basename(path))[0]
-            video_data = {"out_folder": base_name, "prefix": "frame", "path": path, "crop_w": default_crop_w, "crop_h": default_crop_h, "offset_x": 0, "offset_y": 0}
+            # 默认裁剪大小取自设置
+            video_data = make_video_data(path, self.settings)
             self.video_queue.append(video_data)
-            self.tree.insert("", tk.END, values=(base_name, "frame", os.path.basename(path), default_crop_w, default_crop_h, 0, 0))
+            self.tree.insert("", tk.END, values=(video_data["out_folder"], video_data["prefix"], os.path.basename(path), video_data["crop_w"], video_data["crop_h"], 0, 0))
 
     def remove_selected(self):
         selected_items = self.tree.selection()
@@ -355,6 +461,38 @@ class App(tk.Tk):
             self.video_queue[index].update({"out_folder": out_folder, "prefix": prefix, "crop_w": w, "crop_h": h, "offset_x": ox, "offset_y": oy})
             self.tree.item(item, values=(out_folder, prefix, os.path.basename(self.video_queue[index]["path"]), w, h, ox, oy))
 
+    def auto_crop_selected(self):
+        """在后台线程中检测所选视频的运动主体，把建议的裁剪框填入裁剪参数（需点击“应用”才会写入队列）"""
+        selected_items = self.tree.selection()
+        if not selected_items: messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_select_video_first")); return
+        video_path = self.video_queue[self.tree.index(selected_items[0])]["path"]
+        try: frame_step = max(1, int(self.frame_step.get())) if self.do_reduce_var.get() else 1
+        except ValueError: frame_step = 1
+        aspect = {"1:1": 1.0, "4:3": 4 / 3, "16:9": 16 / 9}.get(self.aspect_ratio.get())
+        try:
+            threshold = float(self.settings.get("auto_crop_threshold", "25")); margin = float(self.settings.get("auto_crop_margin", "10")) / 100
+            scene_threshold = float(self.scene_threshold.get())
+        except ValueError: messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_values_must_be_int")); return
+        do_reduce = self.do_reduce_var.get(); decimation = self.decimation_mode.get()
+        self.auto_crop_button.config(state="disabled"); self.update_progress(0, 100, self.lang.get("progress_auto_crop"))
+        def detect():
+            # 自适应抽帧时只分析运行中会保留的帧
+            try: proposal = propose_crop(video_path, *decimated_frames(video_path, do_reduce, frame_step, decimation, scene_threshold), threshold, margin, aspect)
+            except (OSError, ValueError, subprocess.CalledProcessError) as e: proposal = e
+            self.call_in_ui(lambda: self.apply_auto_crop(video_path, proposal))
+        threading.Thread(target=detect, daemon=True).start()
+
+    def apply_auto_crop(self, video_path, proposal):
+        self.auto_crop_button.config(state="normal"); self.update_progress(0, 100, self.lang.get("status_ready"))
+        if isinstance(proposal, Exception): self.log(self.lang.get("log_error").format(error=str(proposal))); return
+        if proposal is None: messagebox.showinfo(self.lang.get("msg_info"), self.lang.get("msg_auto_crop_none")); return
+        # 检测结果已按宽高比扩展，填入时不再联动另一边
+        self.is_updating_dimensions = True
+        try: self.crop_w.set(str(proposal["crop_w"])); self.crop_h.set(str(proposal["crop_h"]))
+        finally: self.is_updating_dimensions = False
+        self.offset_x.set(str(proposal["offset_x"])); self.offset_y.set(str(proposal["offset_y"]))
+        self.log(self.lang.get("log_auto_crop").format(name=os.path.basename(video_path), w=proposal["crop_w"], h=proposal["crop_h"], x=proposal["offset_x"], y=proposal["offset_y"]))
+
     def on_aspect_ratio_change(self, event=None): self.on_width_change()
     def on_width_change(self, *args):
         if self.is_updating_dimensions: return
@@ -381,7 +519,8 @@ class App(tk.Tk):
     def load_mask(self):
         mask_path = filedialog.askopenfilename(title=self.lang.get("load_mask_button"), filetypes=[(self.lang.get("file_type_png"), "*.png")])
         if not mask_path: return
-        self.mask_image = Image.open(mask_path).convert("RGBA"); messagebox.showinfo(self.lang.get("msg_success"), self.lang.get("msg_mask_loaded"))
+        from PIL import Image
+        self.mask_image = Image.open(mask_path).convert("RGBA"); self.mask_path = mask_path; messagebox.showinfo(self.lang.get("msg_success"), self.lang.get("msg_mask_loaded"))
 
     def generate_preview(self):
         selected_items = self.tree.selection()
@@ -395,69 +534,83 @@ class App(tk.Tk):
             if self.debounce_job is not None: return
             messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_values_must_be_int")); return
         
-        # 使用exe所在目录存放预览文件
-        preview_file = os.path.join(get_executable_dir(), "_preview.png")
+        try: timestamp = max(0.0, float(self.preview_time.get() or 0))
+        except ValueError: timestamp = 0.0
         
-        # 只在预览文件不存在或视频路径改变时才重新提取帧
-        if not hasattr(self, '_last_preview_video') or self._last_preview_video != video_path or not os.path.exists(preview_file):
-            try: 
-                subprocess.run(['ffmpeg', '-i', video_path, '-vframes', '1', '-y', preview_file], check=True, **self.get_subprocess_args())
-                self._last_preview_video = video_path
-            except: return
+        # 解码后的帧保存在LRU缓存中，切换视频或来回拖动时间点时无需重新调用ffmpeg
+        try: bg_img = self.preview_cache.get_frame(video_path, timestamp)
+        except (OSError, ValueError, subprocess.CalledProcessError): self.debounce_job = None; return
         
-        with Image.open(preview_file) as bg_img:
-            bg_img = bg_img.convert("RGBA"); w, h = bg_img.size
-            overlay_canvas = Image.new("RGBA", bg_img.size, (0, 0, 0, 0)); draw = ImageDraw.Draw(overlay_canvas)
-            left = (w - crop_w) / 2 + offset_x; top = (h - crop_h) / 2 + offset_y; right = left + crop_w; bottom = top + crop_h
-            if self.mask_image:
-                mask_resized = self.mask_image.resize((crop_w, crop_h), Image.Resampling.LANCZOS)
-                paste_x = int(left); paste_y = int(top)
-                overlay_canvas.paste(mask_resized, (paste_x, paste_y), mask_resized)
-            else:
-                draw.rectangle([0, 0, w, h], fill=(0, 0, 0, 128)); draw.rectangle([left, top, right, bottom], fill=(0, 0, 0, 0))
-                draw.rectangle([left, top, right, bottom], outline="red", width=2)
-            final_img = Image.alpha_composite(bg_img, overlay_canvas)
-            final_img.thumbnail((self.preview_label.winfo_width(), self.preview_label.winfo_height()))
-            self.preview_image = ImageTk.PhotoImage(final_img); self.preview_label.config(image=self.preview_image, text="")
+        # 只在预览坐标系中重绘裁剪框/蒙版，底图和缩放后的蒙版都已缓存
+        base_img = self.get_preview_base(bg_img); w, h = base_img.size
+        scale = w / bg_img.width
+        left = ((bg_img.width - crop_w) / 2 + offset_x) * scale; top = ((bg_img.height - crop_h) / 2 + offset_y) * scale
+        right = left + crop_w * scale; bottom = top + crop_h * scale
+        # Pillow 在第一次预览时才导入，缩短程序启动时间
+        from PIL import Image, ImageDraw, ImageTk
+        overlay_canvas = Image.new("RGBA", base_img.size, (0, 0, 0, 0)); draw = ImageDraw.Draw(overlay_canvas)
+        if self.mask_image:
+            mask_resized = self.get_preview_mask(crop_w, crop_h, scale)
+            paste_x = int(left); paste_y = int(top)
+            overlay_canvas.paste(mask_resized, (paste_x, paste_y), mask_resized)
+        else:
+            draw.rectangle([0, 0, w, h], fill=(0, 0, 0, 128)); draw.rectangle([left, top, right, bottom], fill=(0, 0, 0, 0))
+            draw.rectangle([left, top, right, bottom], outline="red", width=2)
+        final_img = Image.alpha_composite(base_img, overlay_canvas)
+        self.preview_image = ImageTk.PhotoImage(final_img); self.preview_label.config(image=self.preview_image, text="")
         self.debounce_job = None
         
+    def get_preview_base(self, bg_img):
+        """返回缩放到预览区域大小的底图，同一帧和同一预览区域大小只缩放一次"""
+        label_size = (self.preview_label.winfo_width(), self.preview_label.winfo_height())
+        cached = getattr(self, "_preview_base", None)
+        if cached is None or cached[0] is not bg_img or cached[1] != label_size:
+            base_img = bg_img.copy(); base_img.thumbnail(label_size)
+            self._preview_base = cached = (bg_img, label_size, base_img)
+        return cached[2]
+
+    def get_preview_mask(self, crop_w, crop_h, scale):
+        """返回按裁剪尺寸缩放到预览坐标系的蒙版，每个 (crop_w, crop_h) 只缩放一次"""
+        mask_size = (max(1, round(crop_w * scale)), max(1, round(crop_h * scale)))
+        cached = getattr(self, "_preview_mask", None)
+        if cached is None or cached[0] is not self.mask_image or cached[1] != (crop_w, crop_h, mask_size):
+            from PIL import Image
+            mask_resized = self.mask_image.resize(mask_size, Image.Resampling.LANCZOS)
+            self._preview_mask = cached = (self.mask_image, (crop_w, crop_h, mask_size), mask_resized)
+        return cached[2]
+
     def start_processing_thread(self):
+        if not self.video_queue:
+            messagebox.showinfo(self.lang.get("msg_info"), self.lang.get("msg_queue_empty"))
+            return
+        try:
+            options = {"do_reduce": self.do_reduce_var.get(), "do_crop": self.do_crop_var.get(), "do_photoshop": self.do_photoshop_var.get(), "do_resize": self.do_resize_var.get(), "do_atlas": self.do_atlas_var.get(),
+                       "frame_step": int(self.frame_step.get()), "final_w": int(self.final_w.get()), "final_h": int(self.final_h.get()), "resize_engine": self.resize_engine.get(),
+                       "decimation": self.decimation_mode.get(), "scene_threshold": float(self.scene_threshold.get()),
+                       "mask_path": self.mask_path if self.apply_mask_var.get() else None}
+        except ValueError: messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_values_must_be_int")); return
+        self.stop_requested.clear()
+        self.toggle_buttons(enabled=False)
+        self.pipeline = Pipeline(self.settings, options, self.lang, self.stop_requested, log=self.log, progress=self.update_progress, status=self.set_video_status)
         processing_thread = threading.Thread(target=self.process_queue, daemon=True); processing_thread.start()
 
     def process_queue(self):
-        self.stop_requested.clear()
-        self.toggle_buttons(enabled=False)
-        if not self.video_queue: 
-            messagebox.showinfo(self.lang.get("msg_info"), self.lang.get("msg_queue_empty"))
-            self.toggle_buttons(enabled=True)
-            return
-        
-        total_videos = len(self.video_queue)
-        self.log(self.lang.get("log_start_processing").format(total=total_videos))
-        
         try:
-            for idx, video_data in enumerate(self.video_queue, 1):
-                if self.stop_requested.is_set():
-                    self.log(self.lang.get("msg_task_interrupted"))
-                    messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_task_interrupted"))
-                    break
-                
-                self.log(f"\n{'='*50}")
-                self.log(self.lang.get("log_processing_video").format(current=idx, total=total_videos, name=os.path.basename(video_data['path'])))
-                self.log(f"{'='*50}")
-                self.process_video(video_data)
-            
-            if not self.stop_requested.is_set():
-                self.log("\n" + self.lang.get("log_all_complete"))
+            if self.pipeline.run_queue(self.video_queue):
                 self.update_progress(100, 100, self.lang.get("status_complete"))
-                messagebox.showinfo(self.lang.get("msg_success"), self.lang.get("msg_all_done"))
+                self.call_in_ui(lambda: messagebox.showinfo(self.lang.get("msg_success"), self.lang.get("msg_all_done")))
+            else:
+                self.call_in_ui(lambda: messagebox.showwarning(self.lang.get("msg_warning"), self.lang.get("msg_task_interrupted")))
         except Exception as e: 
             self.log(self.lang.get("log_error").format(error=str(e)))
-            messagebox.showerror(self.lang.get("msg_error"), self.lang.get("msg_process_error").format(e=e))
+            self.call_in_ui(lambda error=e: messagebox.showerror(self.lang.get("msg_error"), self.lang.get("msg_process_error").format(e=error)))
         finally: 
-            self.toggle_buttons(enabled=True)
-            if not self.stop_requested.is_set():
-                self.update_progress(0, 100, self.lang.get("status_ready"))
+            # 在对话框关闭之后再恢复按钮和进度
+            def finish():
+                self.toggle_buttons(enabled=True)
+                if not self.stop_requested.is_set():
+                    self.update_progress(0, 100, self.lang.get("status_ready"))
+            self.call_in_ui(finish)
 
     def toggle_buttons(self, enabled=True):
         state = "normal" if enabled else "disabled"
@@ -465,191 +618,18 @@ class App(tk.Tk):
             self.start_button.pack(side="right", padx=5); self.stop_button.pack_forget()
         else:
             self.start_button.pack_forget(); self.stop_button.config(text="停止", state="normal"); self.stop_button.pack(side="right", padx=5)
-        for btn in [self.add_button, self.remove_button, self.preview_button, self.apply_button, self.load_mask_button, self.use_video_name_prefix_check, self.use_video_name_folder_check]: btn.config(state=state)
-
-    def get_subprocess_args(self):
-        """获取subprocess参数，在Windows下隐藏命令行窗口"""
-        args = {"capture_output": True, "text": True, "encoding": "utf-8"}
-        # 在Windows下隐藏命令行窗口
-        if sys.platform == "win32":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-            args["startupinfo"] = startupinfo
-            args["creationflags"] = subprocess.CREATE_NO_WINDOW
-        return args
-    
-    def create_jsx_for_run(self, template_path, run_path, input_dir, output_dir, prefix):
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f: template_content = f.read()
-            content = template_content.replace("PLACEHOLDER_PREFIX", prefix)
-            content = content.replace("PLACEHOLDER_INPUT", input_dir.replace(os.sep, "/"))
-            content = content.replace("PLACEHOLDER_OUTPUT", output_dir.replace(os.sep, "/"))
-            with open(run_path, 'w', encoding='utf-8') as f: f.write(content)
-        except FileNotFoundError: messagebox.showerror(self.lang.get("msg_error"), self.lang.get("msg_jsx_not_found")); raise
+        for btn in [self.add_button, self.remove_button, self.preview_button, self.apply_button, self.auto_crop_button, self.load_mask_button, self.apply_mask_check, self.use_video_name_prefix_check, self.use_video_name_folder_check]: btn.config(state=state)
 
     def request_stop(self):
         self.log(self.lang.get("msg_user_stop"))
         self.stop_requested.set()
         self.stop_button.config(text=self.lang.get("status_processing") + "...", state="disabled")
 
-    def process_video(self, video_data):
-        video_path = video_data["path"]; offset_x = video_data["offset_x"]; offset_y = video_data["offset_y"]
-        crop_w = video_data["crop_w"]; crop_h = video_data["crop_h"]; prefix = video_data["prefix"]; out_folder = video_data["out_folder"]
-        target_w = int(self.final_w.get()); target_h = int(self.final_h.get()); frame_step = int(self.frame_step.get())
-        
-        self.log(self.lang.get("log_start_video").format(name=os.path.basename(video_path))); project_dir = get_executable_dir(); 
-        main_output_dir = os.path.join(project_dir, "output"); os.makedirs(main_output_dir, exist_ok=True)
-        video_specific_dir = os.path.join(main_output_dir, out_folder); 
-        if os.path.exists(video_specific_dir): shutil.rmtree(video_specific_dir); os.makedirs(video_specific_dir)
-        
-        current_path = video_path
-        
-        if self.do_reduce_var.get():
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step1_reduce").format(step=frame_step))
-            self.update_progress(1, 4, self.lang.get("progress_step1").format(step=frame_step))
-            step1_dir = os.path.join(video_specific_dir, "1_reduced_frames"); os.makedirs(step1_dir)
-            ffmpeg_filter = f"select='not(mod(n,{frame_step}))',setpts=N/FRAME_RATE/TB"
-            subprocess.run(['ffmpeg', '-i', current_path, '-vf', ffmpeg_filter, '-vsync', 'vfr', f'{step1_dir}/frame_%04d.png'], check=True, **self.get_subprocess_args())
-            current_path = step1_dir
-        else:
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step1_all"))
-            self.update_progress(1, 4, self.lang.get("progress_step1_all"))
-            step1_dir = os.path.join(video_specific_dir, "1_all_frames"); os.makedirs(step1_dir)
-            subprocess.run(['ffmpeg', '-i', current_path, f'{step1_dir}/frame_%04d.png'], check=True, **self.get_subprocess_args())
-            current_path = step1_dir
-        
-        if self.do_crop_var.get():
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step2_crop"))
-            self.update_progress(2, 4, self.lang.get("progress_step2"))
-            step2_dir = os.path.join(video_specific_dir, "2_cropped_frames"); os.makedirs(step2_dir)
-            files = [f for f in os.listdir(current_path) if f.endswith(".png")]
-            for idx, filename in enumerate(files, 1):
-                if self.stop_requested.is_set(): return
-                input_file = os.path.join(current_path, filename); output_file = os.path.join(step2_dir, filename)
-                # 使用 PIL 进行裁剪，支持超出边界时用透明像素填充
-                with Image.open(input_file) as img:
-                    img_w, img_h = img.size
-                    # 计算裁剪框在原图中的位置
-                    left = (img_w - crop_w) // 2 + offset_x
-                    top = (img_h - crop_h) // 2 + offset_y
-                    right = left + crop_w
-                    bottom = top + crop_h
-                    
-                    # 创建一个透明背景的新图像
-                    if img.mode == 'RGBA':
-                        result = Image.new('RGBA', (crop_w, crop_h), (0, 0, 0, 0))
-                    else:
-                        result = Image.new('RGBA', (crop_w, crop_h), (0, 0, 0, 0))
-                        img = img.convert('RGBA')
-                    
-                    # 计算原图在结果图中的粘贴位置
-                    paste_left = max(0, -left)
-                    paste_top = max(0, -top)
-                    
-                    # 计算从原图中裁剪的区域
-                    crop_left = max(0, left)
-                    crop_top = max(0, top)
-                    crop_right = min(img_w, right)
-                    crop_bottom = min(img_h, bottom)
-                    
-                    # 如果裁剪区域有效，则裁剪并粘贴
-                    if crop_right > crop_left and crop_bottom > crop_top:
-                        cropped = img.crop((crop_left, crop_top, crop_right, crop_bottom))
-                        result.paste(cropped, (paste_left, paste_top))
-                    
-                    result.save(output_file, 'PNG')
-                
-                if idx % 10 == 0:
-                    self.update_progress(2, 4, self.lang.get("progress_step2_detail").format(current=idx, total=len(files)))
-            current_path = step2_dir
-
-        if self.do_photoshop_var.get():
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step3_ps"))
-            self.update_progress(3, 4, self.lang.get("progress_step3"))
-            step3_dir = os.path.join(video_specific_dir, "3_transparent_temp"); os.makedirs(step3_dir)
-            jsx_template_path = resource_path('run_action_template.jsx'); jsx_run_path = os.path.join(project_dir, '_tmp_run_action.jsx')
-            signal_file = os.path.join(project_dir, 'photoshop_done.tmp'); 
-            if os.path.exists(signal_file): os.remove(signal_file)
-            self.create_jsx_for_run(jsx_template_path, jsx_run_path, current_path, step3_dir, prefix)
-            # 启动Photoshop时也隐藏窗口
-            popen_args = {}
-            if sys.platform == "win32":
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-                popen_args["startupinfo"] = startupinfo
-                popen_args["creationflags"] = subprocess.CREATE_NO_WINDOW
-            ps_process = subprocess.Popen([self.settings['photoshop_exe'], jsx_run_path], **popen_args)
-            self.log(self.lang.get("log_step3_waiting"))
-            wait_count = 0
-            while not os.path.exists(signal_file):
-                if self.stop_requested.is_set():
-                    self.log(self.lang.get("log_step3_stop"))
-                    ps_process.terminate()
-                    break
-                time.sleep(2)
-                wait_count += 1
-                if wait_count % 5 == 0:
-                    self.update_progress(3, 4, self.lang.get("progress_step3_detail").format(seconds=wait_count*2))
-                if ps_process.poll() is not None: raise RuntimeError(self.lang.get("msg_ps_terminated").format(video_name=out_folder))
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step3_done")); os.remove(signal_file)
-            ps_process.terminate(); ps_process.wait(timeout=5); self.log(self.lang.get("log_step3_closed"))
-            current_path = step3_dir
-
-        if self.do_resize_var.get():
-            if self.stop_requested.is_set(): return
-            self.log(self.lang.get("log_step4_resize").format(w=target_w, h=target_h))
-            self.update_progress(4, 4, self.lang.get("progress_step4"))
-            step4_dir = os.path.join(video_specific_dir, "4_final_output"); os.makedirs(step4_dir)
-            files = [f for f in os.listdir(current_path) if f.endswith(".png")]
-            for idx, filename in enumerate(files, 1):
-                if self.stop_requested.is_set(): return
-                input_file = os.path.join(current_path, filename); output_file = os.path.join(step4_dir, filename)
-                subprocess.run(['magick', input_file, '-resize', f'{target_w}x{target_h}', output_file], check=True, **self.get_subprocess_args())
-                if idx % 10 == 0:
-                    self.update_progress(4, 4, self.lang.get("progress_step4_detail").format(current=idx, total=len(files)))
-            current_path = step4_dir
-
-        self.log(self.lang.get("log_video_complete").format(name=os.path.basename(video_path), path=current_path))
-        
-        # 如果启用了清理临时文件选项
-        if self.settings.get("clean_temp_files", False):
-            self.log(self.lang.get("log_cleaning_temp"))
-            
-            # 将最终输出文件移动到视频文件夹根目录
-            final_output_root = video_specific_dir
-            if current_path != final_output_root:
-                # 移动所有最终输出文件到根目录
-                for filename in os.listdir(current_path):
-                    if filename.endswith(".png"):
-                        src = os.path.join(current_path, filename)
-                        dst = os.path.join(final_output_root, filename)
-                        shutil.move(src, dst)
-                
-                self.log(self.lang.get("log_moved_final").format(path=final_output_root))
-            
-            # 删除所有临时文件夹
-            temp_dirs = [
-                os.path.join(video_specific_dir, "1_reduced_frames"),
-                os.path.join(video_specific_dir, "1_all_frames"),
-                os.path.join(video_specific_dir, "2_cropped_frames"),
-                os.path.join(video_specific_dir, "3_transparent_temp"),
-                os.path.join(video_specific_dir, "4_final_output")
-            ]
-            
-            for temp_dir in temp_dirs:
-                if os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir)
-            
-            self.log(self.lang.get("log_cleaned_temp"))
-
 if __name__ == "__main__":
+    # 打包后的exe使用进程池时需要
+    multiprocessing.freeze_support()
     app_settings = load_settings()
     app = App(app_settings)
+    # benchmarks/bench_startup.py 测量启动时间：界面第一次空闲时立即退出
+    if "--startup-probe" in sys.argv[1:]: app.after_idle(app.destroy)
     app.mainloop()
\ No newline at end of file
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('run_action_template.jsx', '.')],
-    hiddenimports=[],
+    hiddenimports=['numpy', 'PIL.Image'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,2402 @@
+"""视频帧处理流水线（不依赖Tk） / GUI-independent frame processing pipeline
+
+main.py 的图形界面和命令行都通过这里的 Pipeline 处理视频队列。
+The Tk front end (main.py) and the command line both drive the video queue through Pipeline.
+
+命令行用法 / Command line usage:
+    python -m pipeline manifest.json [--steps reduce,crop,photoshop,resize] [--frame-step 3] [--size 128x128]
+"""
+import argparse
+import os
+import sys
+import subprocess
+import shutil
+import threading
+import time
+import json
+import re
+import csv
+import io
+import hashlib
+import importlib
+import multiprocessing
+import tempfile
+import traceback
+import errno
+import math
+import bisect
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+class LazyModule:
+    """第一次访问属性时才导入的模块"""
+    def __init__(self, name):
+        self._name = name; self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None: self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+# numpy 和 Pillow 的导入占启动时间的大部分，图形界面启动时用不到，第一次处理帧时才导入（打包时见 main.spec 的 hiddenimports）
+np = LazyModule("numpy")
+Image = LazyModule("PIL.Image")
+
+# 获取资源文件的正确路径（支持打包后的环境）
+def resource_path(relative_path):
+    """获取资源文件的绝对路径，兼容开发环境和PyInstaller打包后的环境"""
+    try:
+        # PyInstaller创建临时文件夹，将路径存储在_MEIPASS中
+        base_path = sys._MEIPASS
+    except Exception:
+        # 开发环境下使用当前文件所在目录
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, relative_path)
+
+# 获取exe所在目录（用于输出文件）
+def get_executable_dir():
+    """获取exe文件所在的目录，兼容开发环境和打包后的环境"""
+    if getattr(sys, 'frozen', False):
+        # 打包后的环境：返回exe所在目录
+        return os.path.dirname(sys.executable)
+    else:
+        # 开发环境：返回脚本所在目录
+        return os.path.dirname(os.path.abspath(__file__))
+
+# --- Global Settings and Defaults ---
+SETTINGS_FILE = "settings.json"
+DEFAULT_SETTINGS = {
+    "photoshop_exe": r"C:\Program Files\Adobe\Adobe Photoshop 2025\Photoshop.exe",
+    "language": "zh",
+    "frame_step": "3",
+    "crop_w": "256",
+    "crop_h": "256",
+    "final_w": "128",
+    "final_h": "128",
+    "geometry": "1000x750",
+    "clean_temp_files": False,
+    "eager_cleanup": False,
+    "disk_space_check": False,
+    "streaming_mode": False,
+    "pipeline_overlap": False,
+    "pipeline_queue_frames": "8",
+    "ffmpeg_filtergraph": False,
+    "resize_engine": "mogrify",
+    "parallel_videos": "1",
+    "parallel_ffmpeg": "2",
+    "segment_extraction": False,
+    "photoshop_batch_mode": False,
+    "transparency_backend": "photoshop",
+    "key_color": "#00ff00",
+    "auto_crop_threshold": "25",
+    "auto_crop_margin": "10",
+    "crop_tracking": False,
+    "crop_smoothing": "15",
+    "key_threshold": "60",
+    "key_feather": "30",
+    "decimation_mode": "fixed",
+    "scene_threshold": "2",
+    "atlas_layout": "grid",
+    "atlas_trim": False,
+    "atlas_max_size": "4096",
+    "atlas_padding": "1",
+    "intermediate_profile": "png_fast",
+    "final_profile": "png",
+    "frame_store": False,
+    "run_report": True,
+    "show_fps": False,
+    "stage_cache": True,
+    "stage_cache_limit_mb": "0"
+}
+
+# --- Language and Settings Loaders ---
+def load_settings():
+    """Loads settings, and if the file is missing or incomplete, complements it with default values."""
+    if not os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(DEFAULT_SETTINGS, f, indent=4)
+        return DEFAULT_SETTINGS
+    
+    try:
+        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            loaded_settings = json.load(f)
+        
+        # Key Fix: Ensure all default keys exist, add them if missing.
+        for key, value in DEFAULT_SETTINGS.items():
+            if key not in loaded_settings:
+                loaded_settings[key] = value
+        
+        return loaded_settings
+    except (json.JSONDecodeError, FileNotFoundError):
+        return DEFAULT_SETTINGS
+
+def save_settings(settings):
+    with open(SETTINGS_FILE, 'w', encoding='utf-8') as f: json.dump(settings, f, indent=4)
+
+def load_language(lang_code):
+    lang_file = f"lang_{lang_code}.json"
+    # 命令行可能在其他目录中运行，此时使用程序自带的语言文件
+    if not os.path.exists(lang_file): lang_file = resource_path(lang_file)
+    if not os.path.exists(lang_file): lang_file = resource_path("lang_en.json") # Fallback to English
+    with open(lang_file, 'r', encoding='utf-8') as f: return json.load(f)
+
+# --- Frame Pipeline Helpers ---
+def get_popen_args():
+    """获取Popen参数，在Windows下隐藏命令行窗口"""
+    args = {}
+    if sys.platform == "win32":
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+        args["startupinfo"] = startupinfo
+        args["creationflags"] = subprocess.CREATE_NO_WINDOW
+    return args
+
+def probe_video_size(video_path):
+    """用ffprobe读取视频第一条视频流的宽高"""
+    result = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height', '-of', 'csv=p=0:s=x', video_path],
+                            check=True, capture_output=True, text=True, encoding="utf-8", **get_popen_args())
+    w, h = result.stdout.strip().splitlines()[0].split("x")[:2]
+    return int(w), int(h)
+
+def build_filtergraph(src_w, src_h, frame_step=1, crop=None, scale=None, start=0, keep=None):
+    """生成在ffmpeg中一次完成抽帧、裁剪（含透明填充）和缩放的滤镜链
+
+    crop 为 (crop_w, crop_h, offset_x, offset_y)，语义与 crop_frame 相同；scale 为 (target_w, target_h)；
+    start 为续传时跳过的已输出帧数，keep 为自适应抽帧保留的帧号（见 select_filter）。
+    """
+    filters = []
+    if select_filter(frame_step, start, keep):
+        filters.append(select_filter(frame_step, start, keep))
+    filters.append("format=rgba")
+    w, h = src_w, src_h
+    if crop is not None:
+        crop_w, crop_h, offset_x, offset_y = crop
+        left = (src_w - crop_w) // 2 + offset_x
+        top = (src_h - crop_h) // 2 + offset_y
+        # 裁剪框超出画面的部分先用透明像素填充，再裁剪
+        pad_left = max(0, -left); pad_top = max(0, -top)
+        pad_right = max(0, left + crop_w - src_w); pad_bottom = max(0, top + crop_h - src_h)
+        if pad_left or pad_top or pad_right or pad_bottom:
+            filters.append(f"pad={src_w + pad_left + pad_right}:{src_h + pad_top + pad_bottom}:{pad_left}:{pad_top}:color=black@0")
+        filters.append(f"crop={crop_w}:{crop_h}:{left + pad_left}:{top + pad_top}")
+        w, h = crop_w, crop_h
+    if scale is not None:
+        new_w, new_h = fit_size(w, h, *scale)
+        if (new_w, new_h) != (w, h):
+            filters.append(f"scale={new_w}:{new_h}:flags=lanczos")
+    return ",".join(filters)
+
+def decimated_frames(video_path, do_reduce, frame_step=1, decimation="fixed", scene_threshold=None):
+    """步骤1保留的帧对应的 (frame_step, keep)：自适应抽帧时先分析出要保留的帧号，自动裁剪据此只分析运行中实际保留的帧"""
+    if not do_reduce: return 1, None
+    if decimation == "adaptive": return frame_step, adaptive_keep_indices(video_path, scene_threshold)[0]
+    return frame_step, None
+
+def select_filter(frame_step=1, start=0, keep=None):
+    """抽帧用的select滤镜：每 frame_step 帧取一帧，并跳过前 start 个已输出的帧；无需筛选时返回None
+
+    keep 为自适应抽帧得到的帧号列表，此时忽略 frame_step，连续的帧号合并为 between() 区间。
+    """
+    if keep is not None:
+        ranges = []
+        for n in keep[start:]:
+            if ranges and ranges[-1][1] == n - 1: ranges[-1][1] = n
+            else: ranges.append([n, n])
+        terms = [f"eq(n,{a})" if a == b else f"between(n,{a},{b})" for a, b in ranges]
+        return f"select='{'+'.join(terms) or '0'}',setpts=N/FRAME_RATE/TB"
+    terms = []
+    if frame_step > 1: terms.append(f"not(mod(n,{frame_step}))")
+    if start > 0: terms.append(f"gte(n,{start * frame_step})")
+    if not terms: return None
+    return f"select='{'*'.join(terms)}',setpts=N/FRAME_RATE/TB"
+
+# 超过该长度的滤镜写入脚本文件传给ffmpeg（Windows命令行长度有限）
+FILTER_SCRIPT_THRESHOLD = 4000
+
+@contextmanager
+def video_filter_args(ffmpeg_filter):
+    """返回传给ffmpeg的视频滤镜参数；滤镜过长（例如自适应抽帧的帧号列表）时使用临时脚本文件"""
+    if not ffmpeg_filter:
+        yield []
+        return
+    if len(ffmpeg_filter) <= FILTER_SCRIPT_THRESHOLD:
+        yield ['-vf', ffmpeg_filter]
+        return
+    fd, script_path = tempfile.mkstemp(prefix="ffmpeg_filter_", suffix=".txt")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(ffmpeg_filter)
+        yield ['-filter_script:v', script_path]
+    finally:
+        os.remove(script_path)
+
+def iter_raw_frames(cmd, frame_size):
+    """运行输出rawvideo到stdout的ffmpeg命令，逐帧返回原始字节"""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **get_popen_args())
+    finished = False
+    try:
+        while True:
+            buf = proc.stdout.read(frame_size)
+            if len(buf) < frame_size: break
+            yield buf
+        finished = True
+    finally:
+        if not finished:
+            # 被提前关闭（例如用户停止）时直接结束ffmpeg
+            proc.kill()
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode("utf-8", errors="replace"); proc.stderr.close()
+        returncode = proc.wait()
+        if finished and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr)
+
+def iter_video_frames(video_path, frame_step=1, start=0, keep=None, raw=False):
+    """通过rawvideo管道从单个ffmpeg进程中逐帧读取RGBA图像（不落盘）；raw 为True时返回每帧的原始字节"""
+    w, h = probe_video_size(video_path)
+    with video_filter_args(select_filter(frame_step, start, keep)) as filter_args:
+        cmd = ['ffmpeg', '-v', 'error', '-i', video_path] + filter_args
+        if filter_args: cmd += ['-vsync', 'vfr']
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'rgba', '-']
+        frames = iter_raw_frames(cmd, w * h * 4)
+        try:
+            for buf in frames: yield buf if raw else Image.frombytes("RGBA", (w, h), buf)
+        finally:
+            frames.close()
+
+# 流水线重叠执行时相邻阶段之间最多缓存的帧数（内存上限 ≈ 阶段数 × 该值 × 每帧大小）
+PIPELINE_QUEUE_FRAMES = 8
+_QUEUE_END = object()
+
+def overlap_stages(source, stages, queue_frames=PIPELINE_QUEUE_FRAMES, stop_requested=None):
+    """让 source 的迭代和 stages 中的每个逐帧函数分别在各自的线程中并行执行，按顺序返回最后一个阶段的结果
+
+    相邻阶段之间是最多 queue_frames 帧的有界队列，较快的阶段被较慢的阶段阻塞，总耗时接近最慢的阶段而不是各阶段之和。
+    source 在生产者线程中迭代，结束时在该线程中关闭。stop_requested 被设置时提前结束（调用方需自行检查），
+    任一阶段出错时其它线程尽快退出，异常在调用方线程中重新抛出。
+    """
+    abort = threading.Event(); errors = []
+    queues = [queue.Queue(maxsize=queue_frames) for _ in range(len(stages) + 1)]
+
+    def stopped():
+        return abort.is_set() or (stop_requested is not None and stop_requested.is_set())
+
+    def put(q, item):
+        # 带超时地等待，以便在停止时不会一直阻塞在已满的队列上
+        while not stopped():
+            try: q.put(item, timeout=0.1); return True
+            except queue.Full: pass
+        return False
+
+    def get(q):
+        while not stopped():
+            try: return q.get(timeout=0.1)
+            except queue.Empty: pass
+        return _QUEUE_END
+
+    def produce():
+        try:
+            for frame in source:
+                if not put(queues[0], frame): return
+            put(queues[0], _QUEUE_END)
+        except BaseException as e:
+            errors.append(e); abort.set()
+        finally:
+            source.close()
+
+    def work(func, q_in, q_out):
+        try:
+            while True:
+                frame = get(q_in)
+                if frame is _QUEUE_END: break
+                if not put(q_out, func(frame)): return
+            put(q_out, _QUEUE_END)
+        except BaseException as e:
+            errors.append(e); abort.set()
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=work, args=(func, queues[i], queues[i + 1]), daemon=True) for i, func in enumerate(stages)]
+    for thread in threads: thread.start()
+    try:
+        while True:
+            frame = get(queues[-1])
+            if frame is _QUEUE_END: break
+            yield frame
+    finally:
+        abort.set()
+        for thread in threads: thread.join()
+    if errors: raise errors[0]
+
+# --- Adaptive Decimation ---
+# fixed = 每N帧取一帧；adaptive = 只保留与上一保留帧差异足够大的帧
+DECIMATION_MODES = ("fixed", "adaptive")
+# 计算帧间差异时先把画面缩小到该宽度的灰度图
+ANALYSIS_WIDTH = 64
+
+def adaptive_keep_indices(video_path, threshold):
+    """返回 (要保留的帧号列表, 总帧数)
+
+    每帧缩小为灰度图后与上一个保留帧比较平均绝对差（0-255），不小于 threshold 时保留。第一帧总是保留。
+    """
+    src_w, src_h = probe_video_size(video_path)
+    w = min(ANALYSIS_WIDTH, src_w); h = max(1, round(src_h * w / src_w))
+    cmd = ['ffmpeg', '-v', 'error', '-i', video_path, '-vf', f"scale={w}:{h}:flags=area,format=gray", '-f', 'rawvideo', '-pix_fmt', 'gray', '-']
+    kept = []; last = None; total = 0
+    for n, buf in enumerate(iter_raw_frames(cmd, w * h)):
+        frame = np.frombuffer(buf, dtype=np.uint8).astype(np.int16)
+        if last is None or np.abs(frame - last).mean() >= threshold:
+            kept.append(n); last = frame
+        total = n + 1
+    return kept, total
+
+# --- Segment-Parallel Extraction ---
+# 分段并行提取：在关键帧处把长视频切成几段，每段由一个ffmpeg进程直接定位到该关键帧开始解码，
+# 各段的输出帧号按全局帧序号换算，拼起来与单个ffmpeg进程输出的 frame_%04d 序列完全一致
+# 短于该时长（秒）的视频不分段
+SEGMENT_MIN_SECONDS = 20
+
+def probe_keyframes(video_path):
+    """用ffprobe扫描视频流的数据包（不解码），返回 (关键帧的帧序号, 关键帧的时间, 总帧数, 文件起始时间, 时长)
+
+    帧序号是按显示时间排序后的位置，与 select 滤镜中的 n 一致；跳过被编辑列表丢弃的数据包。
+    """
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags:format=start_time', '-of', 'csv', video_path]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True, encoding="utf-8", **get_popen_args())
+    packets = []; start_time = 0.0
+    for line in result.stdout.splitlines():
+        fields = line.split(",")
+        if fields[0] == "format" and len(fields) > 1 and fields[1] not in ("", "N/A"): start_time = float(fields[1])
+        elif fields[0] == "packet" and len(fields) > 2 and fields[1] not in ("", "N/A") and "D" not in fields[2]:
+            packets.append((float(fields[1]), "K" in fields[2]))
+    packets.sort()
+    keyframes = [n for n, (_, key) in enumerate(packets) if key]
+    duration = packets[-1][0] - packets[0][0] if packets else 0.0
+    return keyframes, [packets[n][0] for n in keyframes], len(packets), start_time, duration
+
+def plan_segments(keyframes, total, parts):
+    """在关键帧处把帧 [0, total) 分成最多 parts 段帧数接近的区间，返回 [(起始帧, 结束帧)]"""
+    cuts = [0]
+    for i in range(1, parts):
+        target = total * i / parts
+        pos = bisect.bisect_left(keyframes, target)
+        candidates = [keyframes[j] for j in (pos - 1, pos) if 0 <= j < len(keyframes)]
+        if not candidates: continue
+        cut = min(candidates, key=lambda n: abs(n - target))
+        if cut > cuts[-1]: cuts.append(cut)
+    return list(zip(cuts, cuts[1:] + [total]))
+
+def segment_frames(start, end, frame_step=1, keep=None):
+    """步骤1在帧 [start, end) 中保留的帧，返回 (保留帧之前已输出的帧数, 保留的全局帧号列表)"""
+    if keep is not None:
+        first = bisect.bisect_left(keep, start)
+        return first, keep[first:bisect.bisect_left(keep, end)]
+    first = -(-start // frame_step)
+    return first, list(range(first * frame_step, end, frame_step))
+
+def segment_select(start, frames, frame_step=1, keep=None):
+    """从帧 start 处开始解码的一段中选出 frames（全局帧号）的select滤镜；保留每一帧时返回None"""
+    if keep is not None: return select_filter(1, 0, [n - start for n in frames])
+    if frame_step <= 1: return None
+    return f"select='not(mod(n+{start},{frame_step}))',setpts=N/FRAME_RATE/TB"
+
+# --- Auto Crop ---
+# 自动裁剪：把步骤1会输出的帧缩小，以逐像素中值作为背景，任一颜色通道与背景的差异超过阈值的像素视为运动的主体
+# （不使用灰度图：绿幕前的红色主体与背景的亮度可能几乎相同）
+AUTOCROP_WIDTH = 128
+# 估计背景时最多使用的帧数（均匀抽取）
+AUTOCROP_BACKGROUND_FRAMES = 200
+# 某一行/列至少有这么多个主体像素才计入边界框，用于忽略零散的噪点
+AUTOCROP_MIN_PIXELS = 2
+# 逐块计算主体蒙版，限制临时数组的大小
+AUTOCROP_CHUNK = 256
+
+def analysis_frames(video_path, frame_step=1, keep=None, width=AUTOCROP_WIDTH):
+    """按与步骤1相同的抽帧方式解码缩小的RGB帧，返回 ((n, h, w, 3) 数组, 原宽, 原高)"""
+    src_w, src_h = probe_video_size(video_path)
+    w = min(width, src_w); h = max(1, round(src_h * w / src_w))
+    select = select_filter(frame_step, 0, keep)
+    scale = f"scale={w}:{h}:flags=area"
+    with video_filter_args(f"{select},{scale}" if select else scale) as filter_args:
+        cmd = ['ffmpeg', '-v', 'error', '-i', video_path] + filter_args + (['-vsync', 'vfr'] if select else []) + ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        frames = [np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3) for buf in iter_raw_frames(cmd, w * h * 3)]
+    return (np.stack(frames) if frames else np.empty((0, h, w, 3), np.uint8)), src_w, src_h
+
+def subject_boxes(frames, threshold=25):
+    """每帧主体的边界框 (n, 4)：x0, y0, x1, y1（不含 x1/y1，分析图坐标），没有主体的帧为 -1"""
+    sample = frames[np.linspace(0, len(frames) - 1, min(len(frames), AUTOCROP_BACKGROUND_FRAMES)).astype(int)]
+    background = np.median(sample, axis=0).astype(np.int16)
+    cols = []; rows = []
+    for start in range(0, len(frames), AUTOCROP_CHUNK):
+        masks = (np.abs(frames[start:start + AUTOCROP_CHUNK].astype(np.int16) - background) > threshold).any(axis=3)
+        cols.append(masks.sum(axis=1) >= AUTOCROP_MIN_PIXELS); rows.append(masks.sum(axis=2) >= AUTOCROP_MIN_PIXELS)
+    cols = np.concatenate(cols); rows = np.concatenate(rows)
+    found = cols.any(axis=1) & rows.any(axis=1)
+    boxes = np.stack([cols.argmax(axis=1), rows.argmax(axis=1),
+                      cols.shape[1] - cols[:, ::-1].argmax(axis=1), rows.shape[1] - rows[:, ::-1].argmax(axis=1)], axis=1)
+    boxes[~found] = -1
+    return boxes
+
+def crop_offsets(left, top, crop_w, crop_h, src_w, src_h):
+    """把裁剪框左上角换算为 crop_frame 使用的相对画面中心的偏移量"""
+    return left - (src_w - crop_w) // 2, top - (src_h - crop_h) // 2
+
+def propose_crop(video_path, frame_step=1, keep=None, threshold=25, margin=0.1, aspect=None):
+    """整段视频中主体的边界框（四周留 margin 比例的边距，aspect 为宽/高时扩展为该比例），
+    返回 {"crop_w", "crop_h", "offset_x", "offset_y"}；没有检测到运动时返回None"""
+    frames, src_w, src_h = analysis_frames(video_path, frame_step, keep)
+    if not len(frames): return None
+    boxes = subject_boxes(frames, threshold); boxes = boxes[boxes[:, 0] >= 0]
+    if not len(boxes): return None
+    sx = src_w / frames.shape[2]; sy = src_h / frames.shape[1]
+    x0 = boxes[:, 0].min() * sx; y0 = boxes[:, 1].min() * sy; x1 = boxes[:, 2].max() * sx; y1 = boxes[:, 3].max() * sy
+    w = (x1 - x0) * (1 + 2 * margin); h = (y1 - y0) * (1 + 2 * margin)
+    if aspect:
+        if w / h < aspect: w = h * aspect
+        else: h = w / aspect
+    crop_w = max(1, math.ceil(w)); crop_h = max(1, math.ceil(h))
+    left = round((x0 + x1 - crop_w) / 2); top = round((y0 + y1 - crop_h) / 2)
+    offset_x, offset_y = crop_offsets(left, top, crop_w, crop_h, src_w, src_h)
+    return {"crop_w": crop_w, "crop_h": crop_h, "offset_x": offset_x, "offset_y": offset_y}
+
+def smooth_track(values, window):
+    """滑动平均（两端按边缘值延伸），window 不大于1时原样返回"""
+    if window <= 1 or len(values) < 2: return values
+    padded = np.pad(values, (window // 2, window - 1 - window // 2), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+def track_crop(video_path, crop_w, crop_h, frame_step=1, keep=None, threshold=25, smoothing=15):
+    """逐帧跟踪主体：返回每个输出帧的 [offset_x, offset_y]，裁剪框中心跟随主体中心，按 smoothing 帧滑动平均
+
+    没有检测到主体的帧沿用前后帧插值的位置；裁剪框不超过画面时限制在画面之内。
+    """
+    frames, src_w, src_h = analysis_frames(video_path, frame_step, keep)
+    if not len(frames): return []
+    boxes = subject_boxes(frames, threshold); found = np.flatnonzero(boxes[:, 0] >= 0)
+    if not len(found): return [list(crop_offsets((src_w - crop_w) // 2, (src_h - crop_h) // 2, crop_w, crop_h, src_w, src_h))] * len(frames)
+    sx = src_w / frames.shape[2]; sy = src_h / frames.shape[1]
+    index = np.arange(len(frames))
+    cx = np.interp(index, found, (boxes[found, 0] + boxes[found, 2]) / 2 * sx)
+    cy = np.interp(index, found, (boxes[found, 1] + boxes[found, 3]) / 2 * sy)
+    left = np.round(smooth_track(cx, smoothing) - crop_w / 2).astype(int); top = np.round(smooth_track(cy, smoothing) - crop_h / 2).astype(int)
+    if crop_w <= src_w: left = left.clip(0, src_w - crop_w)
+    if crop_h <= src_h: top = top.clip(0, src_h - crop_h)
+    return [list(crop_offsets(int(x), int(y), crop_w, crop_h, src_w, src_h)) for x, y in zip(left, top)]
+
+# --- Encode Profiles ---
+# 帧文件的编码方式：中间步骤的文件只会被下一步读取，可以使用快速压缩或不压缩的格式；最终输出可以选择更小的文件。
+# pil 为 Image.save 的参数，ffmpeg/magick 为命令行参数，ps_compression 为 Photoshop PNGSaveOptions.compression（Photoshop 总是输出PNG）
+# TIFF/WebP 需要指定 RGB 像素格式，否则 ffmpeg 会直接写入 YUV 数据（Pillow 无法读取，或颜色转换与PNG不一致）
+ENCODE_PROFILES = {
+    "png": {"ext": ".png", "format": "PNG", "pil": {}, "ffmpeg": [], "magick": [], "ps_compression": 9},
+    "png_fast": {"ext": ".png", "format": "PNG", "pil": {"compress_level": 1}, "ffmpeg": ["-compression_level", "1"],
+                 "magick": ["-define", "png:compression-level=1"], "ps_compression": 1},
+    "png_uncompressed": {"ext": ".png", "format": "PNG", "pil": {"compress_level": 0}, "ffmpeg": ["-compression_level", "0"],
+                         "magick": ["-define", "png:compression-level=0"], "ps_compression": 0},
+    "png_optimized": {"ext": ".png", "format": "PNG", "pil": {"optimize": True}, "ffmpeg": ["-compression_level", "9", "-pred", "mixed"],
+                      "magick": ["-define", "png:compression-level=9"], "ps_compression": 9},
+    "tiff": {"ext": ".tif", "format": "TIFF", "pil": {}, "ffmpeg": ["-compression_algo", "raw", "-pix_fmt", "rgba"], "magick": ["-compress", "None"], "ps_compression": 0},
+    "webp_lossless": {"ext": ".webp", "format": "WEBP", "pil": {"lossless": True, "exact": True}, "ffmpeg": ["-c:v", "libwebp", "-lossless", "1", "-pix_fmt", "bgra"],
+                      "magick": ["-define", "webp:lossless=true"], "ps_compression": 9},
+}
+FRAME_EXTENSIONS = tuple(sorted({profile["ext"] for profile in ENCODE_PROFILES.values()}))
+
+def frame_sort_key(name):
+    """按文件名中的数字大小排序的键：超过9999帧时 frame_10000 排在 frame_9999 之后"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+def frame_number(name):
+    """帧文件名中的序号（最后一组数字），例如 frame_0012.png 为 12"""
+    return int(re.findall(r'\d+', name)[-1])
+
+def list_frames(directory):
+    """目录中按帧序号排序的帧文件（任一编码方式的扩展名）"""
+    return sorted((f for f in os.listdir(directory) if f.lower().endswith(FRAME_EXTENSIONS)), key=frame_sort_key)
+
+def frame_path(output_dir, name, profile):
+    """输出帧的路径：沿用 name 的文件名，扩展名由编码方式决定"""
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(name))[0] + ENCODE_PROFILES[profile]["ext"])
+
+def save_frame(img, path, profile="png"):
+    settings = ENCODE_PROFILES[profile]
+    img.save(path, settings["format"], **settings["pil"])
+
+def crop_frame(img, crop_w, crop_h, offset_x, offset_y):
+    """以画面中心加偏移量裁剪，超出边界的部分用透明像素填充"""
+    img_w, img_h = img.size
+    # 计算裁剪框在原图中的位置
+    left = (img_w - crop_w) // 2 + offset_x
+    top = (img_h - crop_h) // 2 + offset_y
+    right = left + crop_w
+    bottom = top + crop_h
+
+    # 创建一个透明背景的新图像
+    result = Image.new('RGBA', (crop_w, crop_h), (0, 0, 0, 0))
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+
+    # 计算原图在结果图中的粘贴位置
+    paste_left = max(0, -left)
+    paste_top = max(0, -top)
+
+    # 计算从原图中裁剪的区域
+    crop_left = max(0, left)
+    crop_top = max(0, top)
+    crop_right = min(img_w, right)
+    crop_bottom = min(img_h, bottom)
+
+    # 如果裁剪区域有效，则裁剪并粘贴
+    if crop_right > crop_left and crop_bottom > crop_top:
+        cropped = img.crop((crop_left, crop_top, crop_right, crop_bottom))
+        result.paste(cropped, (paste_left, paste_top))
+    return result
+
+# 裁剪阶段每个进程池任务处理的帧数
+CROP_BATCH_SIZE = 32
+
+def save_cropped(images, input_files, output_dir, profile="png", mask_path=None):
+    """以输入的文件名写出一批裁剪后的帧；有蒙版时先把整批帧叠成一个数组应用蒙版"""
+    if mask_path: images = [Image.fromarray(frame, "RGBA") for frame in mask_pixels(np.stack([np.asarray(img) for img in images]), mask_path)]
+    for input_file, img in zip(input_files, images): save_frame(img, frame_path(output_dir, input_file, profile), profile)
+
+def crop_batch(input_files, output_dir, crop_w, crop_h, offset_x, offset_y, profile="png", mask_path=None):
+    """裁剪一批帧并以相同文件名写入 output_dir（可在进程池中执行，输出与逐帧处理完全一致）"""
+    images = []
+    for input_file in input_files:
+        with Image.open(input_file) as img: images.append(crop_frame(img, crop_w, crop_h, offset_x, offset_y))
+    save_cropped(images, input_files, output_dir, profile, mask_path)
+
+def crop_pixels(frames, crop_w, crop_h, offset_x, offset_y, mask_path=None):
+    """crop_frame 的数组版本：一次裁剪 (n, h, w, 4) 的一批帧，超出边界的部分为透明像素；有蒙版时同时应用"""
+    img_h, img_w = frames.shape[1:3]
+    left = (img_w - crop_w) // 2 + offset_x; top = (img_h - crop_h) // 2 + offset_y
+    result = np.zeros((len(frames), crop_h, crop_w, 4), np.uint8)
+    crop_left = max(0, left); crop_top = max(0, top); crop_right = min(img_w, left + crop_w); crop_bottom = min(img_h, top + crop_h)
+    if crop_right > crop_left and crop_bottom > crop_top:
+        result[:, crop_top - top:crop_bottom - top, crop_left - left:crop_right - left] = frames[:, crop_top:crop_bottom, crop_left:crop_right]
+    return mask_pixels(result, mask_path) if mask_path else result
+
+def crop_track_batch(items, output_dir, crop_w, crop_h, profile="png", mask_path=None):
+    """按裁剪轨迹裁剪一批帧，items 为 (输入文件, offset_x, offset_y)"""
+    images = []
+    for input_file, offset_x, offset_y in items:
+        with Image.open(input_file) as img: images.append(crop_frame(img, crop_w, crop_h, offset_x, offset_y))
+    save_cropped(images, [item[0] for item in items], output_dir, profile, mask_path)
+
+def crop_track_pixels(frames, crop_w, crop_h, mask_path, offsets):
+    """crop_track_batch 的数组版本，offsets 为每帧的 (offset_x, offset_y)（由 store_batch 作为最后一个参数传入）"""
+    result = np.concatenate([crop_pixels(frames[i:i + 1], crop_w, crop_h, *offset) for i, offset in enumerate(offsets)])
+    return mask_pixels(result, mask_path) if mask_path else result
+
+# --- Mask ---
+# 蒙版：把蒙版图的alpha通道乘到每个裁剪后的帧的alpha上，蒙版透明处的像素变为透明。
+# 蒙版按裁剪尺寸缩放（与预览相同的 LANCZOS），每个进程中每个尺寸只缩放一次
+_mask_cache = {}
+
+def mask_alpha(mask_path, width, height):
+    """缩放到 width x height 的蒙版alpha通道，(h, w) uint16 数组"""
+    key = (os.path.abspath(mask_path), os.path.getmtime(mask_path), width, height)
+    alpha = _mask_cache.get(key)
+    if alpha is None:
+        with Image.open(mask_path) as img:
+            alpha = np.asarray(img.convert("RGBA").resize((width, height), Image.Resampling.LANCZOS).getchannel("A"), np.uint16)
+        _mask_cache[key] = alpha
+    return alpha
+
+def mask_pixels(frames, mask_path):
+    """把蒙版的alpha乘到 (n, h, w, 4) 一批帧的alpha通道上（四舍五入），直接修改并返回 frames"""
+    alpha = mask_alpha(mask_path, frames.shape[2], frames.shape[1])
+    frames[..., 3] = (frames[..., 3] * alpha + 127) // 255
+    return frames
+
+def mask_frame(img, mask_path):
+    """mask_pixels 的单帧版本（流式模式）"""
+    return Image.fromarray(mask_pixels(np.array(img.convert("RGBA"))[None], mask_path)[0], "RGBA")
+
+def fit_size(w, h, target_w, target_h):
+    """与ImageMagick的 -resize WxH 相同：保持宽高比缩放到目标框之内（四舍五入，最小为1）"""
+    scale = min(target_w / w, target_h / h)
+    return max(1, int(w * scale + 0.5)), max(1, int(h * scale + 0.5))
+
+def resize_frame(img, target_w, target_h):
+    new_size = fit_size(img.width, img.height, target_w, target_h)
+    if new_size == img.size: return img
+    return img.resize(new_size, Image.Resampling.LANCZOS)
+
+def resize_pixels(frames, target_w, target_h):
+    """用与 resize_frame 相同的方式缩放 (n, h, w, 4) 的一批帧"""
+    return np.stack([np.asarray(resize_frame(Image.fromarray(frame, "RGBA"), target_w, target_h)) for frame in frames])
+
+# 缩放引擎：magick = 每帧启动一次magick（旧行为），mogrify = 每批帧一次 magick mogrify，pillow = 进程内缩放
+RESIZE_ENGINES = ("magick", "mogrify", "pillow")
+RESIZE_BATCH_SIZE = 64
+
+def resize_batch(input_files, output_dir, target_w, target_h, engine="mogrify", profile="png"):
+    """把一批帧缩放到 target_w x target_h 的框内并以相同文件名写入 output_dir，返回等待 magick 的秒数"""
+    geometry = f'{target_w}x{target_h}'
+    run_args = {"check": True, "capture_output": True, "text": True, "encoding": "utf-8"}
+    run_args.update(get_popen_args())
+    encode_args = ENCODE_PROFILES[profile]["magick"]
+    started = time.perf_counter()
+    if engine == "magick":
+        for input_file in input_files:
+            subprocess.run(['magick', input_file, '-resize', geometry] + encode_args + [frame_path(output_dir, input_file, profile)], **run_args)
+    elif engine == "mogrify":
+        # -format 决定输出的扩展名
+        subprocess.run(['magick', 'mogrify', '-path', output_dir, '-format', ENCODE_PROFILES[profile]["ext"][1:], '-resize', geometry] + encode_args + list(input_files), **run_args)
+    elif engine == "pillow":
+        for input_file in input_files:
+            with Image.open(input_file) as img:
+                save_frame(resize_frame(img, target_w, target_h), frame_path(output_dir, input_file, profile), profile)
+        return 0.0
+    else:
+        raise ValueError(f"Unknown resize engine: {engine}")
+    return time.perf_counter() - started
+
+# --- Photoshop Progress Channel ---
+# JSX脚本逐行追加到进度文件中（start/frame/done/error），Python以亚秒间隔读取新增内容
+PS_PROGRESS_FILE = "photoshop_progress.tmp"
+PS_POLL_INTERVAL = 0.2
+
+def read_progress_lines(progress_file, offset):
+    """读取进度文件中 offset 之后的完整行，返回 (行列表, 新的offset)"""
+    try:
+        with open(progress_file, 'rb') as f:
+            f.seek(offset); data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    # 只消费以换行结尾的完整行，写到一半的行留到下次读取
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].decode("utf-8", errors="replace").splitlines()
+    return [line.strip() for line in lines if line.strip()], offset + end
+
+# --- Background Removal Backends ---
+# 步骤3的去背景实现：photoshop = 调用Photoshop动作，chroma_key = 进程内NumPy颜色键控
+TRANSPARENCY_BACKENDS = ("photoshop", "chroma_key")
+KEY_BATCH_SIZE = 32
+
+def parse_color(color):
+    """把 #rrggbb 转为 (r, g, b)"""
+    color = color.strip().lstrip("#")
+    if len(color) != 6: raise ValueError(f"Invalid color: {color}")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+def chroma_key_alpha(frames, key_color, threshold, feather):
+    """对 (N, H, W, 4) 的RGBA帧批量计算键控后的alpha通道
+
+    与键控色的RGB欧氏距离小于 threshold 的像素完全透明，在 threshold 到 threshold + feather 之间线性过渡。
+    """
+    rgb = frames[..., :3].astype(np.float32)
+    distance = np.sqrt(((rgb - np.asarray(key_color, dtype=np.float32)) ** 2).sum(axis=-1))
+    if feather > 0: keep = np.clip((distance - threshold) / feather, 0.0, 1.0)
+    else: keep = (distance >= threshold).astype(np.float32)
+    return (frames[..., 3].astype(np.float32) * keep + 0.5).astype(np.uint8)
+
+def chroma_key_pixels(frames, key_color, threshold, feather):
+    """对 (n, h, w, 4) 的一批帧执行颜色键控，返回替换了透明通道的副本"""
+    frames = frames.copy()
+    frames[..., 3] = chroma_key_alpha(frames, key_color, threshold, feather)
+    return frames
+
+def chroma_key_batch(file_pairs, key_color, threshold, feather, profile="png"):
+    """对一批 (输入文件, 输出文件) 执行颜色键控去背景；尺寸相同的帧堆叠为一个数组一起计算"""
+    frames = []
+    for input_file, _ in file_pairs:
+        with Image.open(input_file) as img: frames.append(np.asarray(img.convert("RGBA")))
+    groups = {}
+    for index, frame in enumerate(frames): groups.setdefault(frame.shape, []).append(index)
+    for indices in groups.values():
+        stack = np.stack([frames[i] for i in indices])
+        stack[..., 3] = chroma_key_alpha(stack, key_color, threshold, feather)
+        for frame, i in zip(stack, indices):
+            save_frame(Image.fromarray(frame, "RGBA"), file_pairs[i][1], profile)
+
+# --- Sprite Atlas ---
+# 图集布局：grid = 统一大小的格子，packed = 按高度排序的货架式装箱（裁掉透明边后帧大小不一时更紧凑）
+ATLAS_LAYOUTS = ("grid", "packed")
+
+def trim_box(alpha):
+    """alpha 中不透明像素的外接矩形 (x, y, w, h)；全透明的帧保留左上角的1个像素"""
+    rows = np.flatnonzero(alpha.any(axis=1)); cols = np.flatnonzero(alpha.any(axis=0))
+    if rows.size == 0: return 0, 0, 1, 1
+    return int(cols[0]), int(rows[0]), int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1)
+
+def atlas_frame(name, pixels, trim=False):
+    """图集中的一帧：(名称, 像素, (原宽, 原高), (x, y))，(x, y) 为去掉透明边后在原帧中的位置"""
+    source = (pixels.shape[1], pixels.shape[0]); x = y = 0
+    if trim:
+        x, y, w, h = trim_box(pixels[..., 3])
+        pixels = pixels[y:y + h, x:x + w]
+    return name, pixels, source, (x, y)
+
+def load_atlas_frames(files, trim=False):
+    """读取图片文件为图集的帧"""
+    frames = []
+    for path in files:
+        with Image.open(path) as img: frames.append(atlas_frame(os.path.splitext(os.path.basename(path))[0], np.asarray(img.convert("RGBA")), trim))
+    return frames
+
+def store_atlas_frames(store, trim=False):
+    """从帧存储中读取图集的帧（名称为导出时的文件名）"""
+    pixels = store.array()
+    return [atlas_frame(store.name(i), pixels[i], trim) for i in range(store.count)]
+
+def grid_shape(sizes, max_size, padding=0):
+    """格子布局的 (格宽, 格高, 列数, 行数)：格子大小为最大的帧加上间距，每页不超过 max_size，帧数较少时接近正方形"""
+    cell_w = max(w for w, _ in sizes) + padding; cell_h = max(h for _, h in sizes) + padding
+    cols = min(max(1, (max_size + padding) // cell_w), math.isqrt(len(sizes) - 1) + 1)
+    return cell_w, cell_h, cols, max(1, (max_size + padding) // cell_h)
+
+def grid_layout(sizes, max_size, padding=0):
+    """按格子逐行排列，返回 ([(页, x, y)], [(页宽, 页高)])"""
+    cell_w, cell_h, cols, rows = grid_shape(sizes, max_size, padding)
+    per_page = cols * rows
+    placements = [(i // per_page, i % per_page % cols * cell_w, i % per_page // cols * cell_h) for i in range(len(sizes))]
+    pages = []
+    for start in range(0, len(sizes), per_page):
+        count = min(per_page, len(sizes) - start)
+        pages.append((min(count, cols) * cell_w - padding, -(-count // cols) * cell_h - padding))
+    return placements, pages
+
+def pack_layout(sizes, max_size, padding=0):
+    """货架式装箱：按高度从高到低逐行摆放，一行放不下时换行，一页放不下时换页；返回值与 grid_layout 相同"""
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    # 行宽取总面积的平方根，使结果接近正方形
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    width = min(max_size, max(max(w for w, _ in sizes), math.isqrt(area) + 1))
+    placements = [None] * len(sizes); pages = []
+    x = y = shelf_h = page_w = page_h = 0
+    for i in order:
+        w, h = sizes[i]
+        if x and x + w > width: x = 0; y += shelf_h + padding; shelf_h = 0
+        if y and y + h > max_size:
+            pages.append((page_w, page_h)); x = y = shelf_h = page_w = page_h = 0
+        placements[i] = (len(pages), x, y)
+        x += w + padding; shelf_h = max(shelf_h, h)
+        page_w = max(page_w, x - padding); page_h = max(page_h, y + h)
+    pages.append((page_w, page_h))
+    return placements, pages
+
+def grid_canvases(frames, sizes, max_size, padding=0):
+    """把帧堆叠为 (n, 格高, 格宽, 4) 的数组，每页一次重排为整张图，不逐帧粘贴"""
+    cell_w, cell_h, cols, rows = grid_shape(sizes, max_size, padding)
+    if all(size == (cell_w, cell_h) for size in sizes):
+        stack = np.stack([pixels for _, pixels, _, _ in frames])
+    else:
+        stack = np.zeros((len(frames), cell_h, cell_w, 4), np.uint8)
+        for i, (_, pixels, _, _) in enumerate(frames): stack[i, :pixels.shape[0], :pixels.shape[1]] = pixels
+    canvases = []
+    for start in range(0, len(stack), cols * rows):
+        chunk = stack[start:start + cols * rows]
+        page_cols = min(len(chunk), cols); page_rows = -(-len(chunk) // cols)
+        if page_rows * page_cols > len(chunk):
+            chunk = np.concatenate([chunk, np.zeros((page_rows * page_cols - len(chunk),) + chunk.shape[1:], np.uint8)])
+        # (行, 列, 格高, 格宽, 4) -> (行, 格高, 列, 格宽, 4) -> 整页
+        page = chunk.reshape(page_rows, page_cols, cell_h, cell_w, 4).swapaxes(1, 2).reshape(page_rows * cell_h, page_cols * cell_w, 4)
+        canvases.append(np.ascontiguousarray(page[:page.shape[0] - padding, :page.shape[1] - padding]))
+    return canvases
+
+def packed_canvases(frames, placements, pages):
+    """按装箱结果把帧的像素数组整块复制到每页的画布中"""
+    canvases = [np.zeros((h, w, 4), np.uint8) for w, h in pages]
+    for (_, pixels, _, _), (page, x, y) in zip(frames, placements):
+        canvases[page][y:y + pixels.shape[0], x:x + pixels.shape[1]] = pixels
+    return canvases
+
+def atlas_metadata(frames, placements, pages, images, layout, padding):
+    """图集索引，采用 Phaser 3 / TexturePacker 的多图集 JSON 格式"""
+    textures = [{"image": image, "format": "RGBA8888", "size": {"w": w, "h": h}, "scale": 1, "frames": []} for image, (w, h) in zip(images, pages)]
+    for (name, pixels, (source_w, source_h), (trim_x, trim_y)), (page, x, y) in zip(frames, placements):
+        h, w = pixels.shape[:2]
+        textures[page]["frames"].append({"filename": name, "rotated": False, "trimmed": (w, h) != (source_w, source_h),
+                                         "sourceSize": {"w": source_w, "h": source_h},
+                                         "spriteSourceSize": {"x": trim_x, "y": trim_y, "w": w, "h": h},
+                                         "frame": {"x": x, "y": y, "w": w, "h": h}})
+    return {"textures": textures, "meta": {"app": "video-frame-processor", "layout": layout, "padding": padding}}
+
+def build_atlas(frames, output_dir, name, layout="grid", max_size=4096, padding=0, profile="png"):
+    """把 frames（见 atlas_frame）打包为 name_0.png, name_1.png ... 和索引 name.json，返回图集页数"""
+    if not frames: return 0
+    sizes = [(pixels.shape[1], pixels.shape[0]) for _, pixels, _, _ in frames]
+    if layout == "grid":
+        placements, pages = grid_layout(sizes, max_size, padding); canvases = grid_canvases(frames, sizes, max_size, padding)
+    elif layout == "packed":
+        placements, pages = pack_layout(sizes, max_size, padding); canvases = packed_canvases(frames, placements, pages)
+    else:
+        raise ValueError(f"Unknown atlas layout: {layout}")
+    images = []
+    for index, canvas in enumerate(canvases):
+        images.append(f"{name}_{index}{ENCODE_PROFILES[profile]['ext']}")
+        save_frame(Image.fromarray(canvas, "RGBA"), os.path.join(output_dir, images[-1]), profile)
+    with open(os.path.join(output_dir, name + ".json"), 'w', encoding='utf-8') as f:
+        json.dump(atlas_metadata(frames, placements, pages, images, layout, padding), f, indent=2)
+    return len(images)
+
+# --- Frame Store ---
+# 帧存储：一个步骤的全部帧保存在一个文件中（文件头 + 定长的RGBA帧），后续步骤通过内存映射按序号读取，
+# 不再为每帧创建、列出和打开一个图片文件。只用于逐步写盘模式中进程内执行的步骤，最终输出仍导出为图片。
+FRAME_STORE_FILE = "frames.store"
+FRAME_STORE_MAGIC = b"VFPSTORE"
+# 文件头长度；像素数据从页边界开始
+FRAME_STORE_HEADER = 4096
+
+class FrameStore:
+    """步骤目录中的帧存储：文件头为JSON（宽、高、通道数、帧数、导出时的文件名格式），之后为 count 个定长帧"""
+    def __init__(self, directory, width, height, channels=4, count=0, names="frame_{:04d}"):
+        self.directory = directory
+        self.path = os.path.join(directory, FRAME_STORE_FILE)
+        self.width = width; self.height = height; self.channels = channels
+        self.count = count
+        self.names = names
+        self.file = None
+
+    @classmethod
+    def create(cls, directory, width, height, channels=4, count=0, names="frame_{:04d}"):
+        """新建帧存储；count 大于0时预先分配这些帧的空间，供进程池中的各批按序号写入"""
+        store = cls(directory, width, height, channels, count, names)
+        with open(store.path, 'wb') as f:
+            f.write(store.header()); f.truncate(FRAME_STORE_HEADER + count * store.stride)
+        return store
+
+    @classmethod
+    def open(cls, directory):
+        """打开目录中的帧存储，不存在时返回None"""
+        path = os.path.join(directory, FRAME_STORE_FILE)
+        if not os.path.exists(path): return None
+        with open(path, 'rb') as f: header = f.read(FRAME_STORE_HEADER)
+        if not header.startswith(FRAME_STORE_MAGIC): raise ValueError(f"Not a frame store: {path}")
+        info = json.loads(header[len(FRAME_STORE_MAGIC):].decode("utf-8"))
+        return cls(directory, info["width"], info["height"], info["channels"], info["count"], info["names"])
+
+    @property
+    def stride(self):
+        return self.width * self.height * self.channels
+
+    def header(self):
+        info = {"width": self.width, "height": self.height, "channels": self.channels, "count": self.count, "names": self.names}
+        header = FRAME_STORE_MAGIC + json.dumps(info).encode("utf-8")
+        if len(header) > FRAME_STORE_HEADER: raise ValueError("frame store header is too long")
+        return header.ljust(FRAME_STORE_HEADER, b" ")
+
+    def array(self, mode="r"):
+        """(帧数, 高, 宽, 通道) 的内存映射数组，按序号读取时只访问对应的页"""
+        if self.count == 0: return np.empty((0, self.height, self.width, self.channels), np.uint8)
+        return np.memmap(self.path, dtype=np.uint8, mode=mode, offset=FRAME_STORE_HEADER, shape=(self.count, self.height, self.width, self.channels))
+
+    def name(self, index):
+        return self.names.format(index + 1)
+
+    def append(self, buf):
+        """顺序追加一帧原始字节并更新文件头中的帧数；中断时文件末尾不完整的帧不会被计入"""
+        if self.file is None: self.file = open(self.path, 'r+b')
+        self.file.seek(FRAME_STORE_HEADER + self.count * self.stride); self.file.write(buf)
+        self.count += 1
+        self.file.seek(0); self.file.write(self.header())
+
+    def close(self):
+        if self.file is not None: self.file.close(); self.file = None
+
+def store_batch(indices, input_dir, output_dir, func, args, profile=None, names=None, per_frame=None):
+    """对 input_dir 帧存储中 indices 对应的帧执行 func(帧数组, *args)（可在进程池中执行）
+
+    profile 为None时写入 output_dir 中预先分配好的帧存储，否则按 names（默认沿用输入的文件名格式）导出为图片。
+    per_frame 为逐帧的参数列表（例如裁剪轨迹）时，本批对应的部分作为 func 的最后一个参数。
+    """
+    source = FrameStore.open(input_dir)
+    if per_frame is not None: args = tuple(args) + ([per_frame[i] for i in indices],)
+    frames = func(np.asarray(source.array()[indices]), *args)
+    if profile is None:
+        target = FrameStore.open(output_dir).array("r+")
+        target[indices] = frames; target.flush()
+        return
+    for index, frame in zip(indices, frames):
+        save_frame(Image.fromarray(frame, "RGBA"), os.path.join(output_dir, (names or source.names).format(index + 1) + ENCODE_PROFILES[profile]["ext"]), profile)
+
+# --- Stage Cache ---
+# 每个步骤目录中的清单：记录目录内容对应的参数键、已完成的输入帧和最近使用时间。
+# 参数键相同时重新运行会直接复用已完成的步骤，或从中断处继续。
+STAGE_MANIFEST = ".stage.json"
+# 逐批完成的帧追加到日志中（每行一个名称），只在打开或完成步骤时合并进清单，避免每批都重写整个列表
+STAGE_JOURNAL = ".stage.done"
+# 清理临时文件时移动到视频文件夹根目录的最终输出文件列表，下次运行前只删除其中列出的文件
+FINAL_FILES = ".final_files.json"
+STAGE_DIRS = ("1_reduced_frames", "1_all_frames", "2_cropped_frames", "3_transparent_temp", "4_final_output", "5_atlas")
+
+def video_fingerprint(video_path):
+    """视频文件的标识：绝对路径、大小和修改时间，任何一项改变都会使缓存失效"""
+    st = os.stat(video_path)
+    return f"{os.path.abspath(video_path)}|{st.st_size}|{st.st_mtime_ns}"
+
+def stage_key(parent_key, stage, *params):
+    """由上一步的键、步骤名和本步骤参数计算的内容键"""
+    payload = json.dumps([parent_key, stage, params], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def read_stage_manifest(stage_dir):
+    try:
+        with open(os.path.join(stage_dir, STAGE_MANIFEST), 'r', encoding='utf-8') as f: return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，避免中断时留下不完整的JSON（例如步骤清单）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def dir_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file(follow_symlinks=False): total += entry.stat().st_size
+    return total
+
+class StageDir:
+    """一个步骤的输出目录。参数键与清单一致时保留已有内容，否则清空后重新开始
+
+    逐批处理的步骤用 pending/mark_done 跳过已完成的帧；ffmpeg等顺序输出的步骤用 resume_from 从最后一个完整帧继续。
+    key 为None时（禁用缓存）总是重新开始。
+    """
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        manifest = read_stage_manifest(path)
+        if key is not None and manifest is not None and manifest.get("key") == key:
+            self.manifest = manifest
+        else:
+            self.manifest = {"key": key}
+            self.reset()
+        self.done = set(self.manifest.get("done", [])) | self.read_journal()
+        self.save()
+
+    @property
+    def complete(self):
+        return self.manifest.get("complete", False)
+
+    def frames(self):
+        return list_frames(self.path)
+
+    def frame_count(self):
+        """已输出的帧数：图片文件，加上帧存储中的帧（逐批写入、尚未完成的帧存储按清单中已完成的帧计算）"""
+        store = FrameStore.open(self.path) if os.path.isdir(self.path) else None
+        if store is None: return len(self.frames())
+        return len(self.frames()) + (len(self.done) if self.done and not self.complete else store.count)
+
+    def reset(self):
+        """清空目录中的内容，从头开始本步骤"""
+        if os.path.exists(self.path): shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        self.manifest["complete"] = False; self.done = set()
+
+    @staticmethod
+    def frame_name(item):
+        """帧文件路径、(输入文件, 输出文件) 对或帧存储中的序号在清单中记录的名称"""
+        if isinstance(item, int): return str(item)
+        return os.path.basename(item[0] if isinstance(item, tuple) else item)
+
+    def pending(self, items):
+        """返回 items 中尚未完成的帧"""
+        return [item for item in items if self.frame_name(item) not in self.done]
+
+    def read_journal(self):
+        """日志中记录的已完成帧；中断时可能没有写完的最后一行（没有换行符）不计入"""
+        try:
+            with open(os.path.join(self.path, STAGE_JOURNAL), 'r', encoding='utf-8') as f: lines = f.read().split("\n")[:-1]
+        except FileNotFoundError:
+            return set()
+        return {line for line in lines if line}
+
+    def mark_done(self, items):
+        names = [self.frame_name(item) for item in items]
+        self.done.update(names)
+        with open(os.path.join(self.path, STAGE_JOURNAL), 'a', encoding='utf-8') as f: f.write("".join(name + "\n" for name in names))
+
+    def resume_from(self):
+        """顺序输出的步骤被中断后可以保留的帧数；序号最大的文件可能没有写完，删除后从它重新开始"""
+        frames = self.frames()
+        if not frames: return 0
+        os.remove(os.path.join(self.path, frames[-1]))
+        return frame_number(frames[-1]) - 1
+
+    def finish(self):
+        self.manifest["complete"] = True; self.done = set()
+        self.save()
+
+    def save(self):
+        self.manifest["done"] = sorted(self.done)
+        self.manifest["last_used"] = time.time()
+        write_json_atomic(os.path.join(self.path, STAGE_MANIFEST), self.manifest)
+        # 日志已合并进清单
+        journal = os.path.join(self.path, STAGE_JOURNAL)
+        if os.path.exists(journal): os.remove(journal)
+
+def mark_final_stage(video_specific_dir, final_dir):
+    """在清单中标记哪个步骤目录是该视频的最终输出（最终输出不会被缓存淘汰）"""
+    for name in STAGE_DIRS:
+        stage_dir = os.path.join(video_specific_dir, name)
+        manifest = read_stage_manifest(stage_dir)
+        if manifest is None: continue
+        manifest["final"] = os.path.abspath(stage_dir) == os.path.abspath(final_dir)
+        write_json_atomic(os.path.join(stage_dir, STAGE_MANIFEST), manifest)
+
+def remove_moved_final_files(video_specific_dir):
+    """删除上次运行清理临时文件时移动到视频文件夹根目录的最终输出（FINAL_FILES 中列出的文件），用户放在那里的其它文件不受影响"""
+    marker = os.path.join(video_specific_dir, FINAL_FILES)
+    try:
+        with open(marker, 'r', encoding='utf-8') as f: names = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    for name in names:
+        path = os.path.join(video_specific_dir, os.path.basename(name))
+        if os.path.isfile(path): os.remove(path)
+    os.remove(marker)
+
+def evict_stage_cache(output_root, limit_bytes, keep=()):
+    """输出目录中所有步骤目录的总大小超过 limit_bytes 时，按最近使用时间从旧到新删除中间步骤
+
+    最终输出和 keep 中的目录不会被删除。返回 (删除的目录数, 释放的字节数)。
+    """
+    keep = {os.path.abspath(path) for path in keep}
+    stages = []
+    for video_dir in os.scandir(output_root) if os.path.isdir(output_root) else ():
+        if not video_dir.is_dir(): continue
+        for name in STAGE_DIRS:
+            stage_dir = os.path.join(video_dir.path, name)
+            manifest = read_stage_manifest(stage_dir)
+            if manifest is None: continue
+            stages.append((manifest.get("last_used", 0), dir_size(stage_dir), stage_dir, manifest.get("final", False)))
+    total = sum(size for _, size, _, _ in stages)
+    removed = freed = 0
+    for _, size, stage_dir, final in sorted(stages):
+        if total <= limit_bytes: break
+        if final or os.path.abspath(stage_dir) in keep: continue
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        total -= size; removed += 1; freed += size
+    return removed, freed
+
+# --- Disk Space ---
+# 运行前估算需要的磁盘空间。压缩后的帧大小无法预知，按相对于未压缩RGBA的比例估算（偏保守，实际大小可用 benchmarks/bench_encode.py 测量）
+ESTIMATE_SIZE_RATIOS = {"png": 0.6, "png_fast": 0.7, "png_uncompressed": 1.0, "png_optimized": 0.55, "tiff": 1.0, "webp_lossless": 0.45, FRAME_STORE_FILE: 1.0}
+# 估算值之外额外保留的比例
+DISK_SPACE_MARGIN = 1.1
+
+def probe_video_info(video_path):
+    """用ffprobe读取视频第一条视频流的 (宽, 高, 帧数)；容器中没有记录帧数时按时长和平均帧率估算"""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=width,height,avg_frame_rate,nb_frames,duration:format=duration', '-of', 'json', video_path]
+    info = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True, encoding="utf-8", **get_popen_args()).stdout)
+    stream = info["streams"][0]
+    try: frames = int(stream["nb_frames"])
+    except (KeyError, ValueError):
+        num, _, den = stream.get("avg_frame_rate", "0/1").partition("/")
+        fps = float(num) / float(den) if den and float(den) else float(num or 0)
+        duration = float(stream.get("duration") or info.get("format", {}).get("duration") or 0)
+        frames = math.ceil(duration * fps)
+    return int(stream["width"]), int(stream["height"]), frames
+
+def estimate_frame_bytes(w, h, profile):
+    """一帧 w x h 的图片按 profile 编码后的估计字节数"""
+    return w * h * 4 * ESTIMATE_SIZE_RATIOS.get(profile, 1.0)
+
+def required_disk_bytes(usages, parallel_videos=1):
+    """队列需要的磁盘空间：每个视频的 (峰值, 完成后保留的字节数)，同时处理 parallel_videos 个视频时
+    所有视频保留的输出加上最多 parallel_videos 个视频同时存在的中间步骤"""
+    extra = sorted((peak - kept for peak, kept in usages), reverse=True)
+    return sum(kept for _, kept in usages) + sum(extra[:parallel_videos])
+
+def free_disk_bytes(path):
+    """path 所在磁盘的可用空间（path 可以尚不存在）"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path): path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+# --- Run Instrumentation ---
+# 运行报告中每个步骤的字段（同时是CSV的列）
+REPORT_FIELDS = ("video", "stage", "status", "wall_seconds", "frames", "total_frames", "fps", "bytes_written",
+                 "tool_seconds", "peak_rss_mb", "peak_child_rss_mb")
+
+def peak_rss_bytes(children=False):
+    """本进程（children=True 时为已结束子进程中最大的）内存峰值，无法获取时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None if children else windows_peak_rss_bytes()
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 上 ru_maxrss 的单位是KB，macOS 上是字节
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def windows_peak_rss_bytes():
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS(); counters.cb = ctypes.sizeof(counters)
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb): return None
+        return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        return None
+
+class StageMetrics:
+    """一个视频的一个步骤的统计：耗时、新输出的帧数和字节数、等待外部工具的时间和内存峰值
+
+    tool_seconds 为等待 ffmpeg/magick/Photoshop 的时间；进程池中的批次并行执行时它可能大于 wall_seconds，
+    流式模式中解码与编码交错进行，不单独计时。内存峰值只包括本进程和已结束的子进程。
+    """
+    def __init__(self, video, stage):
+        self.video = video
+        self.stage = stage
+        self.status = "running"
+        self.cached = False
+        self.tool_seconds = 0.0
+        self.outputs = {}
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+
+    def track(self, stage_dir):
+        """记录步骤目录的初始状态，结束时按差值统计新输出的帧和字节"""
+        self.outputs[stage_dir.path] = (stage_dir, stage_dir.frame_count(), dir_size(stage_dir.path))
+
+    def finish(self, status):
+        self.wall_seconds = time.perf_counter() - self.started
+        self.status = status
+        self.frames = self.total_frames = self.bytes_written = 0
+        for stage_dir, frames_before, bytes_before in self.outputs.values():
+            if not os.path.isdir(stage_dir.path): continue
+            total = stage_dir.frame_count()
+            self.total_frames += total; self.frames += max(0, total - frames_before)
+            self.bytes_written += max(0, dir_size(stage_dir.path) - bytes_before)
+        self.peak_rss = peak_rss_bytes(); self.peak_child_rss = peak_rss_bytes(children=True)
+
+    def as_dict(self):
+        to_mb = lambda value: None if value is None else round(value / (1024 * 1024), 1)
+        return {"video": self.video, "stage": self.stage, "status": self.status, "wall_seconds": round(self.wall_seconds, 3),
+                "frames": self.frames, "total_frames": self.total_frames,
+                "fps": round(self.frames / self.wall_seconds, 2) if self.frames and self.wall_seconds > 0 else None,
+                "bytes_written": self.bytes_written, "tool_seconds": round(self.tool_seconds, 3),
+                "peak_rss_mb": to_mb(self.peak_rss), "peak_child_rss_mb": to_mb(self.peak_child_rss)}
+
+def write_run_report(report_base, metrics, summary):
+    """把各步骤的统计写入 report_base.json 和 report_base.csv"""
+    rows = [m.as_dict() for m in metrics]
+    with open(report_base + ".json", 'w', encoding='utf-8') as f:
+        json.dump(dict(summary, stages=rows), f, indent=4, ensure_ascii=False)
+    with open(report_base + ".csv", 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS); writer.writeheader(); writer.writerows(rows)
+
+# --- Preview Frame Cache ---
+# 预览帧缓存的内存上限（按解码后的RGBA字节数计算）
+PREVIEW_CACHE_BYTES = 256 * 1024 * 1024
+
+def grab_frame(video_path, timestamp=0.0):
+    """用快速输入定位（-ss 在 -i 之前）截取指定时间点的一帧，通过管道直接解码到内存"""
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-ss', f'{timestamp:.3f}', '-i', video_path, '-frames:v', '1', '-f', 'image2pipe', '-c:v', 'bmp', '-'],
+                            check=True, capture_output=True, **get_popen_args())
+    if not result.stdout: raise ValueError(f"No frame at {timestamp:.3f}s in {video_path}")
+    with Image.open(io.BytesIO(result.stdout)) as img:
+        return img.convert("RGBA")
+
+class FrameCache:
+    """按 (路径, 修改时间, 时间点) 缓存解码后预览帧的LRU缓存，总大小不超过 max_bytes"""
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_frame(self, video_path, timestamp=0.0):
+        key = (os.path.abspath(video_path), os.path.getmtime(video_path), round(timestamp, 3))
+        with self.lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                return self.frames[key]
+        img = grab_frame(video_path, timestamp)
+        size = img.width * img.height * 4
+        with self.lock:
+            self.frames[key] = img; self.total_bytes += size
+            # 超出上限时淘汰最久未使用的帧（至少保留刚加入的一帧）
+            while self.total_bytes > self.max_bytes and len(self.frames) > 1:
+                _, old = self.frames.popitem(last=False)
+                self.total_bytes -= old.width * old.height * 4
+        return img
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear(); self.total_bytes = 0
+
+# --- Pipeline Engine ---
+PIPELINE_STEPS = ("reduce", "crop", "photoshop", "resize", "atlas")
+
+def get_subprocess_args():
+    """获取subprocess参数，在Windows下隐藏命令行窗口"""
+    args = {"capture_output": True, "text": True, "encoding": "utf-8"}
+    # 在Windows下隐藏命令行窗口
+    args.update(get_popen_args())
+    return args
+
+def default_options(settings):
+    """根据设置生成一次运行的默认参数（四个处理步骤全部启用，图集默认关闭）"""
+    return {"do_reduce": True, "do_crop": True, "do_photoshop": True, "do_resize": True, "do_atlas": False,
+            "frame_step": int(settings.get("frame_step", "3")), "final_w": int(settings.get("final_w", "128")), "final_h": int(settings.get("final_h", "128")),
+            "resize_engine": settings.get("resize_engine", "mogrify"),
+            "decimation": settings.get("decimation_mode", "fixed"), "scene_threshold": float(settings.get("scene_threshold", "2")), "mask_path": None}
+
+def make_video_data(path, settings, overrides=None):
+    """生成队列中一个视频的参数字典，默认值与界面中“添加视频”相同"""
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    video_data = {"out_folder": base_name, "prefix": "frame", "path": path, "crop_w": int(settings.get("crop_w", "256")), "crop_h": int(settings.get("crop_h", "256")), "offset_x": 0, "offset_y": 0}
+    video_data.update(overrides or {})
+    return video_data
+
+class Pipeline:
+    """处理视频队列的引擎。进度和日志通过回调汇报，可在任意线程中运行
+
+    options 为一次运行的参数（见 default_options），log(message)、progress(current, total, message)、
+    status(video_data, message) 为可选回调；stop_requested 被设置后所有工作线程会尽快停止。
+    """
+    def __init__(self, settings, options, lang, stop_requested=None, log=None, progress=None, status=None, output_root=None):
+        self.settings = settings
+        self.options = options
+        self.lang = lang
+        self.stop_requested = stop_requested or threading.Event()
+        self.on_log = log or (lambda message: None)
+        self.on_progress = progress or (lambda current, total, message="": None)
+        self.on_status = status or (lambda video_data, message: None)
+        self.output_root = output_root or os.path.join(get_executable_dir(), "output")
+        # 队列并行执行时使用的共享资源（在 run_queue 中创建）
+        self.parallel_videos = 1
+        self.frame_pool = None; self.frame_pool_enabled = False
+        self.frame_pool_lock = threading.Lock()
+        self.ffmpeg_slots = threading.BoundedSemaphore(1)
+        self.photoshop_lock = threading.Lock()
+        self.worker_state = threading.local()
+        self.videos_done = 0
+        self.videos_lock = threading.Lock()
+        # 本次运行使用过的步骤目录，缓存淘汰时保留
+        self.used_stages = set()
+        # 本次运行各步骤的统计（StageMetrics），运行结束后写入报告
+        self.metrics = []
+        self.metrics_lock = threading.Lock()
+
+    def log(self, message):
+        self.on_log(message)
+
+    def update_progress(self, current, total, message=""):
+        """汇报进度；在队列工作线程中调用时同时更新该视频的状态"""
+        video_data = getattr(self.worker_state, "video_data", None)
+        if video_data is not None:
+            self.set_video_status(video_data, message)
+            # 多个视频并行时总进度只显示已完成的视频数
+            if self.parallel_videos > 1: return
+        self.on_progress(current, total, message)
+
+    def set_video_status(self, video_data, message):
+        self.on_status(video_data, message)
+
+    def run_queue(self, video_queue):
+        """按顺序（或按 parallel_videos 并行）处理队列中的所有视频。全部完成返回True，被停止返回False"""
+        video_queue = list(video_queue)
+        total_videos = len(video_queue)
+        self.log(self.lang.get("log_start_processing").format(total=total_videos))
+        # 蒙版和逐帧跟踪只在裁剪步骤中生效
+        if not self.options["do_crop"]:
+            if self.mask_path(): self.log(self.lang.get("log_mask_no_crop").format(name=os.path.basename(self.mask_path())))
+            if self.settings.get("crop_tracking", False): self.log(self.lang.get("log_tracking_no_crop"))
+        self.metrics = []; run_started = time.time()
+        
+        try:
+            self.parallel_videos = max(1, int(self.settings.get("parallel_videos", "1")))
+            if self.settings.get("disk_space_check", False): self.check_disk_space(video_queue)
+            self.ffmpeg_slots = threading.BoundedSemaphore(max(1, int(self.settings.get("parallel_ffmpeg", "2"))))
+            # 裁剪/缩放等纯Python工作交给进程池，绕开GIL；进程池在第一次需要时才创建（见 get_frame_pool）
+            self.frame_pool_enabled = True
+            for video_data in video_queue: self.set_video_status(video_data, self.lang.get("status_waiting"))
+            self.videos_done = 0
+            self.used_stages = set()
+            
+            # parallel_videos 为 1 时与原来一样按顺序逐个处理
+            items = [(idx, total_videos, video_data) for idx, video_data in enumerate(video_queue, 1)]
+            # 输出文件夹相同的视频共用步骤目录：并行时放在同一工作线程中依次处理，批量模式下改为逐个处理
+            collisions = [group for group in self.output_groups(items) if len(group) > 1]
+            for group in collisions:
+                self.log(self.lang.get("log_output_collision").format(count=len(group), folder=group[0][2]["out_folder"]))
+            batch_mode = self.settings.get("photoshop_batch_mode", False) and self.options["do_photoshop"] and self.settings.get("transparency_backend", "photoshop") == "photoshop"
+            if batch_mode and collisions:
+                self.log(self.lang.get("log_batch_output_collision")); batch_mode = False
+            if batch_mode:
+                # 批量模式：先完成所有视频的步骤1、2，再用一次Photoshop会话处理整个队列，最后执行步骤4
+                jobs = self.run_video_pool(items, "prepare")
+                ready_jobs = [job for job in jobs if job is not None and not self.superseded(job, "photoshop")]
+                if ready_jobs and not self.stop_requested.is_set():
+                    with self.photoshop_lock, self.measure(", ".join(job["video_data"]["out_folder"] for job in ready_jobs), "photoshop"):
+                        self.run_photoshop_stage(ready_jobs)
+                self.run_video_pool([item + (job,) for item, job in zip(items, jobs)], "finish")
+            else:
+                self.run_video_pool(items)
+        finally: 
+            self.frame_pool_enabled = False
+            if self.frame_pool is not None:
+                self.frame_pool.shutdown(cancel_futures=True); self.frame_pool = None
+            if self.metrics: self.write_run_report(run_started)
+        
+        self.evict_stage_cache()
+        if self.stop_requested.is_set():
+            self.log(self.lang.get("msg_task_interrupted"))
+            return False
+        self.log("\n" + self.lang.get("log_all_complete"))
+        return True
+
+    def output_groups(self, items):
+        """按输出文件夹把 (idx, total_videos, video_data, ...) 分组，保持队列顺序"""
+        groups = {}
+        for item in items:
+            folder = os.path.normcase(os.path.abspath(os.path.join(self.output_root, item[2]["out_folder"])))
+            groups.setdefault(folder, []).append(item)
+        return list(groups.values())
+
+    def run_video_group(self, group, phase):
+        """在一个工作线程中依次处理输出文件夹相同的视频，返回 [(idx, 结果)]"""
+        return [(item[0], self.run_queued_video(*item, phase=phase)) for item in group]
+
+    def run_video_pool(self, items, phase="all"):
+        """在线程池中对每个 (idx, total_videos, video_data[, job]) 执行 run_queued_video，按顺序返回结果；
+        输出文件夹相同的视频不会同时写同一批步骤目录，而是在同一线程中依次处理"""
+        with ThreadPoolExecutor(max_workers=self.parallel_videos) as video_pool:
+            futures = [video_pool.submit(self.run_video_group, group, phase) for group in self.output_groups(items)]
+            try:
+                for future in as_completed(futures): future.result()
+            except KeyboardInterrupt:
+                # 命令行中按 Ctrl+C 时让所有工作线程尽快停止
+                self.stop_requested.set()
+                for future in futures: future.cancel()
+                raise
+            except Exception:
+                # 任一视频出错时取消尚未开始的视频，正在处理的视频会继续完成
+                for future in futures: future.cancel()
+                raise
+        results = dict(pair for future in futures for pair in future.result())
+        return [results[item[0]] for item in items]
+
+    def run_queued_video(self, idx, total_videos, video_data, job=None, phase="all"):
+        """在工作线程中处理队列里的一个视频；phase 为 prepare/finish 时只执行Photoshop之前/之后的步骤"""
+        if self.stop_requested.is_set(): return None
+        if phase == "finish" and job is None: return None
+        if phase != "finish":
+            self.log(f"\n{'='*50}")
+            self.log(self.lang.get("log_processing_video").format(current=idx, total=total_videos, name=os.path.basename(video_data['path'])))
+            self.log(f"{'='*50}")
+        self.worker_state.video_data = video_data
+        try:
+            if phase == "prepare": return self.prepare_video(video_data)
+            if phase == "finish": self.finish_video(job)
+            else: self.process_video(video_data)
+            if not self.stop_requested.is_set(): self.set_video_status(video_data, self.lang.get("status_complete"))
+        except Exception:
+            self.set_video_status(video_data, self.lang.get("msg_error"))
+            raise
+        finally:
+            self.worker_state.video_data = None
+            if phase != "prepare": self.mark_video_done(total_videos)
+
+    def mark_video_done(self, total_videos):
+        """记录一个视频已结束；多个视频并行时总进度显示已完成的视频数"""
+        with self.videos_lock:
+            self.videos_done += 1; done = self.videos_done
+        if self.parallel_videos > 1:
+            self.on_progress(done, total_videos, self.lang.get("progress_videos_done").format(done=done, total=total_videos))
+
+    def process_video(self, video_data):
+        job = self.prepare_video(video_data)
+        if job is None: return
+        if self.options["do_photoshop"]:
+            if self.stop_requested.is_set(): return
+            if not self.run_transparency_stage(job): return
+        self.finish_video(job)
+
+    def prepare_video(self, video_data):
+        """执行步骤1、2（合并模式下可能包括步骤4），返回后续步骤使用的任务信息；被停止时返回None"""
+        video_path = video_data["path"]; offset_x = video_data["offset_x"]; offset_y = video_data["offset_y"]
+        crop_w = video_data["crop_w"]; crop_h = video_data["crop_h"]; out_folder = video_data["out_folder"]
+        target_w = self.options["final_w"]; target_h = self.options["final_h"]; frame_step = self.options["frame_step"]
+        
+        self.log(self.lang.get("log_start_video").format(name=os.path.basename(video_path)))
+        main_output_dir = self.output_root; os.makedirs(main_output_dir, exist_ok=True)
+        video_specific_dir = os.path.join(main_output_dir, out_folder)
+        if not self.settings.get("stage_cache", True):
+            if os.path.exists(video_specific_dir): shutil.rmtree(video_specific_dir)
+        elif os.path.isdir(video_specific_dir):
+            # 上次运行清理临时文件后移动到根目录的最终帧（及图集索引）
+            remove_moved_final_files(video_specific_dir)
+        os.makedirs(video_specific_dir, exist_ok=True)
+        
+        source_key = video_fingerprint(video_path)
+        tracking = self.options["do_crop"] and self.settings.get("crop_tracking", False)
+        # 滤镜链模式/流式模式会把步骤1、2（不经过Photoshop时还有步骤4）合并为一次处理
+        fused = self.fused_mode()
+        fused_stages = fused is not None; use_filtergraph = fused == "filtergraph"
+        if fused == "streaming" and self.settings.get("ffmpeg_filtergraph", False):
+            self.log(self.lang.get("log_tracking_no_filtergraph" if tracking else "log_mask_no_filtergraph"))
+        
+        # 先算出所有步骤的缓存键，从已完成的最靠后的步骤开始，它之前的步骤（可能已被逐帧释放或淘汰）不再重建
+        plan, resized_in_stream = self.plan_stages(video_data, video_specific_dir, source_key, fused)
+        job = {"video_data": video_data, "video_specific_dir": video_specific_dir, "current_path": video_path, "key": source_key,
+               "resized_in_stream": resized_in_stream, "plan": plan, "start": self.furthest_complete(plan)}
+        first = next(iter(plan))
+        if job["start"] not in (None, first): self.log(self.lang.get("log_stages_skipped").format(stage=os.path.basename(plan[job["start"]][0])))
+        
+        stage = None
+        if self.superseded(job, first): pass
+        elif fused_stages:
+            if self.stop_requested.is_set(): return
+            with self.ffmpeg_slots, self.measure(out_folder, "filtergraph" if use_filtergraph else "streaming"):
+                if use_filtergraph:
+                    # 滤镜链模式：抽帧、裁剪、透明填充和缩放全部在ffmpeg中一次完成
+                    stage = self.run_filtergraph_stages(video_path, plan[first], frame_step, crop_w, crop_h, offset_x, offset_y, target_w, target_h, resized_in_stream)
+                else:
+                    # 流式模式：单个ffmpeg进程通过rawvideo管道解码，裁剪/缩放在内存中完成，只编码最终帧
+                    stage = self.run_streaming_stages(video_path, plan[first], frame_step, crop_w, crop_h, offset_x, offset_y, target_w, target_h, resized_in_stream)
+            if stage is None: return None
+        elif self.options["do_reduce"]:
+            if self.stop_requested.is_set(): return None
+            self.report_decimation(frame_step)
+            with self.measure(out_folder, "reduce"):
+                path, key, profile = plan["reduce"]
+                stage = self.open_stage(path, key)
+                if not self.reuse_stage(stage):
+                    if profile == FRAME_STORE_FILE:
+                        with self.ffmpeg_slots:
+                            if not self.extract_to_store(stage, video_path, frame_step, self.adaptive_frames(stage, video_path)): return None
+                    else:
+                        with self.ffmpeg_slots: keep = self.adaptive_frames(stage, video_path)
+                        segmented = self.extract_segments(stage, video_path, profile, frame_step, keep) if self.settings.get("segment_extraction", False) else None
+                        if segmented is False: return None
+                        if segmented is None:
+                            start = self.resume_stage(stage)
+                            with self.ffmpeg_slots:
+                                with video_filter_args(select_filter(frame_step, start, keep)) as filter_args:
+                                    self.run_tool(['ffmpeg', '-i', video_path] + filter_args + ['-vsync', 'vfr', '-start_number', str(start + 1)] + self.ffmpeg_output(stage, profile))
+                    stage.finish()
+        else:
+            if self.stop_requested.is_set(): return None
+            self.log(self.lang.get("log_step1_all"))
+            self.update_progress(1, 4, self.lang.get("progress_step1_all"))
+            with self.measure(out_folder, "extract"):
+                path, key, profile = plan["reduce"]
+                stage = self.open_stage(path, key)
+                if not self.reuse_stage(stage):
+                    if profile == FRAME_STORE_FILE:
+                        with self.ffmpeg_slots:
+                            if not self.extract_to_store(stage, video_path): return None
+                    else:
+                        segmented = self.extract_segments(stage, video_path, profile) if self.settings.get("segment_extraction", False) else None
+                        if segmented is False: return None
+                        if segmented is None:
+                            start = self.resume_stage(stage)
+                            cmd = ['ffmpeg', '-i', video_path] + (['-vf', select_filter(1, start), '-vsync', 'vfr'] if start else [])
+                            with self.ffmpeg_slots:
+                                self.run_tool(cmd + ['-start_number', str(start + 1)] + self.ffmpeg_output(stage, profile))
+                    stage.finish()
+        if stage is not None: job["current_path"] = stage.path; job["key"] = stage.key
+        extracted = stage
+        
+        if self.options["do_crop"] and not fused_stages and not self.superseded(job, "crop"):
+            if self.stop_requested.is_set(): return None
+            current_path = job["current_path"]
+            self.log(self.lang.get("log_step2_crop"))
+            if self.mask_path(): self.log(self.lang.get("log_mask").format(name=os.path.basename(self.mask_path())))
+            self.update_progress(2, 4, self.lang.get("progress_step2"))
+            with self.measure(out_folder, "crop"):
+                path, key, profile = plan["crop"]
+                stage = self.open_stage(path, key)
+                if not self.reuse_stage(stage):
+                    self.release_input(current_path)
+                    track = self.crop_track(stage, video_path, crop_w, crop_h, *self.extracted_frames(extracted)) if tracking else None
+                    source = FrameStore.open(current_path)
+                    if source is not None:
+                        # 从帧存储中按序号成批读取，裁剪为数组切片
+                        if track is not None:
+                            offsets = [track[min(i, len(track) - 1)] for i in range(source.count)]
+                            if not self.run_store_batches(2, "progress_step2_detail", stage, source, crop_track_pixels, (crop_w, crop_h, self.mask_path()), (crop_w, crop_h), CROP_BATCH_SIZE, profile, per_frame=offsets): return None
+                        elif not self.run_store_batches(2, "progress_step2_detail", stage, source, crop_pixels, (crop_w, crop_h, offset_x, offset_y, self.mask_path()), (crop_w, crop_h), CROP_BATCH_SIZE, profile): return None
+                    else:
+                        files = [os.path.join(current_path, f) for f in list_frames(current_path)]
+                        # 使用 PIL 进行裁剪，支持超出边界时用透明像素填充；按块分发到进程池
+                        if track is not None:
+                            # 按文件名中的帧序号取对应的偏移量（frame_0001 为轨迹中的第0帧）
+                            pending = self.pending_frames(stage, [(f, *track[min(frame_number(os.path.basename(f)) - 1, len(track) - 1)]) for f in files])
+                            batches = [pending[start:start + CROP_BATCH_SIZE] for start in range(0, len(pending), CROP_BATCH_SIZE)]
+                            if not self.run_frame_batches(2, "progress_step2_detail", len(files), batches, crop_track_batch, stage.path, crop_w, crop_h, profile, self.mask_path(),
+                                                          stage=stage, free=self.settings.get("eager_cleanup", False)): return None
+                        else:
+                            pending = self.pending_frames(stage, files)
+                            batches = [pending[start:start + CROP_BATCH_SIZE] for start in range(0, len(pending), CROP_BATCH_SIZE)]
+                            if not self.run_frame_batches(2, "progress_step2_detail", len(files), batches, crop_batch, stage.path, crop_w, crop_h, offset_x, offset_y, profile, self.mask_path(),
+                                                          stage=stage, free=self.settings.get("eager_cleanup", False)): return None
+                    stage.finish()
+            self.free_input(current_path)
+            job["current_path"] = stage.path; job["key"] = stage.key
+
+        return job
+
+    def finish_video(self, job):
+        """执行步骤4（以及可选的图集步骤）并按设置清理临时文件"""
+        video_data = job["video_data"]; video_path = video_data["path"]; video_specific_dir = job["video_specific_dir"]
+        target_w = self.options["final_w"]; target_h = self.options["final_h"]; resize_engine = self.options["resize_engine"]
+
+        if self.options["do_resize"] and not job["resized_in_stream"] and not self.superseded(job, "resize"):
+            if self.stop_requested.is_set(): return
+            current_path = job["current_path"]
+            self.log(self.lang.get("log_step4_resize").format(w=target_w, h=target_h))
+            self.update_progress(4, 4, self.lang.get("progress_step4"))
+            with self.measure(video_data["out_folder"], "resize"):
+                path, key, profile = job["plan"]["resize"]
+                stage = self.open_stage(path, key)
+                if not self.reuse_stage(stage):
+                    self.release_input(current_path)
+                    source = FrameStore.open(current_path)
+                    if source is not None:
+                        # 上一步写入了帧存储（此时缩放引擎为 pillow）
+                        out_size = fit_size(source.width, source.height, target_w, target_h)
+                        if not self.run_store_batches(4, "progress_step4_detail", stage, source, resize_pixels, (target_w, target_h), out_size, RESIZE_BATCH_SIZE, profile): return
+                    else:
+                        files = [os.path.join(current_path, f) for f in list_frames(current_path)]
+                        pending = self.pending_frames(stage, files)
+                        # 按批处理，避免每帧都启动一次 magick 进程
+                        batches = [pending[start:start + RESIZE_BATCH_SIZE] for start in range(0, len(pending), RESIZE_BATCH_SIZE)]
+                        if not self.run_frame_batches(4, "progress_step4_detail", len(files), batches, resize_batch, stage.path, target_w, target_h, resize_engine, profile,
+                                                      stage=stage, free=self.settings.get("eager_cleanup", False)): return
+                    stage.finish()
+            self.free_input(current_path)
+            job["current_path"] = stage.path; job["key"] = stage.key
+
+        if self.options.get("do_atlas", False):
+            if self.stop_requested.is_set(): return
+            job["current_path"] = self.run_atlas_stage(video_data, job["plan"]["atlas"], job["current_path"]).path
+        current_path = job["current_path"]
+
+        self.log(self.lang.get("log_video_complete").format(name=os.path.basename(video_path), path=current_path))
+        mark_final_stage(video_specific_dir, current_path)
+        
+        # 如果启用了清理临时文件选项
+        if self.settings.get("clean_temp_files", False):
+            self.log(self.lang.get("log_cleaning_temp"))
+            
+            # 将最终输出文件移动到视频文件夹根目录
+            final_output_root = video_specific_dir
+            if current_path != final_output_root:
+                # 移动所有最终输出文件（图集还包括索引JSON）到根目录，先记录文件列表，下次运行前只删除这些文件
+                moved = [filename for filename in os.listdir(current_path) if filename not in (STAGE_MANIFEST, STAGE_JOURNAL)]
+                write_json_atomic(os.path.join(final_output_root, FINAL_FILES), moved)
+                for filename in moved:
+                    src = os.path.join(current_path, filename)
+                    dst = os.path.join(final_output_root, filename)
+                    shutil.move(src, dst)
+                
+                self.log(self.lang.get("log_moved_final").format(path=final_output_root))
+            
+            # 删除所有临时文件夹
+            temp_dirs = [
+                os.path.join(video_specific_dir, "1_reduced_frames"),
+                os.path.join(video_specific_dir, "1_all_frames"),
+                os.path.join(video_specific_dir, "2_cropped_frames"),
+                os.path.join(video_specific_dir, "3_transparent_temp"),
+                os.path.join(video_specific_dir, "4_final_output"),
+                os.path.join(video_specific_dir, "5_atlas")
+            ]
+            
+            for temp_dir in temp_dirs:
+                if os.path.exists(temp_dir):
+                    shutil.rmtree(temp_dir)
+            
+            self.log(self.lang.get("log_cleaned_temp"))
+
+    def atlas_params(self):
+        """图集步骤的参数 (排版方式, 是否裁掉透明边, 最大尺寸, 间距)"""
+        return (self.settings.get("atlas_layout", "grid"), self.settings.get("atlas_trim", False),
+                int(self.settings.get("atlas_max_size", "4096")), int(self.settings.get("atlas_padding", "1")))
+
+    def run_atlas_stage(self, video_data, planned, input_dir):
+        """把 input_dir 中的帧打包为图集和JSON索引，返回图集目录的 StageDir；planned 为计划中图集步骤的 (目录, 缓存键, 输出格式)"""
+        layout, trim, max_size, padding = self.atlas_params()
+        self.log(self.lang.get("log_step5_atlas").format(layout=layout))
+        self.update_progress(4, 4, self.lang.get("progress_atlas"))
+        with self.measure(video_data["out_folder"], "atlas"):
+            path, key, profile = planned
+            stage = self.open_stage(path, key)
+            if not self.reuse_stage(stage):
+                # 图集需要一次排版全部帧，无法从中途继续
+                stage.reset(); self.track_stage(stage)
+                source = FrameStore.open(input_dir)
+                if source is not None: frames = store_atlas_frames(source, trim)
+                else: frames = load_atlas_frames([os.path.join(input_dir, f) for f in list_frames(input_dir)], trim)
+                pages = build_atlas(frames, stage.path, f'{video_data["prefix"]}_atlas', layout, max_size, padding, profile)
+                stage.finish()
+                self.log(self.lang.get("log_atlas_done").format(frames=len(frames), pages=pages))
+        return stage
+
+    def fused_output_dir(self, video_specific_dir, do_resize):
+        """合并执行多个步骤时最终写出的目录，与逐步执行时对应步骤的目录名保持一致"""
+        if do_resize: return os.path.join(video_specific_dir, "4_final_output")
+        if self.options["do_crop"]: return os.path.join(video_specific_dir, "2_cropped_frames")
+        if self.options["do_reduce"]: return os.path.join(video_specific_dir, "1_reduced_frames")
+        return os.path.join(video_specific_dir, "1_all_frames")
+
+    def fused_mode(self):
+        """合并执行步骤1、2的方式："filtergraph"、"streaming"，逐步执行时为None
+
+        滤镜链中的裁剪框是固定的，也不能应用蒙版：裁剪时逐帧跟踪或应用蒙版的滤镜链模式改用流式模式。
+        """
+        if self.settings.get("ffmpeg_filtergraph", False):
+            if self.options["do_crop"] and (self.settings.get("crop_tracking", False) or self.mask_path()): return "streaming"
+            return "filtergraph"
+        return "streaming" if self.settings.get("streaming_mode", False) else None
+
+    def video_plan(self, video_data):
+        """video_data 的步骤计划（见 plan_stages）"""
+        return self.plan_stages(video_data, os.path.join(self.output_root, video_data["out_folder"]), video_fingerprint(video_data["path"]), self.fused_mode())[0]
+
+    def plan_stages(self, video_data, video_specific_dir, source_key, fused=None):
+        """按执行顺序列出本视频的步骤目录，返回 ({步骤: (目录, 缓存键, 输出格式)}, 步骤4是否在合并执行中完成)
+
+        每个键只由视频标识和选项决定，运行前就能找出已经完成的步骤。fused 为 "filtergraph"/"streaming" 时
+        步骤1、2（不经过Photoshop时还有步骤4）合并为一步，记为 "fused"。
+        """
+        crop = (video_data["crop_w"], video_data["crop_h"], video_data["offset_x"], video_data["offset_y"])
+        target_w = self.options["final_w"]; target_h = self.options["final_h"]; frame_step = self.options["frame_step"]
+        plan = {}; resized_in_stream = False
+        if fused is not None:
+            resized_in_stream = self.options["do_resize"] and not self.options["do_photoshop"]
+            step = frame_step if self.options["do_reduce"] else 1
+            decimation = self.decimation_params(step) if self.options["do_reduce"] else ("fixed", 1)
+            crop_key = None if not self.options["do_crop"] else crop if fused == "filtergraph" else self.crop_params(*crop)
+            scale = (target_w, target_h) if resized_in_stream else None
+            # 只有最终帧被编码到磁盘
+            profile = self.encode_profile(not self.options["do_photoshop"] and self.is_final_step("resize"))
+            plan["fused"] = (self.fused_output_dir(video_specific_dir, resized_in_stream), stage_key(source_key, fused, decimation, crop_key, scale, profile), profile)
+        elif self.options["do_reduce"]:
+            profile = self.stage_output("reduce")
+            plan["reduce"] = (os.path.join(video_specific_dir, "1_reduced_frames"), stage_key(source_key, "reduce", *self.decimation_params(frame_step), profile), profile)
+        else:
+            profile = self.stage_output("reduce")
+            plan["reduce"] = (os.path.join(video_specific_dir, "1_all_frames"), stage_key(source_key, "all", profile), profile)
+        if self.options["do_crop"] and fused is None:
+            parent_key = plan["reduce"][1]; profile = self.stage_output("crop", profile)
+            plan["crop"] = (os.path.join(video_specific_dir, "2_cropped_frames"), stage_key(parent_key, "crop", *self.crop_params(*crop), profile), profile)
+        if self.options["do_photoshop"]:
+            parent_key = list(plan.values())[-1][1]; profile = self.stage_output("photoshop", profile)
+            plan["photoshop"] = (os.path.join(video_specific_dir, "3_transparent_temp"), self.transparency_key(parent_key, video_data["prefix"], profile), profile)
+        if self.options["do_resize"] and not resized_in_stream:
+            parent_key = list(plan.values())[-1][1]; profile = self.stage_output("resize", profile)
+            plan["resize"] = (os.path.join(video_specific_dir, "4_final_output"), stage_key(parent_key, "resize", target_w, target_h, self.options["resize_engine"], profile), profile)
+        if self.options.get("do_atlas", False):
+            parent_key = list(plan.values())[-1][1]; profile = self.encode_profile(True)
+            plan["atlas"] = (os.path.join(video_specific_dir, "5_atlas"), stage_key(parent_key, "atlas", *self.atlas_params(), profile), profile)
+        return plan, resized_in_stream
+
+    def furthest_complete(self, plan):
+        """计划中已按相同参数完成的最靠后的步骤，没有时为None"""
+        if not self.settings.get("stage_cache", True): return None
+        for step in reversed(list(plan)):
+            path, key, _ = plan[step]
+            manifest = read_stage_manifest(path)
+            if manifest is not None and manifest.get("key") == key and manifest.get("complete", False): return step
+        return None
+
+    def superseded(self, job, step):
+        """step 之后的某个步骤已经完成时跳过 step：任务切换到 step 的输出（其目录可能已被逐帧释放或淘汰），返回True"""
+        steps = list(job["plan"])
+        if job["start"] is None or steps.index(step) >= steps.index(job["start"]): return False
+        job["current_path"], job["key"] = job["plan"][step][:2]
+        return True
+
+    def run_filtergraph_stages(self, video_path, planned, frame_step, crop_w, crop_h, offset_x, offset_y, target_w, target_h, do_resize):
+        """用一条ffmpeg滤镜链完成步骤1/2（以及不经过Photoshop时的步骤4），返回输出目录的 StageDir；planned 为计划中的 (目录, 缓存键, 输出格式)"""
+        if self.options["do_reduce"]: self.report_decimation(frame_step)
+        else: self.log(self.lang.get("log_step1_all"))
+        self.log(self.lang.get("log_filtergraph"))
+        self.update_progress(1, 4, self.lang.get("progress_filtergraph"))
+        
+        step = frame_step if self.options["do_reduce"] else 1
+        crop = (crop_w, crop_h, offset_x, offset_y) if self.options["do_crop"] else None
+        scale = (target_w, target_h) if do_resize else None
+        path, key, profile = planned
+        stage = self.open_stage(path, key)
+        if self.reuse_stage(stage): return stage
+        start = self.resume_stage(stage)
+        keep = self.adaptive_frames(stage, video_path) if self.options["do_reduce"] else None
+        src_w, src_h = probe_video_size(video_path)
+        ffmpeg_filter = build_filtergraph(src_w, src_h, step, crop, scale, start, keep)
+        with video_filter_args(ffmpeg_filter) as filter_args:
+            self.run_tool(['ffmpeg', '-i', video_path] + filter_args + ['-vsync', 'vfr', '-start_number', str(start + 1)] + self.ffmpeg_output(stage, profile))
+        stage.finish()
+        return stage
+
+    def run_streaming_stages(self, video_path, planned, frame_step, crop_w, crop_h, offset_x, offset_y, target_w, target_h, do_resize):
+        """流式执行步骤1/2（以及不经过Photoshop时的步骤4），返回输出目录的 StageDir；被停止时返回None"""
+        step = frame_step if self.options["do_reduce"] else 1
+        if self.options["do_reduce"]: self.report_decimation(frame_step)
+        else: self.log(self.lang.get("log_step1_all"))
+        self.log(self.lang.get("log_streaming"))
+        self.update_progress(1, 4, self.lang.get("progress_streaming"))
+        
+        crop = (crop_w, crop_h, offset_x, offset_y) if self.options["do_crop"] else None
+        scale = (target_w, target_h) if do_resize else None
+        path, key, profile = planned
+        stage = self.open_stage(path, key)
+        if self.reuse_stage(stage): return stage
+        start = self.resume_stage(stage)
+        keep = self.adaptive_frames(stage, video_path) if self.options["do_reduce"] else None
+        track = self.crop_track(stage, video_path, crop_w, crop_h, step, keep) if crop is not None and self.settings.get("crop_tracking", False) else None
+        
+        source = iter_video_frames(video_path, step, start, keep)
+        items = source; stages = []
+        if track is not None:
+            # 逐帧跟踪主体：每帧和它的裁剪偏移量一起传给裁剪阶段
+            items = ((img, track[min(i, len(track) - 1)]) for i, img in enumerate(source, start))
+            stages.append(lambda item: crop_frame(item[0], crop_w, crop_h, *item[1]))
+        elif crop is not None: stages.append(lambda img: crop_frame(img, *crop))
+        mask_path = self.mask_path() if crop is not None else None
+        if mask_path:
+            self.log(self.lang.get("log_mask").format(name=os.path.basename(mask_path)))
+            stages.append(lambda img: mask_frame(img, mask_path))
+        if scale is not None: stages.append(lambda img: resize_frame(img, *scale))
+        overlapped = self.settings.get("pipeline_overlap", False)
+        if overlapped:
+            # 解码、裁剪、缩放和编码写盘（当前线程）同时进行，阶段之间的有界队列限制了内存占用
+            frames = overlap_stages(items, stages, max(1, int(self.settings.get("pipeline_queue_frames", PIPELINE_QUEUE_FRAMES))), self.stop_requested)
+        else:
+            frames = items
+            for func in stages: frames = map(func, frames)
+        
+        started = time.perf_counter()
+        try:
+            for idx, img in enumerate(frames, start + 1):
+                if self.stop_requested.is_set(): return None
+                save_frame(img, os.path.join(stage.path, f"frame_{idx:04d}{ENCODE_PROFILES[profile]['ext']}"), profile)
+                self.update_progress(2, 4, self.with_rate(self.lang.get("progress_streaming_detail").format(current=idx), idx - start, started))
+        finally:
+            # 重叠执行时先等待各阶段的线程退出，source 由生产者线程关闭
+            if overlapped: frames.close()
+            source.close()
+        if self.stop_requested.is_set(): return None
+        stage.finish()
+        return stage
+
+    def is_final_step(self, step):
+        """step 之后没有其它启用的步骤时，它的输出就是最终输出"""
+        return not any(self.options.get(f"do_{later}", False) for later in PIPELINE_STEPS[PIPELINE_STEPS.index(step) + 1:])
+
+    def stage_output(self, step, input_profile=None):
+        """步骤输出的格式（同时是缓存键的一部分）：写入帧存储时为 FRAME_STORE_FILE，否则为编码方式的名称
+
+        只有启用了帧存储、输入也来自帧存储（input_profile 为上一步的输出格式，步骤1除外）、不是最终输出且下一个步骤在进程内执行时才写入帧存储；
+        Photoshop 和 magick 需要图片文件。
+        """
+        profile = self.encode_profile(self.is_final_step(step))
+        if not self.settings.get("frame_store", False): return profile
+        if input_profile is not None and input_profile != FRAME_STORE_FILE: return profile
+        later = next((s for s in PIPELINE_STEPS[PIPELINE_STEPS.index(step) + 1:] if self.options.get(f"do_{s}", False)), None)
+        if later is None: return profile
+        if later == "photoshop" and self.settings.get("transparency_backend", "photoshop") != "chroma_key": return profile
+        if later == "resize" and self.options["resize_engine"] != "pillow": return profile
+        return FRAME_STORE_FILE
+
+    def encode_profile(self, final):
+        """步骤输出使用的编码方式：最终输出与中间步骤分别设置"""
+        name = self.settings.get("final_profile", "png") if final else self.settings.get("intermediate_profile", "png_fast")
+        if name not in ENCODE_PROFILES: raise ValueError(f"Unknown encode profile: {name}")
+        return name
+
+    def ffmpeg_output(self, stage, profile):
+        """ffmpeg 把帧序列写入 stage 目录的编码参数和文件名模板"""
+        return ENCODE_PROFILES[profile]["ffmpeg"] + [f'{stage.path}/frame_%04d{ENCODE_PROFILES[profile]["ext"]}']
+
+    def extract_segments(self, stage, video_path, profile, frame_step=1, keep=None):
+        """分段并行执行步骤1的提取，每段占用一个ffmpeg并发名额。完成返回True，被停止返回False；
+        视频太短、关键帧太少或只允许一个ffmpeg进程时返回None，由调用方改用单个ffmpeg进程"""
+        workers = max(1, int(self.settings.get("parallel_ffmpeg", "2")))
+        if workers < 2: return None
+        keyframes, key_times, total, start_time, duration = probe_keyframes(video_path)
+        if duration < SEGMENT_MIN_SECONDS: return None
+        # 分段比并发数多一些，各段耗时不均时也能保持所有进程忙碌
+        segments = plan_segments(keyframes, total, workers * 2)
+        if len(segments) < 2: return None
+        self.log(self.lang.get("log_segments").format(segments=len(segments), workers=workers))
+        seek_times = dict(zip(keyframes, key_times))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        ext = ENCODE_PROFILES[profile]["ext"]
+
+        def run_segment(index):
+            if self.stop_requested.is_set(): return False
+            start, end = segments[index]
+            first, frames = segment_frames(start, end, frame_step, keep)
+            if not frames: return True
+            # 上次中断时未完成的段可能留下了部分输出，删除后重新提取
+            for number in range(first + 1, first + len(frames) + 1):
+                path = os.path.join(stage.path, f"frame_{number:04d}{ext}")
+                if os.path.exists(path): os.remove(path)
+            cmd = ['ffmpeg', '-v', 'error', '-threads', str(threads)]
+            # 定位到段首的关键帧（略微偏后以免时间的舍入误差落到前一个关键帧），不丢弃任何解码出的帧
+            if start: cmd += ['-noaccurate_seek', '-ss', f"{seek_times[start] - start_time + 0.001:.6f}"]
+            select = segment_select(start, frames, frame_step, keep)
+            with video_filter_args(select) as filter_args:
+                cmd += ['-i', video_path] + filter_args + (['-vsync', 'vfr'] if select else [])
+                with self.ffmpeg_slots:
+                    if self.stop_requested.is_set(): return False
+                    self.run_tool(cmd + ['-frames:v', str(len(frames)), '-start_number', str(first + 1)] + self.ffmpeg_output(stage, profile))
+            return True
+
+        pending = self.pending_frames(stage, list(range(len(segments))))
+        done_count = len(segments) - len(pending)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_segment, index): index for index in pending}
+            try:
+                for future in as_completed(futures):
+                    if not future.result(): return False
+                    stage.mark_done([futures[future]]); done_count += 1
+                    self.update_progress(1, 4, self.lang.get("progress_segments_detail").format(done=done_count, total=len(segments)))
+            finally:
+                for future in futures: future.cancel()
+        return True
+
+    def crop_params(self, crop_w, crop_h, offset_x, offset_y):
+        """裁剪步骤的缓存参数：逐帧跟踪主体时偏移量由轨迹决定，记录跟踪的参数；应用蒙版时加上蒙版文件的标识"""
+        mask = (video_fingerprint(self.mask_path()),) if self.mask_path() else ()
+        if not self.settings.get("crop_tracking", False): return (crop_w, crop_h, offset_x, offset_y) + mask
+        return (crop_w, crop_h, "track", float(self.settings.get("auto_crop_threshold", "25")), int(self.settings.get("crop_smoothing", "15"))) + mask
+
+    def mask_path(self):
+        """裁剪后应用的蒙版图路径，未设置时为None"""
+        return self.options.get("mask_path") or None
+
+    def extracted_frames(self, stage):
+        """步骤1输出的帧对应的 (frame_step, keep)，自动裁剪据此分析同样的帧"""
+        if not self.options["do_reduce"]: return 1, None
+        return self.options["frame_step"], stage.manifest.get("kept")
+
+    def crop_track(self, stage, video_path, crop_w, crop_h, frame_step=1, keep=None):
+        """逐帧跟踪主体时每个输出帧的裁剪偏移量；分析结果记录在步骤清单中，续传时无需重新分析"""
+        if "track" not in stage.manifest:
+            smoothing = int(self.settings.get("crop_smoothing", "15"))
+            self.log(self.lang.get("log_crop_tracking").format(smoothing=smoothing))
+            self.update_progress(2, 4, self.lang.get("progress_crop_tracking"))
+            stage.manifest["track"] = track_crop(video_path, crop_w, crop_h, frame_step, keep, float(self.settings.get("auto_crop_threshold", "25")), smoothing)
+            stage.save()
+        return stage.manifest["track"]
+
+    def decimation_params(self, frame_step):
+        """抽帧方式及其参数，用于步骤1的缓存键"""
+        if self.options.get("decimation", "fixed") == "adaptive": return ("adaptive", self.options["scene_threshold"])
+        return ("fixed", frame_step)
+
+    def report_decimation(self, frame_step):
+        """记录步骤1的抽帧方式"""
+        if self.options.get("decimation", "fixed") == "adaptive":
+            self.log(self.lang.get("log_step1_adaptive").format(threshold=self.options["scene_threshold"]))
+            self.update_progress(1, 4, self.lang.get("progress_step1_adaptive"))
+        else:
+            self.log(self.lang.get("log_step1_reduce").format(step=frame_step))
+            self.update_progress(1, 4, self.lang.get("progress_step1").format(step=frame_step))
+
+    def adaptive_frames(self, stage, video_path):
+        """自适应抽帧时要保留的帧号（固定间隔时返回None）；分析结果记录在步骤清单中，续传时无需重新分析"""
+        if self.options.get("decimation", "fixed") != "adaptive": return None
+        if "kept" not in stage.manifest:
+            self.update_progress(1, 4, self.lang.get("progress_adaptive"))
+            stage.manifest["kept"], stage.manifest["analyzed"] = adaptive_keep_indices(video_path, self.options["scene_threshold"])
+            stage.save()
+        kept = stage.manifest["kept"]; total = stage.manifest["analyzed"]
+        self.log(self.lang.get("log_adaptive_kept").format(kept=len(kept), total=total, dropped=total - len(kept)))
+        return kept
+
+    def open_stage(self, path, key):
+        """打开步骤目录；禁用缓存时总是清空重做"""
+        stage = StageDir(path, key if self.settings.get("stage_cache", True) else None)
+        self.used_stages.add(path)
+        self.track_stage(stage)
+        return stage
+
+    def reuse_stage(self, stage):
+        """步骤已按相同参数完成时记录日志并返回True"""
+        if not stage.complete: return False
+        metrics = getattr(self.worker_state, "metrics", None)
+        if metrics is not None: metrics.cached = True
+        self.log(self.lang.get("log_stage_cached").format(stage=os.path.basename(stage.path), count=stage.frame_count()))
+        return True
+
+    def resume_stage(self, stage):
+        """顺序输出的步骤从上次中断处继续，返回已完成的帧数"""
+        # 上次按段并行提取时输出的帧可能不连续，只能从头开始
+        if stage.done: stage.reset(); stage.save()
+        start = stage.resume_from()
+        if start: self.log(self.lang.get("log_stage_resume").format(stage=os.path.basename(stage.path), count=start))
+        return start
+
+    def pending_frames(self, stage, items):
+        """逐批处理的步骤中尚未完成的帧"""
+        pending = stage.pending(items)
+        if len(pending) < len(items): self.log(self.lang.get("log_stage_resume").format(stage=os.path.basename(stage.path), count=len(items) - len(pending)))
+        return pending
+
+    @contextmanager
+    def measure(self, video, stage_name):
+        """统计 with 块中执行的步骤，结束后加入本次运行的报告"""
+        metrics = StageMetrics(video, stage_name)
+        previous = getattr(self.worker_state, "metrics", None); self.worker_state.metrics = metrics
+        status = "error"
+        try:
+            yield metrics
+            complete = all(stage_dir.complete for stage_dir, _, _ in metrics.outputs.values())
+            if not complete: status = "stopped"
+            else: status = "cached" if metrics.cached else "done"
+        finally:
+            self.worker_state.metrics = previous
+            metrics.finish(status)
+            with self.metrics_lock: self.metrics.append(metrics)
+
+    def track_stage(self, stage):
+        metrics = getattr(self.worker_state, "metrics", None)
+        if metrics is not None: metrics.track(stage)
+
+    def add_tool_time(self, seconds):
+        """把等待外部工具的时间计入当前步骤"""
+        metrics = getattr(self.worker_state, "metrics", None)
+        if metrics is not None and seconds: metrics.tool_seconds += seconds
+
+    def run_tool(self, cmd):
+        """运行外部工具（ffmpeg等），出错时抛出异常，耗时计入当前步骤"""
+        started = time.perf_counter()
+        try:
+            subprocess.run(cmd, check=True, **get_subprocess_args())
+        finally:
+            self.add_tool_time(time.perf_counter() - started)
+
+    def with_rate(self, message, frames, started):
+        """开启实时速度显示时在进度信息后附加帧/秒"""
+        if not self.settings.get("show_fps", False): return message
+        elapsed = time.perf_counter() - started
+        if elapsed <= 0 or frames <= 0: return message
+        return message + self.lang.get("progress_fps").format(fps=frames / elapsed)
+
+    def write_run_report(self, started):
+        """把本次运行各步骤的统计写入输出目录下的 run_report_<时间>.json/.csv"""
+        if not self.settings.get("run_report", True) or not self.metrics: return
+        os.makedirs(self.output_root, exist_ok=True)
+        report_base = os.path.join(self.output_root, time.strftime("run_report_%Y%m%d_%H%M%S", time.localtime(started)))
+        summary = {"started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)), "wall_seconds": round(time.time() - started, 3),
+                   "interrupted": self.stop_requested.is_set(), "options": self.options,
+                   "settings": {key: self.settings.get(key) for key in ("streaming_mode", "pipeline_overlap", "ffmpeg_filtergraph", "parallel_videos", "parallel_ffmpeg", "segment_extraction",
+                                                                       "photoshop_batch_mode", "transparency_backend", "stage_cache", "eager_cleanup")}}
+        write_run_report(report_base, self.metrics, summary)
+        self.log(self.lang.get("log_run_report").format(path=report_base + ".json"))
+
+    def evict_stage_cache(self):
+        """步骤缓存超过设置的大小上限时按最近使用时间淘汰中间步骤"""
+        limit_mb = float(self.settings.get("stage_cache_limit_mb", "0") or 0)
+        if limit_mb <= 0 or not self.settings.get("stage_cache", True): return
+        removed, freed = evict_stage_cache(self.output_root, limit_mb * 1024 * 1024, self.used_stages)
+        if removed: self.log(self.lang.get("log_stage_evicted").format(count=removed, size=freed / (1024 * 1024), limit=limit_mb))
+
+    def estimate_disk_usage(self, video_data):
+        """估算处理一个视频写入的字节数，返回 (处理过程中的峰值, 完成后保留的字节数)"""
+        src_w, src_h, total = probe_video_info(video_data["path"])
+        frames = -(-total // self.options["frame_step"]) if self.options["do_reduce"] and self.options["decimation"] == "fixed" else total
+        w, h = (video_data["crop_w"], video_data["crop_h"]) if self.options["do_crop"] else (src_w, src_h)
+        target = (self.options["final_w"], self.options["final_h"])
+        do_photoshop = self.options["do_photoshop"]; do_resize = self.options["do_resize"]
+        # 按写入顺序排列的各步骤输出：(宽, 高, 编码方式)；帧存储只能由帧存储的下一步继续写入
+        outputs = []
+        def output(step, out_w, out_h, profile=None):
+            if profile is None: profile = self.stage_output(step, outputs[-1][2] if outputs else None)
+            outputs.append((out_w, out_h, profile))
+        if self.settings.get("ffmpeg_filtergraph", False) or self.settings.get("streaming_mode", False):
+            # 合并执行时只写出最终合并的一步
+            if do_resize and not do_photoshop: output("resize", *fit_size(w, h, *target), self.encode_profile(self.is_final_step("resize")))
+            else: output("crop", w, h, self.encode_profile(False))
+            do_resize = do_resize and do_photoshop
+        else:
+            output("reduce", src_w, src_h)
+            if self.options["do_crop"]: output("crop", w, h)
+        if do_photoshop: output("photoshop", w, h)
+        if do_resize: output("resize", *fit_size(w, h, *target))
+        if self.options.get("do_atlas", False): output("atlas", *outputs[-1][:2], self.encode_profile(True))
+        sizes = [frames * estimate_frame_bytes(*item) for item in outputs]
+        cleaned = self.settings.get("clean_temp_files", False) or self.settings.get("eager_cleanup", False)
+        kept = sizes[-1] if cleaned else sum(sizes)
+        # 逐帧释放时同时存在的只有相邻的两个步骤
+        if self.settings.get("eager_cleanup", False): return max([sizes[0]] + [a + b for a, b in zip(sizes, sizes[1:])]), kept
+        return sum(sizes), kept
+
+    def check_disk_space(self, video_queue):
+        """运行前检查输出目录所在磁盘的空间：不够同时处理 parallel_videos 个视频时减少并行数，一个视频也不够时报错
+
+        上次运行留下的步骤目录会被复用或替换，其占用的空间计为可用。最后一步已经完成的视频（中间步骤可能已被逐帧释放）
+        不需要空间，它的目录也会保留。
+        """
+        usages = []; reusable = 0
+        for video_data in video_queue:
+            plan = self.video_plan(video_data) if self.settings.get("stage_cache", True) else None
+            if plan is not None and self.furthest_complete(plan) == list(plan)[-1]:
+                usages.append((0, 0)); continue
+            usages.append(self.estimate_disk_usage(video_data))
+            for name in STAGE_DIRS:
+                stage_dir = os.path.join(self.output_root, video_data["out_folder"], name)
+                if os.path.isdir(stage_dir): reusable += dir_size(stage_dir)
+        available = free_disk_bytes(self.output_root) + reusable
+        to_mb = lambda value: value / (1024 * 1024)
+        needed = required_disk_bytes(usages, self.parallel_videos) * DISK_SPACE_MARGIN
+        self.log(self.lang.get("log_disk_estimate").format(needed=to_mb(needed), free=to_mb(available)))
+        if needed <= available: return
+        fitting = [n for n in range(1, self.parallel_videos) if required_disk_bytes(usages, n) * DISK_SPACE_MARGIN <= available]
+        if not fitting:
+            raise OSError(errno.ENOSPC, self.lang.get("msg_disk_space").format(needed=to_mb(required_disk_bytes(usages, 1) * DISK_SPACE_MARGIN), free=to_mb(available)), self.output_root)
+        self.log(self.lang.get("log_disk_throttle").format(parallel=fitting[-1], requested=self.parallel_videos))
+        self.parallel_videos = fitting[-1]
+
+    def release_input(self, input_dir):
+        """逐帧释放时，下一步开始读取前删除输入步骤的清单：它的帧会被边处理边删除，不能再作为缓存复用。
+        下一步完成后由它代替被释放的步骤：重新运行时从已完成的最靠后的步骤开始（见 furthest_complete）"""
+        if not self.settings.get("eager_cleanup", False) or not self.is_intermediate(input_dir): return
+        for name in (STAGE_MANIFEST, STAGE_JOURNAL):
+            if os.path.exists(os.path.join(input_dir, name)): os.remove(os.path.join(input_dir, name))
+
+    def free_frames(self, items):
+        """逐帧释放时删除下一步已处理完的一批输入帧；items 为帧文件路径或以输入帧路径开头的元组"""
+        for item in items:
+            path = item[0] if isinstance(item, tuple) else item
+            if os.path.exists(path): os.remove(path)
+
+    def free_input(self, input_dir):
+        """逐帧释放时删除已被下一步完整读取的中间步骤目录（包括帧存储）"""
+        if not self.settings.get("eager_cleanup", False) or not self.is_intermediate(input_dir): return
+        if os.path.isdir(input_dir):
+            shutil.rmtree(input_dir)
+            self.log(self.lang.get("log_freed_stage").format(stage=os.path.basename(input_dir)))
+
+    @staticmethod
+    def is_intermediate(path):
+        """path 是否为步骤目录（而不是视频文件本身）"""
+        return os.path.basename(os.path.normpath(path)) in STAGE_DIRS
+
+    def extract_to_store(self, stage, video_path, frame_step=1, keep=None):
+        """步骤1写入帧存储：通过rawvideo管道解码并逐帧追加，中断后从已写入的帧数继续。被停止时返回False"""
+        store = FrameStore.open(stage.path)
+        if store is None: store = FrameStore.create(stage.path, *probe_video_size(video_path))
+        elif store.count: self.log(self.lang.get("log_stage_resume").format(stage=os.path.basename(stage.path), count=store.count))
+        start = store.count
+        source = iter_video_frames(video_path, frame_step, start, keep, raw=True)
+        started = time.perf_counter()
+        try:
+            for buf in source:
+                if self.stop_requested.is_set(): return False
+                store.append(buf)
+                self.update_progress(1, 4, self.with_rate(self.lang.get("progress_store_detail").format(current=store.count), store.count - start, started))
+        finally:
+            source.close(); store.close()
+        return True
+
+    def run_store_batches(self, step, progress_key, stage, source, func, args, out_size, batch_size, profile, names=None, per_frame=None):
+        """对帧存储 source 中的帧分批执行 func（见 store_batch）。profile 为 FRAME_STORE_FILE 时写入 stage 目录中的帧存储，否则导出为图片"""
+        to_store = profile == FRAME_STORE_FILE
+        if to_store and FrameStore.open(stage.path) is None:
+            FrameStore.create(stage.path, *out_size, count=source.count, names=names or source.names)
+        pending = self.pending_frames(stage, list(range(source.count)))
+        batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        return self.run_frame_batches(step, progress_key, source.count, batches, store_batch, source.directory, stage.path, func, args,
+                                      None if to_store else profile, names, per_frame, stage=stage)
+
+    def get_frame_pool(self):
+        """run_queue 中处理帧的进程池，第一次需要时才创建：启动工作进程较慢，没有逐批步骤（或全部复用缓存）的运行不必等待。
+        不在 run_queue 中时返回None"""
+        if not self.frame_pool_enabled: return None
+        with self.frame_pool_lock:
+            if self.frame_pool is None: self.frame_pool = ProcessPoolExecutor()
+            return self.frame_pool
+
+    def run_frame_batches(self, step, progress_key, total, batches, func, *args, stage=None, free=False):
+        """把每批帧交给 func(batch, *args) 处理；有进程池时并行执行并汇总进度。被停止时返回False
+
+        total 包含之前已完成的帧；传入 stage 时每批完成后记录到该步骤的清单中，以便中断后继续。
+        free 为True时每批完成后删除该批的输入帧文件（逐帧释放）。
+        """
+        done_count = total - sum(len(batch) for batch in batches)
+        started = time.perf_counter(); started_count = done_count
+        frame_pool = self.get_frame_pool() if batches else None
+        if frame_pool is None:
+            for batch in batches:
+                if self.stop_requested.is_set(): return False
+                self.add_tool_time(func(batch, *args))
+                if stage is not None: stage.mark_done(batch)
+                if free: self.free_frames(batch)
+                done_count += len(batch)
+                self.update_progress(step, 4, self.with_rate(self.lang.get(progress_key).format(current=done_count, total=total), done_count - started_count, started))
+            return True
+        
+        futures = {frame_pool.submit(func, batch, *args): batch for batch in batches}
+        try:
+            for future in as_completed(futures):
+                self.add_tool_time(future.result())
+                if stage is not None: stage.mark_done(futures[future])
+                if free: self.free_frames(futures[future])
+                done_count += len(futures[future])
+                if self.stop_requested.is_set(): return False
+                self.update_progress(step, 4, self.with_rate(self.lang.get(progress_key).format(current=done_count, total=total), done_count - started_count, started))
+        finally:
+            # 停止或出错时取消尚未开始的批次
+            for future in futures: future.cancel()
+        return True
+
+    def run_transparency_stage(self, job):
+        """步骤3：按设置选择去背景的实现，完成返回True，被用户停止返回False"""
+        if self.superseded(job, "photoshop"): return True
+        backend = self.settings.get("transparency_backend", "photoshop")
+        if backend == "chroma_key": return self.run_chroma_key_stage(job)
+        if backend != "photoshop": raise ValueError(f"Unknown transparency backend: {backend}")
+        # Photoshop 同一时间只能运行一个批处理（共用 JSX 与进度文件），并行队列中按顺序排队
+        with self.photoshop_lock, self.measure(job["video_data"]["out_folder"], "photoshop"):
+            return self.run_photoshop_stage([job])
+
+    def run_chroma_key_stage(self, job):
+        """步骤3的NumPy实现：按颜色键控去背景，各批帧在进程池中并行处理"""
+        key_color = parse_color(self.settings.get("key_color", "#00ff00"))
+        threshold = float(self.settings.get("key_threshold", "60")); feather = float(self.settings.get("key_feather", "30"))
+        self.log(self.lang.get("log_step3_chroma").format(color=self.settings.get("key_color", "#00ff00")))
+        self.update_progress(3, 4, self.lang.get("progress_step3_chroma"))
+        with self.measure(job["video_data"]["out_folder"], "chroma_key"):
+            path, key, profile = job["plan"]["photoshop"]
+            stage = self.open_stage(path, key)
+            if not self.reuse_stage(stage):
+                # 输出文件名与Photoshop动作一致：前缀 + 补零的序号
+                prefix = job["video_data"]["prefix"]
+                self.release_input(job["current_path"])
+                source = FrameStore.open(job["current_path"])
+                if source is not None:
+                    if not self.run_store_batches(3, "progress_step3_chroma_detail", stage, source, chroma_key_pixels, (key_color, threshold, feather),
+                                                  (source.width, source.height), KEY_BATCH_SIZE, profile, prefix + "_{:04d}"): return False
+                else:
+                    # 按帧序号排序后重新编号，超过9999帧时顺序也与步骤1一致
+                    files = list_frames(job["current_path"])
+                    pairs = [(os.path.join(job["current_path"], f), os.path.join(stage.path, f"{prefix}_{i:04d}{ENCODE_PROFILES[profile]['ext']}")) for i, f in enumerate(files, 1)]
+                    pending = self.pending_frames(stage, pairs)
+                    batches = [pending[start:start + KEY_BATCH_SIZE] for start in range(0, len(pending), KEY_BATCH_SIZE)]
+                    if not self.run_frame_batches(3, "progress_step3_chroma_detail", len(pairs), batches, chroma_key_batch, key_color, threshold, feather, profile,
+                                                  stage=stage, free=self.settings.get("eager_cleanup", False)): return False
+                stage.finish()
+        self.free_input(job["current_path"])
+        job["current_path"] = stage.path; job["key"] = stage.key
+        return True
+
+    def transparency_key(self, parent_key, prefix, profile):
+        """步骤3的缓存键：包含去背景实现及其参数（Photoshop为JSX模板内容，其中包含动作名）"""
+        backend = self.settings.get("transparency_backend", "photoshop")
+        if backend == "chroma_key":
+            return stage_key(parent_key, backend, prefix, self.settings.get("key_color", "#00ff00"), self.settings.get("key_threshold", "60"), self.settings.get("key_feather", "30"), profile)
+        try:
+            with open(resource_path('run_action_template.jsx'), 'rb') as f: template_hash = hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            template_hash = None
+        return stage_key(parent_key, backend, prefix, template_hash, ENCODE_PROFILES[profile]["ps_compression"])
+
+    def run_photoshop_stage(self, jobs):
+        """步骤3：启动一次Photoshop处理 jobs 中所有视频的帧，完成返回True，被用户停止返回False"""
+        project_dir = get_executable_dir()
+        self.log(self.lang.get("log_step3_ps"))
+        self.update_progress(3, 4, self.lang.get("progress_step3"))
+        for job in jobs:
+            job["step3"] = self.open_stage(*job["plan"]["photoshop"][:2])
+            if self.reuse_stage(job["step3"]):
+                self.free_input(job["current_path"]); job["current_path"] = job["step3"].path; job["key"] = job["step3"].key
+        # Photoshop动作无法从中途继续，未完成的视频整体重做
+        jobs = [job for job in jobs if not job["step3"].complete]
+        if not jobs: return True
+        for job in jobs:
+            job["step3"].reset(); self.track_stage(job["step3"])
+        if len(jobs) > 1: self.log(self.lang.get("log_ps_batch").format(count=len(jobs)))
+        video_names = ", ".join(job["video_data"]["out_folder"] for job in jobs)
+        
+        jsx_template_path = resource_path('run_action_template.jsx'); jsx_run_path = os.path.join(project_dir, '_tmp_run_action.jsx')
+        progress_file = os.path.join(project_dir, PS_PROGRESS_FILE)
+        if os.path.exists(progress_file): os.remove(progress_file)
+        compression = ENCODE_PROFILES[self.encode_profile(self.is_final_step("photoshop"))]["ps_compression"]
+        self.create_jsx_for_run(jsx_template_path, jsx_run_path, [(job["current_path"], job["step3"].path, job["video_data"]["prefix"], compression) for job in jobs])
+        # 启动Photoshop时也隐藏窗口
+        ps_process = subprocess.Popen([self.settings['photoshop_exe'], jsx_run_path], **get_popen_args())
+        self.log(self.lang.get("log_step3_waiting"))
+        offset = 0; result = None; current_job = jobs[0]
+        ps_started = job_started = time.perf_counter()
+        try:
+            while result is None:
+                if self.stop_requested.is_set():
+                    self.log(self.lang.get("log_step3_stop"))
+                    ps_process.terminate()
+                    return False
+                exited = ps_process.poll() is not None
+                lines, offset = read_progress_lines(progress_file, offset)
+                for line in lines:
+                    parts = line.split()
+                    if parts[0] == "job" and len(parts) == 3:
+                        current_job = jobs[int(parts[1]) - 1]; job_started = time.perf_counter()
+                        if len(jobs) > 1: self.log(self.lang.get("log_ps_job").format(name=current_job["video_data"]["out_folder"], current=parts[1], total=parts[2]))
+                    elif parts[0] == "frame" and len(parts) == 3:
+                        message = self.with_rate(self.lang.get("progress_step3_detail").format(current=parts[1], total=parts[2]), int(parts[1]), job_started)
+                        self.update_progress(3, 4, message)
+                        if len(jobs) > 1: self.set_video_status(current_job["video_data"], message)
+                    elif parts[0] == "job_done" and len(parts) == 2:
+                        # 每个视频处理完成后立即切换到Photoshop输出目录
+                        finished = jobs[int(parts[1]) - 1]; finished["step3"].finish(); self.free_input(finished["current_path"])
+                        finished["current_path"] = finished["step3"].path; finished["key"] = finished["step3"].key
+                    elif parts[0] == "done" or parts[0].startswith("error"):
+                        result = line
+                if result is None:
+                    # 进程在汇报完成前就退出了
+                    if exited: raise RuntimeError(self.lang.get("msg_ps_terminated").format(video_name=video_names))
+                    time.sleep(PS_POLL_INTERVAL)
+        finally:
+            self.add_tool_time(time.perf_counter() - ps_started)
+        os.remove(progress_file)
+        if result != "done":
+            ps_process.terminate()
+            raise RuntimeError(self.lang.get("msg_ps_script_error").format(video_name=current_job["video_data"]["out_folder"], error=result.partition(":")[2].strip()))
+        self.log(self.lang.get("log_step3_done"))
+        ps_process.terminate(); ps_process.wait(timeout=5); self.log(self.lang.get("log_step3_closed"))
+        return True
+
+    def create_jsx_for_run(self, template_path, run_path, jobs):
+        """根据模板生成本次运行的JSX，jobs 为 (输入目录, 输出目录, 文件名前缀, PNG压缩级别) 列表"""
+        try:
+            with open(template_path, 'r', encoding='utf-8') as f: template_content = f.read()
+            # JSON 数组同时也是合法的 ExtendScript 数组字面量
+            manifest = [{"input": input_dir.replace(os.sep, "/"), "output": output_dir.replace(os.sep, "/"), "prefix": prefix, "compression": compression}
+                        for input_dir, output_dir, prefix, compression in jobs]
+            content = template_content.replace("PLACEHOLDER_JOBS", json.dumps(manifest))
+            with open(run_path, 'w', encoding='utf-8') as f: f.write(content)
+        except FileNotFoundError: raise FileNotFoundError(self.lang.get("msg_jsx_not_found"))
+
+# --- Command Line Entry Point ---
+# --verbose 时打印进度的最短间隔（秒）
+PROGRESS_PRINT_INTERVAL = 0.5
+
+def load_manifest(path):
+    """读取JSON（或安装了PyYAML时的YAML）任务清单
+
+    清单可以是 video_data 字典的列表，也可以是 {"videos": [...], "options": {...}, "settings": {...}}。
+    video_data 的字段与界面队列相同，只有 path 是必填的。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            import yaml
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if isinstance(manifest, list): manifest = {"videos": manifest}
+    return manifest
+
+def parse_size(value):
+    """命令行 --size 的值（如 128x128）解析为 (宽, 高)"""
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, e.g. 128x128, got {value!r}")
+    if width <= 0 or height <= 0: raise argparse.ArgumentTypeError(f"size must be positive, got {value!r}")
+    return width, height
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pipeline", description="Process a manifest of videos without the GUI.")
+    parser.add_argument("manifest", help="JSON/YAML manifest: a list of video entries or {\"videos\": [...], \"options\": {...}, \"settings\": {...}}")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="settings file to read defaults from (default: %(default)s)")
+    parser.add_argument("--steps", help="comma separated steps to run: " + ",".join(PIPELINE_STEPS))
+    parser.add_argument("--frame-step", type=int, help="keep 1 of every N frames")
+    parser.add_argument("--decimation", choices=DECIMATION_MODES, help="fixed: keep 1 of every N frames; adaptive: keep frames that differ from the last kept one")
+    parser.add_argument("--scene-threshold", type=float, help="adaptive decimation threshold (mean absolute luma difference, 0-255)")
+    parser.add_argument("--size", type=parse_size, help="final output size, e.g. 128x128")
+    parser.add_argument("--resize-engine", choices=RESIZE_ENGINES)
+    parser.add_argument("--atlas-layout", choices=ATLAS_LAYOUTS, help="layout of the sprite atlas written by the atlas step")
+    parser.add_argument("--atlas-trim", action="store_true", help="trim transparent borders before packing the atlas")
+    parser.add_argument("--intermediate-profile", choices=list(ENCODE_PROFILES), help="encoding of frames that only feed the next step")
+    parser.add_argument("--final-profile", choices=list(ENCODE_PROFILES), help="encoding of the final output frames")
+    parser.add_argument("--auto-crop", action="store_true", help="detect the moving subject and set each video's crop box before processing")
+    parser.add_argument("--crop-tracking", action="store_true", help="move the crop box with the subject on every frame")
+    parser.add_argument("--mask", help="PNG whose alpha is applied to every cropped frame (stretched to the crop size)")
+    parser.add_argument("--frame-store", action="store_true", help="keep intermediate frames in a memory-mapped frames.store instead of image files")
+    parser.add_argument("--segment-extraction", action="store_true", help="extract long videos in keyframe-aligned segments, one ffmpeg process per parallel ffmpeg slot")
+    parser.add_argument("--eager-cleanup", action="store_true", help="delete each intermediate step's frames as soon as the next step has used them")
+    parser.add_argument("--disk-check", action="store_true", help="estimate the disk space needed before processing; run fewer videos at once or refuse if it does not fit")
+    parser.add_argument("--output-dir", help="root output directory (default: output/ next to the program)")
+    parser.add_argument("--verbose", action="store_true", help="print per-step progress messages")
+    parser.add_argument("--no-report", action="store_true", help="do not write run_report_*.json/.csv to the output directory")
+    args = parser.parse_args(argv)
+
+    settings = dict(DEFAULT_SETTINGS)
+    if os.path.exists(args.settings):
+        with open(args.settings, 'r', encoding='utf-8') as f: settings.update(json.load(f))
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"cannot read manifest {args.manifest}: {e}")
+    settings.update(manifest.get("settings", {}))
+    options = default_options(settings)
+    options.update(manifest.get("options", {}))
+    if args.steps is not None:
+        steps = [step.strip() for step in args.steps.split(",") if step.strip()]
+        unknown = set(steps) - set(PIPELINE_STEPS)
+        if unknown: parser.error(f"unknown steps: {', '.join(sorted(unknown))}")
+        for step in PIPELINE_STEPS: options[f"do_{step}"] = step in steps
+    if args.frame_step is not None: options["frame_step"] = args.frame_step
+    if args.decimation: options["decimation"] = args.decimation
+    if args.scene_threshold is not None: options["scene_threshold"] = args.scene_threshold
+    if args.size: options["final_w"], options["final_h"] = args.size
+    if args.resize_engine: options["resize_engine"] = args.resize_engine
+    if args.atlas_layout: settings["atlas_layout"] = args.atlas_layout
+    if args.atlas_trim: settings["atlas_trim"] = True
+    if args.intermediate_profile: settings["intermediate_profile"] = args.intermediate_profile
+    if args.final_profile: settings["final_profile"] = args.final_profile
+    if args.crop_tracking: settings["crop_tracking"] = True
+    if args.mask: options["mask_path"] = args.mask
+    if args.frame_store: settings["frame_store"] = True
+    if args.segment_extraction: settings["segment_extraction"] = True
+    if args.eager_cleanup: settings["eager_cleanup"] = True
+    if args.disk_check: settings["disk_space_check"] = True
+    if args.no_report: settings["run_report"] = False
+
+    entries = manifest.get("videos", [])
+    if not entries: parser.error("manifest contains no videos")
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("path"): parser.error(f"manifest entry without a path: {entry!r}")
+        if not os.path.isfile(entry["path"]): parser.error(f"video not found: {entry['path']}")
+    videos = [make_video_data(entry["path"], settings, entry) for entry in entries]
+
+    # 进度按帧汇报，终端中每个视频最多每 PROGRESS_PRINT_INTERVAL 秒打印一次
+    last_printed = {}
+    def throttled(key):
+        now = time.perf_counter()
+        if now - last_printed.get(key, -PROGRESS_PRINT_INTERVAL) < PROGRESS_PRINT_INTERVAL: return True
+        last_printed[key] = now
+        return False
+    def print_progress(current, total, message=""):
+        if args.verbose and message and not throttled(None): print(message, file=sys.stderr)
+    def print_status(video_data, message):
+        if args.verbose and message and not throttled(id(video_data)): print(f"[{video_data['out_folder']}] {message}", file=sys.stderr)
+    pipeline = Pipeline(settings, options, load_language(settings.get("language", "zh")), log=print,
+                        progress=print_progress, status=print_status, output_root=args.output_dir)
+    try:
+        if args.auto_crop:
+            for video_data in videos:
+                frames = decimated_frames(video_data["path"], options["do_reduce"], options["frame_step"], options.get("decimation", "fixed"), options["scene_threshold"])
+                proposal = propose_crop(video_data["path"], *frames, float(settings.get("auto_crop_threshold", "25")), float(settings.get("auto_crop_margin", "10")) / 100)
+                if proposal is None: print(f"{video_data['path']}: no moving subject found, keeping the crop box", file=sys.stderr); continue
+                video_data.update(proposal)
+                print(f"{video_data['path']}: auto crop {proposal['crop_w']}x{proposal['crop_h']} offset ({proposal['offset_x']}, {proposal['offset_y']})", file=sys.stderr)
+        return 0 if pipeline.run_queue(videos) else 1
+    except KeyboardInterrupt:
+        pipeline.stop_requested.set()
+        return 130
+    except Exception as e:
+        # 任务调度器根据退出码判断失败，只打印一行错误；--verbose 时附带调用栈
+        if args.verbose: traceback.print_exc()
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    # 打包后的exe使用进程池时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,17 +1,34 @@
 // =================================================================
-// 最终版 JSX 模板 v2 (支持自定义文件名前缀)
+// 最终版 JSX 模板 v5 (支持自定义文件名前缀，逐帧汇报进度，一次会话处理多个任务，可设置PNG压缩级别)
 // =================================================================
+//
+// 进度协议：脚本在自身所在目录的 photoshop_progress.tmp 中逐行追加
+//   job <任务序号> <任务总数>
+//   start <总帧数>
+//   frame <已完成帧数> <总帧数>
+//   job_done <任务序号>
+//   done | error: <错误信息>
+// Python 端监视该文件，读到 done/error 行即认为任务结束。
 
-try {
-    $.sleep(3000); 
+var scriptFile = new File($.fileName);
+var projectFolder = scriptFile.parent;
+var progressFile = new File(projectFolder + "/photoshop_progress.tmp");
+
+// --- 辅助函数：向进度文件追加一行 ---
+function report(line) {
+    progressFile.encoding = "UTF-8";
+    progressFile.open("a");
+    progressFile.write(line + "\n");
+    progressFile.close();
+}
 
+try {
     // --- 配置区 ---
     var ACTION_SET_NAME = "默认动作";
     var ACTION_NAME = "移除背景";
     // --- 占位符 (由Python填充) ---
-    var FILENAME_PREFIX = "PLACEHOLDER_PREFIX";
-    var inputFolder = new Folder("PLACEHOLDER_INPUT");
-    var outputFolder = new Folder("PLACEHOLDER_OUTPUT");
+    // 任务清单：[{"input": 输入目录, "output": 输出目录, "prefix": 文件名前缀, "compression": PNG压缩级别 0-9}, ...]
+    var JOBS = PLACEHOLDER_JOBS;
 
     // --- 辅助函数：数字补零 ---
     function pad(num, size) {
@@ -20,44 +37,55 @@ try {
         return s;
     }
 
-    // --- 核心处理逻辑 ---
-    if (!outputFolder.exists) {
-        outputFolder.create();
+    // --- 辅助函数：中间帧可能是 PNG、TIFF 或 WebP ---
+    function isFrame(f) {
+        return f instanceof File && /\.(png|tif|tiff|webp)$/i.test(f.name);
+    }
+
+    // --- 辅助函数：文件名中的帧序号（超过9999帧时 frame_10000 应排在 frame_9999 之后） ---
+    function frameNumber(f) {
+        var m = f.name.match(/(\d+)\.[^.]+$/);
+        return m ? parseInt(m[1], 10) : 0;
     }
-    var fileList = inputFolder.getFiles("*.png");
-    if (fileList.length > 0) {
-        // 对文件列表进行排序，确保处理顺序正确
-        fileList.sort();
-        for (var i = 0; i < fileList.length; i++) {
-            var doc = open(fileList[i]);
-            app.doAction(ACTION_NAME, ACTION_SET_NAME);
-            
-            var pngOptions = new PNGSaveOptions();
-            pngOptions.compression = 9;
-            pngOptions.interlaced = false;
-
-            // 使用新的命名规则：前缀 + 补零的序号
-            var newName = FILENAME_PREFIX + "_" + pad(i + 1, 4) + ".png";
-            var outputFile = new File(outputFolder + "/" + newName);
-            
-            doc.saveAs(outputFile, pngOptions, true, Extension.LOWERCASE);
-            doc.close(SaveOptions.DONOTSAVECHANGES);
+
+    // --- 核心处理逻辑 ---
+    function processFolder(inputFolder, outputFolder, FILENAME_PREFIX, COMPRESSION) {
+        if (!outputFolder.exists) {
+            outputFolder.create();
+        }
+        var fileList = inputFolder.getFiles(isFrame);
+        report("start " + fileList.length);
+        if (fileList.length > 0) {
+            // 按帧序号排序，确保处理顺序正确
+            fileList.sort(function (a, b) { return frameNumber(a) - frameNumber(b); });
+            for (var i = 0; i < fileList.length; i++) {
+                var doc = open(fileList[i]);
+                app.doAction(ACTION_NAME, ACTION_SET_NAME);
+                
+                var pngOptions = new PNGSaveOptions();
+                pngOptions.compression = COMPRESSION;
+                pngOptions.interlaced = false;
+
+                // 使用新的命名规则：前缀 + 补零的序号
+                var newName = FILENAME_PREFIX + "_" + pad(i + 1, 4) + ".png";
+                var outputFile = new File(outputFolder + "/" + newName);
+                
+                doc.saveAs(outputFile, pngOptions, true, Extension.LOWERCASE);
+                doc.close(SaveOptions.DONOTSAVECHANGES);
+                report("frame " + (i + 1) + " " + fileList.length);
+            }
         }
     }
 
-    // --- 创建信号文件 ---
-    var scriptFile = new File($.fileName);
-    var projectFolder = scriptFile.parent;
-    var signalFile = new File(projectFolder + "/photoshop_done.tmp");
-    signalFile.open("w");
-    signalFile.write("done");
-    signalFile.close();
+    for (var j = 0; j < JOBS.length; j++) {
+        report("job " + (j + 1) + " " + JOBS.length);
+        processFolder(new Folder(JOBS[j].input), new Folder(JOBS[j].output), JOBS[j].prefix, JOBS[j].compression);
+        report("job_done " + (j + 1));
+    }
+
+    // --- 任务完成 ---
+    report("done");
 
 } catch(e) {
-    var scriptFile = new File($.fileName);
-    var projectFolder = scriptFile.parent;
-    var signalFile = new File(projectFolder + "/photoshop_done.tmp");
-    signalFile.open("w");
-    signalFile.write("error: " + e.message);
-    signalFile.close();
+    report("error: " + e.message);
 }
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""pipeline.py 中不依赖界面的辅助函数的测试 / Tests for the Tk-free helpers in pipeline.py
+
+运行 / Run:  python -m pytest -q
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline
+from pipeline import (StageDir, STAGE_JOURNAL, STAGE_MANIFEST, frame_number, frame_sort_key, list_frames, plan_segments,
+                      read_stage_manifest, segment_frames, select_filter, stage_key)
+
+
+def touch(directory, *names):
+    for name in names:
+        with open(os.path.join(directory, name), 'wb'): pass
+
+
+# --- 帧排序 / Frame ordering ---
+def test_frame_sort_key_orders_past_9999():
+    names = ["frame_10000.png", "frame_9999.png", "frame_0002.png", "frame_0010.png"]
+    assert sorted(names, key=frame_sort_key) == ["frame_0002.png", "frame_0010.png", "frame_9999.png", "frame_10000.png"]
+
+
+def test_frame_number_uses_last_digit_group():
+    assert frame_number("frame_0012.png") == 12
+    assert frame_number("clip2_10001.webp") == 10001
+
+
+def test_list_frames_skips_manifest_and_journal(tmp_path):
+    touch(tmp_path, "frame_10000.png", "frame_9999.png", STAGE_MANIFEST, STAGE_JOURNAL, "notes.txt")
+    assert list_frames(tmp_path) == ["frame_9999.png", "frame_10000.png"]
+
+
+# --- 缓存键 / Stage keys ---
+def test_stage_key_is_stable_and_chained():
+    key = stage_key("source", "crop", 256, 256, 0, 0, "png_fast")
+    assert key == stage_key("source", "crop", 256, 256, 0, 0, "png_fast")
+    assert key != stage_key("other", "crop", 256, 256, 0, 0, "png_fast")
+    assert key != stage_key("source", "crop", 256, 128, 0, 0, "png_fast")
+    assert key != stage_key("source", "resize", 256, 256, 0, 0, "png_fast")
+
+
+# --- 步骤目录 / StageDir ---
+def test_stage_dir_keeps_matching_key_and_resets_on_change(tmp_path):
+    path = str(tmp_path / "stage")
+    stage = StageDir(path, "a"); touch(path, "frame_0001.png"); stage.finish()
+    assert StageDir(path, "a").complete and os.path.exists(os.path.join(path, "frame_0001.png"))
+    changed = StageDir(path, "b")
+    assert not changed.complete and list_frames(path) == []
+
+
+def test_stage_dir_without_key_always_resets(tmp_path):
+    path = str(tmp_path / "stage")
+    StageDir(path, None).finish(); touch(path, "frame_0001.png")
+    assert not StageDir(path, None).complete and list_frames(path) == []
+
+
+def test_mark_done_appends_to_journal_and_merges_on_open(tmp_path):
+    path = str(tmp_path / "stage")
+    stage = StageDir(path, "k")
+    stage.mark_done(["/in/frame_0001.png", "/in/frame_0002.png"])
+    stage.mark_done([("/in/frame_0003.png", "/out/frame_0003.png"), 7])
+    # 每批只追加日志，清单中的列表在重新打开或完成时才更新
+    assert read_stage_manifest(path)["done"] == []
+    with open(os.path.join(path, STAGE_JOURNAL), 'a', encoding='utf-8') as f: f.write("frame_00")  # 中断时没有写完的一行
+
+    reopened = StageDir(path, "k")
+    assert reopened.done == {"frame_0001.png", "frame_0002.png", "frame_0003.png", "7"}
+    assert sorted(read_stage_manifest(path)["done"]) == sorted(reopened.done)
+    assert not os.path.exists(os.path.join(path, STAGE_JOURNAL))
+    assert reopened.pending(["/in/frame_0001.png", "/in/frame_0004.png", 7, 8]) == ["/in/frame_0004.png", 8]
+
+
+def test_finish_compacts_journal(tmp_path):
+    path = str(tmp_path / "stage")
+    stage = StageDir(path, "k"); stage.mark_done([1, 2]); stage.finish()
+    manifest = read_stage_manifest(path)
+    assert manifest["complete"] and manifest["done"] == []
+    assert not os.path.exists(os.path.join(path, STAGE_JOURNAL))
+
+
+def test_resume_from_drops_the_highest_numbered_frame(tmp_path):
+    path = str(tmp_path / "stage")
+    stage = StageDir(path, "k")
+    touch(path, "frame_9998.png", "frame_9999.png", "frame_10000.png", "frame_10001.png")
+    assert stage.resume_from() == 10000
+    assert list_frames(path) == ["frame_9998.png", "frame_9999.png", "frame_10000.png"]
+
+
+# --- 抽帧滤镜 / Select filters ---
+def test_select_filter_fixed_step():
+    assert select_filter(1, 0) is None
+    assert select_filter(3, 0) == "select='not(mod(n,3))',setpts=N/FRAME_RATE/TB"
+    assert select_filter(3, 2) == "select='not(mod(n,3))*gte(n,6)',setpts=N/FRAME_RATE/TB"
+    assert select_filter(1, 5) == "select='gte(n,5)',setpts=N/FRAME_RATE/TB"
+
+
+def test_select_filter_merges_keep_ranges():
+    keep = [0, 1, 2, 5, 7, 8]
+    assert select_filter(3, 0, keep) == "select='between(n,0,2)+eq(n,5)+between(n,7,8)',setpts=N/FRAME_RATE/TB"
+    # 续传时跳过已输出的帧，frame_step 被忽略
+    assert select_filter(3, 4, keep) == "select='between(n,7,8)',setpts=N/FRAME_RATE/TB"
+    assert select_filter(1, 6, keep) == "select='0',setpts=N/FRAME_RATE/TB"
+
+
+# --- 分段提取 / Segment planning ---
+def test_plan_segments_cuts_at_nearest_keyframes():
+    assert plan_segments([0, 50, 100, 150], 200, 4) == [(0, 50), (50, 100), (100, 150), (150, 200)]
+    assert plan_segments([0, 90, 120], 200, 2) == [(0, 90), (90, 200)]
+    assert plan_segments([0], 200, 4) == [(0, 200)]
+
+
+@pytest.mark.parametrize("frame_step, keep", [(1, None), (3, None), (7, None), (1, [0, 3, 4, 50, 51, 99, 120, 199])])
+def test_segments_reassemble_the_single_process_output(frame_step, keep):
+    segments = plan_segments([0, 37, 80, 121, 160], 200, 4)
+    frames = []
+    for start, end in segments:
+        first, kept = segment_frames(start, end, frame_step, keep)
+        # 每段的起始编号等于之前各段已输出的帧数
+        assert first == len(frames)
+        frames += kept
+    assert frames == (keep if keep is not None else list(range(0, 200, frame_step)))
+
+
+# --- 自适应抽帧 / Adaptive decimation ---
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="needs ffmpeg and ffprobe")
+def test_adaptive_keep_indices_keeps_scene_changes(tmp_path):
+    video = str(tmp_path / "scenes.mkv")
+    # 5帧黑色、5帧白色、5帧黑色（无损编码，帧内容不变）
+    sources = [f"color=c={color}:s=64x48:r=10:d=0.5" for color in ("black", "white", "black")]
+    cmd = ['ffmpeg', '-v', 'error', '-y']
+    for source in sources: cmd += ['-f', 'lavfi', '-i', source]
+    cmd += ['-filter_complex', '[0:v][1:v][2:v]concat=n=3:v=1', '-c:v', 'ffv1', video]
+    subprocess.run(cmd, check=True)
+    kept, total = pipeline.adaptive_keep_indices(video, 10)
+    assert (kept, total) == ([0, 5, 10], 15)
+    assert pipeline.adaptive_keep_indices(video, 300)[0] == [0]
+
+
+# --- 步骤计划 / Stage plan ---
+def make_pipeline(tmp_path, **settings):
+    settings = dict(pipeline.DEFAULT_SETTINGS, transparency_backend="chroma_key", **settings)
+    options = dict(pipeline.default_options(settings), resize_engine="pillow")
+    return pipeline.Pipeline(settings, options, pipeline.load_language("en"), output_root=str(tmp_path))
+
+
+def test_plan_starts_from_the_furthest_complete_stage(tmp_path):
+    engine = make_pipeline(tmp_path)
+    video_data = pipeline.make_video_data(str(tmp_path / "clip.mp4"), engine.settings)
+    plan, resized_in_stream = engine.plan_stages(video_data, str(tmp_path / "clip"), "source")
+    assert list(plan) == ["reduce", "crop", "photoshop", "resize"] and not resized_in_stream
+    assert engine.furthest_complete(plan) is None
+
+    # 上游步骤已被逐帧释放（目录不存在），最终步骤完整
+    path, key, _ = plan["resize"]
+    StageDir(path, key).finish()
+    assert engine.furthest_complete(plan) == "resize"
+    job = {"plan": plan, "start": "resize", "current_path": None, "key": None}
+    assert engine.superseded(job, "crop") and job["current_path"] == plan["crop"][0]
+    assert not engine.superseded(job, "resize")
+
+    # 参数不同的步骤不算完成
+    StageDir(path, "other").finish()
+    assert engine.furthest_complete(plan) is None
+
+
+def test_plan_keys_change_with_upstream_options(tmp_path):
+    engine = make_pipeline(tmp_path)
+    video_data = pipeline.make_video_data(str(tmp_path / "clip.mp4"), engine.settings)
+    plan, _ = engine.plan_stages(video_data, str(tmp_path / "clip"), "source")
+    engine.options["frame_step"] = 5
+    changed, _ = engine.plan_stages(video_data, str(tmp_path / "clip"), "source")
+    assert all(plan[step][1] != changed[step][1] for step in plan)
+    engine.options["final_w"] = 64
+    resized, _ = engine.plan_stages(video_data, str(tmp_path / "clip"), "source")
+    assert [resized[step][1] == changed[step][1] for step in plan] == [True, True, True, False]
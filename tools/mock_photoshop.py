@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Photoshop 替身脚本 / Stand-in for Photoshop
+
+模拟 run_action_template.jsx 的行为，用于在没有 Photoshop 的机器上测试第3步：
+读取生成的 JSX 中的任务清单，把每个任务的输入帧按 前缀_0001.png 的规则复制（非PNG时转换）到输出目录，
+并按 JSX 的进度协议向脚本所在目录的 photoshop_progress.tmp 追加 job/start/frame/job_done/done 行。
+
+Emulates run_action_template.jsx so step 3 can be tested without Photoshop. Point the
+"Photoshop path" setting at this file (it must be executable, e.g. `chmod +x`).
+
+环境变量 / Environment variables:
+    MOCK_PS_DELAY   每帧耗时（秒）/ seconds spent per frame (default 0)
+    MOCK_PS_FAIL    设为非空时在第一帧后报告错误 / report an error after the first frame
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+from PIL import Image
+
+PROGRESS_FILE = "photoshop_progress.tmp"
+FRAME_EXTENSIONS = (".png", ".tif", ".tiff", ".webp")
+
+
+def parse_jsx(jsx_text):
+    """返回生成的 JSX 中的任务清单 / Return the job manifest embedded in the generated JSX"""
+    return json.loads(re.search(r'var JOBS = (.*);', jsx_text).group(1))
+
+
+def frame_number(filename):
+    """文件名中的帧序号，与 JSX 的排序一致 / Frame number in the file name, sorted like the JSX does"""
+    match = re.search(r'(\d+)\.[^.]+$', filename)
+    return int(match.group(1)) if match else 0
+
+
+def report(progress_file, line):
+    with open(progress_file, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def run_job(progress_file, prefix, input_dir, output_dir, delay=0.0, fail=False, compression=9):
+    os.makedirs(output_dir, exist_ok=True)
+    files = sorted((f for f in os.listdir(input_dir) if f.lower().endswith(FRAME_EXTENSIONS)), key=frame_number)
+    report(progress_file, f"start {len(files)}")
+    for i, filename in enumerate(files, 1):
+        if fail:
+            report(progress_file, "error: mock failure requested by MOCK_PS_FAIL")
+            return False
+        time.sleep(delay)
+        source = os.path.join(input_dir, filename); target = os.path.join(output_dir, f"{prefix}_{i:04d}.png")
+        if filename.lower().endswith(".png"):
+            shutil.copyfile(source, target)
+        else:
+            with Image.open(source) as img: img.save(target, "PNG", compress_level=compression)
+        report(progress_file, f"frame {i} {len(files)}")
+    return True
+
+
+def main():
+    jsx_path = sys.argv[1]
+    with open(jsx_path, "r", encoding="utf-8") as f:
+        jobs = parse_jsx(f.read())
+    progress_file = os.path.join(os.path.dirname(os.path.abspath(jsx_path)), PROGRESS_FILE)
+    delay = float(os.environ.get("MOCK_PS_DELAY", "0")); fail = bool(os.environ.get("MOCK_PS_FAIL"))
+    for index, job in enumerate(jobs, 1):
+        report(progress_file, f"job {index} {len(jobs)}")
+        if not run_job(progress_file, job["prefix"], job["input"], job["output"], delay, fail, job.get("compression", 9)): break
+        report(progress_file, f"job_done {index}")
+    else:
+        report(progress_file, "done")
+    # 与真正的 Photoshop 一样，完成后保持运行，直到被调用方结束
+    while True:
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()